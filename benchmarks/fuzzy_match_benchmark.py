@@ -0,0 +1,76 @@
+"""
+Benchmark for the fuzzy text_match strategy.
+Builds synthetic 500-element frames with OCR-style noise and compares the
+trigram-pruned FuzzyIndex against comparing every element by edit distance.
+
+Usage:
+    python benchmarks/fuzzy_match_benchmark.py [--elements 500] [--frames 50] [--queries 10]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.gemma_client import BoundingBox
+from modules.fuzzy_matcher import FuzzyIndex, similarity
+
+WORDS = ["play", "workshop", "maps", "settings", "video", "advanced", "benchmark", "quit", "options",
+         "graphics", "quality", "resolution", "apply", "cancel", "back", "start", "continue", "audio",
+         "display", "texture", "shadow", "detail", "high", "low", "medium", "ultra", "fps", "results"]
+OCR_NOISE = {"o": "0", "l": "1", "s": "5", "i": "l"}
+
+def make_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).upper()
+
+def add_noise(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    position = rng.randrange(len(chars))
+    lower = chars[position].lower()
+    chars[position] = OCR_NOISE.get(lower, rng.choice("abcdefghijklmnopqrstuvwxyz")).upper()
+    return "".join(chars)
+
+def make_frame(rng: random.Random, count: int):
+    return [BoundingBox(x=rng.randint(0, 1900), y=rng.randint(0, 1060), width=80, height=24,
+                        confidence=0.9, element_type="text", element_text=add_noise(rng, make_text(rng)))
+            for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy element matching")
+    parser.add_argument("--elements", type=int, default=500, help="Elements per frame")
+    parser.add_argument("--frames", type=int, default=50, help="Number of frames")
+    parser.add_argument("--queries", type=int, default=10, help="Fuzzy rules evaluated per frame")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Similarity threshold")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    frames = [make_frame(rng, args.elements) for _ in range(args.frames)]
+    queries = [[make_text(rng) for _ in range(args.queries)] for _ in frames]
+
+    start = time.perf_counter()
+    brute_hits = 0
+    for frame, frame_queries in zip(frames, queries):
+        for query in frame_queries:
+            brute_hits += sum(1 for bbox in frame if similarity(bbox.element_text, query) >= args.threshold)
+    brute_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_hits = 0
+    for frame, frame_queries in zip(frames, queries):
+        index = FuzzyIndex([bbox.element_text for bbox in frame])
+        for query in frame_queries:
+            index_hits += len(index.find(query, args.threshold))
+    index_seconds = time.perf_counter() - start
+
+    print(f"{args.frames} frames x {args.elements} elements, {args.queries} fuzzy rules per frame")
+    print(f"  brute force : {brute_seconds / args.frames * 1000:8.2f} ms/frame ({brute_hits} matches)")
+    print(f"  fuzzy index : {index_seconds / args.frames * 1000:8.2f} ms/frame ({index_hits} matches, index build included)")
+    print(f"  speedup     : {brute_seconds / index_seconds:8.1f}x")
+    if brute_hits != index_hits:
+        print("  WARNING: match counts differ")
+
+if __name__ == "__main__":
+    main()
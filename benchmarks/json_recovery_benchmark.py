@@ -0,0 +1,189 @@
+"""
+Benchmark for recovering UI elements from malformed LLM responses.
+Compares the single-pass scanner in modules/json_stream.py against the regex
+recovery the Gemma/Qwen clients used before, on synthetic responses (valid,
+fenced, chatty, trailing commas, braces in text, truncated at max_tokens) and
+optionally on raw responses saved from real runs. Real responses that decode
+as JSON are the ground truth for copies of them cut at random points; the
+scanner never grades itself.
+
+Usage:
+    python benchmarks/json_recovery_benchmark.py [--responses 300] [--elements 15] [--corpus DIR]
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.json_stream import extract_elements
+
+TEXTS = ["PLAY", "Settings", "Quit", "Workshop Maps", "Video {Advanced}", "Resolution: 1920x1080",
+         "Apply", "Back", "CS2 FPS Bench", "Texture \"Ultra\"", "[Esc] Cancel", "Start Benchmark"]
+TYPES = ["button", "label", "slider", "checkbox", "icon", "text"]
+
+def legacy_extract(text: str):
+    """Regex recovery as previously done by GemmaClient/QwenClient._extract_json_from_text."""
+    json_pattern = r'\{(?:[^{}]|(?:\{(?:[^{}]|(?:\{[^{}]*\}))*\}))*\}'
+    match = re.search(json_pattern, text)
+    if match:
+        try:
+            return json.loads(match.group(0)).get("elements", [])
+        except (json.JSONDecodeError, AttributeError):
+            pass
+
+    elements_match = re.search(r'"elements"\s*:\s*\[(.*?)\]', text, re.DOTALL)
+    if elements_match:
+        elements_items = []
+        for element_match in re.finditer(r'\{(.*?)\}', elements_match.group(1), re.DOTALL):
+            try:
+                elements_items.append(json.loads('{' + element_match.group(1) + '}'))
+            except json.JSONDecodeError:
+                continue
+        if elements_items:
+            return elements_items
+
+    box_pattern = r'"box"\s*:\s*\{\s*"x"\s*:\s*(\d+)\s*,\s*"y"\s*:\s*(\d+)\s*,\s*"width"\s*:\s*(\d+)\s*,\s*"height"\s*:\s*(\d+)\s*\}'
+    return [{"box": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)}}
+            for x, y, w, h in re.findall(box_pattern, text)]
+
+def make_response(rng: random.Random, count: int):
+    """Build one response and the boxes of the elements that are complete in it."""
+    elements = []
+    for _ in range(count):
+        element = {"box": {"x": rng.randint(0, 1900), "y": rng.randint(0, 1060),
+                           "width": rng.randint(20, 300), "height": rng.randint(12, 80)},
+                   "type": rng.choice(TYPES), "text": rng.choice(TEXTS),
+                   "confidence": round(rng.uniform(0.5, 1.0), 2)}
+        if rng.random() < 0.2:
+            element["attributes"] = {"state": rng.choice(["enabled", "disabled"]), "style": {"color": "white"}}
+        elements.append(element)
+
+    items = [json.dumps(element) for element in elements]
+    if rng.random() < 0.2:
+        items[-1] += ","  # Trailing comma
+    body = '{"elements": [' + ", ".join(items) + "]}"
+    variant = rng.choice(["valid", "fenced", "chatty", "truncated", "truncated"])
+    if variant == "fenced":
+        body = "```json\n" + body + "\n```"
+    elif variant == "chatty":
+        body = "Here are the UI elements I found {as requested}:\n" + body + "\nLet me know if you need more."
+
+    if variant == "truncated":
+        # max_tokens hit somewhere after the first element started
+        cut = rng.randint(len('{"elements": ['), len(body) - 1)
+        body = body[:cut]
+
+    complete = []
+    for element, item in zip(elements, items):
+        end = body.find(item.rstrip(","))
+        if end >= 0 and end + len(item.rstrip(",")) <= len(body):
+            complete.append(element)
+    return body, complete
+
+def load_real_response(text: str):
+    """
+    Decode a saved response with the json module alone.
+
+    Returns:
+        (body, [(element, end offset in body), ...]), or None if the response
+        is not a complete {"elements": [...]} document (optionally fenced)
+    """
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.split("\n", 1)[1] if "\n" in body else ""
+        body = body.rstrip().rstrip("`").rstrip()
+    try:
+        document = json.loads(body)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(document, dict) or not isinstance(document.get("elements"), list):
+        return None
+
+    # Walk the array with raw_decode to learn where each element ends
+    decoder = json.JSONDecoder()
+    index = body.index("[", body.index('"elements"')) + 1
+    elements = []
+    for _ in document["elements"]:
+        while body[index] in " \t\r\n,":
+            index += 1
+        element, index = decoder.raw_decode(body, index)
+        if isinstance(element, dict) and "box" in element:
+            elements.append((element, index))
+    return body, elements
+
+def truncated_copies(rng: random.Random, body: str, elements, count: int = 5):
+    """Cut a decoded response at random points; the reference is every element that ends before the cut."""
+    copies = []
+    for _ in range(count):
+        cut = rng.randint(1, len(body))
+        copies.append((body[:cut], [element for element, end in elements if end <= cut]))
+    return copies
+
+def box_key(element):
+    box = element.get("box") or {}
+    return (box.get("x"), box.get("y"), box.get("width"), box.get("height"))
+
+def run(name, extract, corpus):
+    start = time.perf_counter()
+    results = [extract(text) for text, _ in corpus]
+    seconds = time.perf_counter() - start
+    expected = sum(len(complete) for _, complete in corpus)
+    recovered = 0
+    for elements, (_, complete) in zip(results, corpus):
+        found = {box_key(element) for element in elements if isinstance(element, dict)}
+        recovered += sum(1 for element in complete if box_key(element) in found)
+    total_chars = sum(len(text) for text, _ in corpus)
+    expected = max(expected, 1)
+    print(f"  {name:<8}: {seconds / len(corpus) * 1000:8.3f} ms/response  "
+          f"{total_chars / seconds / 1e6:7.2f} MB/s  recovered {recovered}/{expected} "
+          f"complete elements ({recovered / expected:.1%})")
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM response recovery")
+    parser.add_argument("--responses", type=int, default=300, help="Synthetic responses")
+    parser.add_argument("--elements", type=int, default=15, help="Elements per synthetic response")
+    parser.add_argument("--corpus", type=str, help="Directory of raw responses (*.txt, *.json) saved from real runs")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    corpus = [make_response(rng, rng.randint(1, args.elements)) for _ in range(args.responses)]
+    suites = [("synthetic", corpus),
+              ("long truncated", [make_response(random.Random(seed), 200) for seed in range(5)])]
+    if args.corpus:
+        # Real responses that json.loads accepts give the reference elements, for themselves and cut copies
+        real, truncated, skipped = [], [], 0
+        paths = sorted(glob.glob(os.path.join(args.corpus, "*.txt")) + glob.glob(os.path.join(args.corpus, "*.json")))
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                decoded = load_real_response(f.read())
+            if decoded is None:
+                skipped += 1
+                continue
+            body, elements = decoded
+            real.append((body, [element for element, _ in elements]))
+            truncated.extend(truncated_copies(rng, body, elements))
+        if skipped:
+            print(f"{skipped}/{len(paths)} real responses are not valid JSON and have no ground truth - skipped")
+        if real:
+            suites.append((f"real ({args.corpus})", real))
+            suites.append((f"real truncated ({args.corpus})", truncated))
+
+    for name, suite in suites:
+        print(f"{name}: {len(suite)} responses")
+        legacy_seconds = run("regex", legacy_extract, suite)
+        scanner_seconds = run("scanner", extract_elements, suite)
+        ratio = scanner_seconds / legacy_seconds
+        comparison = f"{ratio:.1f}x slower" if ratio >= 1 else f"{1 / ratio:.1f}x faster"
+        print(f"  time    : scanner is {comparison} than the regex "
+              f"({scanner_seconds * 1000:.1f} ms vs {legacy_seconds * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,16 @@ Supports all modular action types: clicks, drags, scrolls, hotkeys, text input,
 import os
 import time
 import json
+import socket
+import struct
+import socketserver
 import subprocess
 import threading
 import psutil
 from flask import Flask, request, jsonify, send_file
 import pyautogui
 from io import BytesIO
+from PIL import Image, ImageStat
 import logging
 import win32api
 import win32con
@@ -132,43 +136,297 @@ def terminate_process_by_name(process_name):
 @app.route('/status', methods=['GET'])
 def status():
     """Enhanced status endpoint with capabilities."""
+    capabilities = [
+        "basic_clicks", "advanced_clicks", "drag_drop", "scroll",
+        "hotkeys", "text_input", "sequences", "process_management",
+        "performance_monitoring", "multi_monitor", "gaming_optimizations",
+        "screenshot_formats", "screen_change_detection", "action_batch",
+        "pixel_probe"
+    ]
+    if channel_port:
+        capabilities.append("control_channel")
     return jsonify({
         "status": "running",
         "version": "2.0",
-        "capabilities": [
-            "basic_clicks", "advanced_clicks", "drag_drop", "scroll",
-            "hotkeys", "text_input", "sequences", "process_management",
-            "performance_monitoring", "multi_monitor", "gaming_optimizations"
-        ]
+        "channel_port": channel_port,
+        "capabilities": capabilities
     })
 
+SCREENSHOT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp")
+}
+
+def encode_screenshot(image, image_format='png', quality=85):
+    """
+    Encode a screenshot in the requested format.
+    
+    Args:
+        image: PIL image to encode
+        image_format: png, jpeg or webp
+        quality: Quality for lossy formats (1-100)
+    
+    Returns:
+        Tuple of (BytesIO buffer, mimetype)
+    """
+    pil_format, mimetype = SCREENSHOT_FORMATS[image_format]
+    img_buffer = BytesIO()
+    if pil_format == "PNG":
+        # Favour encode speed over size - this runs on the machine under test
+        image.save(img_buffer, format='PNG', compress_level=1)
+    else:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(img_buffer, format=pil_format, quality=quality)
+    img_buffer.seek(0)
+    return img_buffer, mimetype
+
+def capture_screenshot(region=None, image_format='png', quality=85, scale=1.0, max_width=None):
+    """
+    Capture the screen (or a region), optionally downscale it, and encode it.
+    
+    Args:
+        region: "x,y,width,height" string or None for the full screen
+        image_format: png, jpeg or webp
+        quality: Quality for lossy formats (1-100)
+        scale: Downscale factor (0 < scale <= 1)
+        max_width: Downscale so the image is at most this wide
+    
+    Returns:
+        Tuple of (BytesIO buffer, mimetype, native_width, native_height, applied scale)
+    
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if image_format not in SCREENSHOT_FORMATS:
+        raise ValueError(f"Unsupported format: {image_format}")
+    
+    if region:
+        # Capture specific region
+        x, y, width, height = map(int, region.split(','))
+        screenshot = pyautogui.screenshot(region=(x, y, width, height))
+    else:
+        # Capture entire screen
+        screenshot = pyautogui.screenshot()
+    
+    native_width, native_height = screenshot.size
+    
+    # Optional server-side downscale
+    if max_width:
+        scale = min(scale, int(max_width) / native_width)
+    scale = max(0.05, min(1.0, scale))
+    if scale < 1.0:
+        screenshot = screenshot.resize(
+            (max(1, round(native_width * scale)), max(1, round(native_height * scale))),
+            Image.BILINEAR
+        )
+    
+    img_buffer, mimetype = encode_screenshot(screenshot, image_format, quality)
+    return img_buffer, mimetype, native_width, native_height, scale
+
 @app.route('/screenshot', methods=['GET'])
 def screenshot():
-    """Capture and return a screenshot with optional parameters."""
+    """
+    Capture and return a screenshot with optional parameters.
+    
+    Query parameters:
+        monitor: Monitor index
+        region: "x,y,width,height" to capture part of the screen
+        format: png (default), jpeg or webp
+        quality: Quality for jpeg/webp (1-100, default 85)
+        scale: Downscale factor (0 < scale <= 1)
+        max_width: Downscale so the image is at most this wide
+    
+    The native size and applied scale are returned in the
+    X-Native-Width, X-Native-Height and X-Scale headers.
+    """
     try:
         # Optional parameters for screenshot
         monitor = request.args.get('monitor', '0')  # Monitor index
         region = request.args.get('region')  # Format: "x,y,width,height"
-        
-        if region:
-            # Capture specific region
-            x, y, width, height = map(int, region.split(','))
-            screenshot = pyautogui.screenshot(region=(x, y, width, height))
-        else:
-            # Capture entire screen
-            screenshot = pyautogui.screenshot()
-        
-        # Save to a bytes buffer
-        img_buffer = BytesIO()
-        screenshot.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        logger.info(f"Screenshot captured (monitor: {monitor}, region: {region})")
-        return send_file(img_buffer, mimetype='image/png')
+        image_format = request.args.get('format', 'png').lower()
+        quality = max(1, min(100, int(request.args.get('quality', 85))))
+        scale = float(request.args.get('scale', 1.0))
+        max_width = request.args.get('max_width')
+        
+        if image_format not in SCREENSHOT_FORMATS:
+            return jsonify({"status": "error", "error": f"Unsupported format: {image_format}"}), 400
+        
+        img_buffer, mimetype, native_width, native_height, scale = capture_screenshot(
+            region, image_format, quality, scale, max_width
+        )
+        
+        logger.info(f"Screenshot captured (monitor: {monitor}, region: {region}, format: {image_format}, "
+                    f"scale: {scale:.3f}, {img_buffer.getbuffer().nbytes} bytes)")
+        response = send_file(img_buffer, mimetype=mimetype)
+        response.headers['X-Native-Width'] = str(native_width)
+        response.headers['X-Native-Height'] = str(native_height)
+        response.headers['X-Scale'] = f"{scale:.6f}"
+        return response
     except Exception as e:
         logger.error(f"Error capturing screenshot: {str(e)}")
         return jsonify({"status": "error", "error": str(e)}), 500
 
+def compute_screen_hash(image=None, hash_size=16):
+    """
+    Compute a difference hash (dHash) of the screen.
+    
+    Args:
+        image: PIL image to hash (captures the screen if omitted)
+        hash_size: Bits per row/column
+    
+    Returns:
+        Hash as an integer
+    """
+    if image is None:
+        image = pyautogui.screenshot()
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_distance(hash_a, hash_b):
+    """Number of differing bits between two screen hashes."""
+    return bin(hash_a ^ hash_b).count('1')
+
+@app.route('/screenshot/hash', methods=['GET'])
+def screenshot_hash():
+    """Return a perceptual hash of the current screen (cheap change detection reference)."""
+    try:
+        screen_hash = compute_screen_hash()
+        return jsonify({"status": "success", "hash": f"{screen_hash:x}", "timestamp": time.time()})
+    except Exception as e:
+        logger.error(f"Error hashing screen: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+@app.route('/screenshot/changed', methods=['GET'])
+def screenshot_changed():
+    """
+    Long-poll until the screen has changed from a reference hash and then settled.
+    
+    Query parameters:
+        reference: Hex hash to compare against (omit to only wait for the screen to settle)
+        threshold: Bits that may differ before the screen counts as changed (default 4)
+        timeout: Maximum seconds to wait (default 10)
+        settle: Seconds the screen must stay unchanged to count as settled (default 0.5)
+        interval: Polling interval in seconds (default 0.1)
+    """
+    try:
+        reference = request.args.get('reference')
+        threshold = int(request.args.get('threshold', 4))
+        timeout = min(float(request.args.get('timeout', 10)), 300)
+        settle = float(request.args.get('settle', 0.5))
+        interval = max(0.02, float(request.args.get('interval', 0.1)))
+        
+        start_time = time.time()
+        deadline = start_time + timeout
+        reference_hash = int(reference, 16) if reference else None
+        
+        # Phase 1: wait for the screen to differ from the reference
+        current_hash = compute_screen_hash()
+        distance = hash_distance(reference_hash, current_hash) if reference_hash is not None else 0
+        changed = reference_hash is None or distance > threshold
+        while not changed and time.time() < deadline:
+            time.sleep(interval)
+            current_hash = compute_screen_hash()
+            distance = hash_distance(reference_hash, current_hash)
+            changed = distance > threshold
+        
+        # Phase 2: wait for the screen to stop changing
+        settled = False
+        if changed:
+            stable_hash = current_hash
+            stable_since = time.time()
+            while True:
+                if time.time() - stable_since >= settle:
+                    settled = True
+                    break
+                if time.time() >= deadline:
+                    break
+                time.sleep(interval)
+                current_hash = compute_screen_hash()
+                if hash_distance(stable_hash, current_hash) > threshold:
+                    stable_hash = current_hash
+                    stable_since = time.time()
+        
+        elapsed = time.time() - start_time
+        logger.info(f"Screen change wait: changed={changed}, settled={settled}, elapsed={elapsed:.2f}s")
+        return jsonify({
+            "status": "success",
+            "changed": changed,
+            "settled": settled,
+            "hash": f"{current_hash:x}",
+            "distance": distance,
+            "elapsed": elapsed
+        })
+    except Exception as e:
+        logger.error(f"Error waiting for screen change: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+# Probes whose bounding box is at most this many pixels are grabbed in one capture
+PIXEL_UNION_MAX_AREA = 512 * 512
+
+def sample_pixels(points=None, regions=None):
+    """
+    Read pixel colors and region mean colors without encoding an image.
+
+    Args:
+        points: List of [x, y] screen points
+        regions: List of [x, y, width, height] screen regions
+
+    Returns:
+        Dict with "points" and "regions" lists of [r, g, b] values (regions are means)
+    """
+    probes = [(int(x), int(y), 1, 1) for x, y in (points or [])]
+    probes += [(int(x), int(y), max(1, int(w)), max(1, int(h))) for x, y, w, h in (regions or [])]
+    if not probes:
+        return {"points": [], "regions": []}
+
+    left = min(p[0] for p in probes)
+    top = min(p[1] for p in probes)
+    right = max(p[0] + p[2] for p in probes)
+    bottom = max(p[1] + p[3] for p in probes)
+
+    colors = []
+    if (right - left) * (bottom - top) <= PIXEL_UNION_MAX_AREA:
+        # Probes are close together: one small capture covers all of them
+        capture = pyautogui.screenshot(region=(left, top, right - left, bottom - top)).convert('RGB')
+        for x, y, w, h in probes:
+            crop = capture.crop((x - left, y - top, x - left + w, y - top + h))
+            colors.append(ImageStat.Stat(crop).mean)
+    else:
+        for x, y, w, h in probes:
+            crop = pyautogui.screenshot(region=(x, y, w, h)).convert('RGB')
+            colors.append(ImageStat.Stat(crop).mean)
+
+    colors = [[round(channel, 2) for channel in color[:3]] for color in colors]
+    point_count = len(points or [])
+    return {"points": colors[:point_count], "regions": colors[point_count:]}
+
+@app.route('/pixels', methods=['POST'])
+def pixels():
+    """
+    Sample pixel colors for cheap state checks (no image is encoded or sent).
+
+    Request body:
+        points: List of [x, y] screen points
+        regions: List of [x, y, width, height] regions to average
+    """
+    try:
+        data = request.json or {}
+        result = sample_pixels(data.get('points'), data.get('regions'))
+        return jsonify({"status": "success", "timestamp": time.time(), **result})
+    except Exception as e:
+        logger.error(f"Error sampling pixels: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
 @app.route('/launch', methods=['POST'])
 def launch_game():
     """Launch a game with support for process ID tracking - FIXED for Steam games."""
@@ -242,6 +500,7 @@ def launch_game():
                 response_data["game_process_name"] = actual_process.name()
                 response_data["game_process_status"] = actual_process.status()
                 logger.info(f"✓ Game launched successfully: {actual_process.name()} (PID: {actual_process.pid})")
+                broadcast_event("game_launched", {"pid": actual_process.pid, "name": actual_process.name()})
             else:
                 # This is now a warning, not an error - the game might still be starting
                 logger.warning(f"Game process '{current_game_process_name}' not found within {max_wait_time} seconds")
@@ -254,65 +513,138 @@ def launch_game():
         logger.error(f"Error launching game: {str(e)}")
         return jsonify({"status": "error", "error": str(e)}), 500
 
+def dispatch_action(data):
+    """
+    Run a single action through the matching handler.
+    
+    Args:
+        data: Action dictionary with a 'type' key
+    
+    Returns:
+        The handler's Flask response (optionally with a status code)
+    """
+    action_type = data.get('type', '').lower()
+    
+    # === CLICK ACTIONS ===
+    if action_type == 'click':
+        return handle_click_action(data)
+    
+    # === ADVANCED MOUSE ACTIONS ===
+    elif action_type in ['double_click', 'triple_click']:
+        return handle_multi_click_action(data)
+    
+    # === DRAG ACTIONS ===
+    elif action_type in ['drag', 'drag_drop']:
+        return handle_drag_action(data)
+    
+    # === SCROLL ACTIONS ===
+    elif action_type == 'scroll':
+        return handle_scroll_action(data)
+    
+    # === KEYBOARD ACTIONS ===
+    elif action_type in ['key', 'keypress']:
+        return handle_key_action(data)
+    
+    # === HOTKEY ACTIONS ===
+    elif action_type == 'hotkey':
+        return handle_hotkey_action(data)
+    
+    # === TEXT INPUT ACTIONS ===
+    elif action_type in ['text', 'type', 'input']:
+        return handle_text_action(data)
+    
+    # === WAIT ACTIONS ===
+    elif action_type == 'wait':
+        return handle_wait_action(data)
+    
+    # === SEQUENCE ACTIONS ===
+    elif action_type == 'sequence':
+        return handle_sequence_action(data)
+    
+    # === GAME MANAGEMENT ===
+    elif action_type == 'terminate_game':
+        return handle_terminate_game()
+    
+    # === SYSTEM ACTIONS ===
+    elif action_type in ['screenshot_region', 'window_focus', 'window_resize']:
+        return handle_system_action(data)
+    
+    else:
+        logger.error(f"Unknown action type: {action_type}")
+        return jsonify({"status": "error", "error": f"Unknown action type: {action_type}"}), 400
+
 @app.route('/action', methods=['POST'])
 def perform_action():
     """Enhanced action handler supporting all modular action types."""
     try:
         data = request.json
-        action_type = data.get('type', '').lower()
-        
-        logger.info(f"Executing action: {action_type}")
-        
-        # === CLICK ACTIONS ===
-        if action_type == 'click':
-            return handle_click_action(data)
-        
-        # === ADVANCED MOUSE ACTIONS ===
-        elif action_type in ['double_click', 'triple_click']:
-            return handle_multi_click_action(data)
-        
-        # === DRAG ACTIONS ===
-        elif action_type in ['drag', 'drag_drop']:
-            return handle_drag_action(data)
-        
-        # === SCROLL ACTIONS ===
-        elif action_type == 'scroll':
-            return handle_scroll_action(data)
-        
-        # === KEYBOARD ACTIONS ===
-        elif action_type in ['key', 'keypress']:
-            return handle_key_action(data)
-        
-        # === HOTKEY ACTIONS ===
-        elif action_type == 'hotkey':
-            return handle_hotkey_action(data)
-        
-        # === TEXT INPUT ACTIONS ===
-        elif action_type in ['text', 'type', 'input']:
-            return handle_text_action(data)
-        
-        # === WAIT ACTIONS ===
-        elif action_type == 'wait':
-            return handle_wait_action(data)
-        
-        # === SEQUENCE ACTIONS ===
-        elif action_type == 'sequence':
-            return handle_sequence_action(data)
+        logger.info(f"Executing action: {data.get('type', '').lower()}")
+        return dispatch_action(data)
+            
+    except Exception as e:
+        logger.error(f"Error performing action: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+def run_action_batch(actions, stop_on_error=True):
+    """
+    Execute an ordered list of actions, honouring each action's delay_after.
+    
+    Args:
+        actions: List of action dictionaries
+        stop_on_error: Stop at the first failing action
+    
+    Returns:
+        Batch result dictionary with per-action results
+    """
+    results = []
+    failed = False
+    for i, action in enumerate(actions):
+        result = perform_action_internal(action)
+        results.append(result)
+        
+        if result.get('status') != 'success':
+            failed = True
+            logger.error(f"Batch action {i+1}/{len(actions)} failed: {result.get('error')}")
+            if stop_on_error:
+                break
+        
+        # A trailing delay_after is a wait the caller folded into the batch, so it is honoured too
+        delay_after = float(action.get('delay_after', 0))
+        if delay_after > 0:
+            time.sleep(delay_after)
+    
+    completed = sum(1 for r in results if r.get('status') == 'success')
+    logger.info(f"Executed batch: {completed}/{len(actions)} actions succeeded")
+    return {
+        "status": "error" if failed else "success",
+        "action": "batch",
+        "actions_completed": completed,
+        "results": results
+    }
+
+@app.route('/actions/batch', methods=['POST'])
+def perform_action_batch():
+    """
+    Execute an ordered list of actions in one request.
+    
+    Body:
+        actions: List of action dictionaries; each may set delay_after (seconds)
+        stop_on_error: Stop at the first failing action (default true)
+    
+    Returns per-action results and the number of actions completed.
+    """
+    try:
+        data = request.json or {}
+        actions = data.get('actions', [])
         
-        # === GAME MANAGEMENT ===
-        elif action_type == 'terminate_game':
-            return handle_terminate_game()
+        if not actions:
+            return jsonify({"status": "error", "error": "No actions specified in batch"}), 400
         
-        # === SYSTEM ACTIONS ===
-        elif action_type in ['screenshot_region', 'window_focus', 'window_resize']:
-            return handle_system_action(data)
+        result = run_action_batch(actions, data.get('stop_on_error', True))
+        return jsonify(result), (500 if result["status"] != "success" else 200)
         
-        else:
-            logger.error(f"Unknown action type: {action_type}")
-            return jsonify({"status": "error", "error": f"Unknown action type: {action_type}"}), 400
-            
     except Exception as e:
-        logger.error(f"Error performing action: {str(e)}")
+        logger.error(f"Error performing action batch: {str(e)}")
         return jsonify({"status": "error", "error": str(e)}), 500
 
 def handle_click_action(data):
@@ -679,29 +1011,16 @@ def handle_sequence_action(data):
         return jsonify({"status": "error", "error": str(e)}), 500
 
 def perform_action_internal(data):
-    """Internal action handler for sequence actions."""
-    # This is a simplified version that returns dict instead of Flask response
+    """Run an action and return its result as a dict (used by sequences and batches)."""
     try:
-        action_type = data.get('type', '').lower()
-        
-        if action_type == 'click':
-            handle_click_action(data)
-            return {"status": "success", "action": action_type}
-        elif action_type in ['key', 'keypress']:
-            handle_key_action(data)
-            return {"status": "success", "action": action_type}
-        elif action_type == 'hotkey':
-            handle_hotkey_action(data)
-            return {"status": "success", "action": action_type}
-        elif action_type in ['text', 'type']:
-            handle_text_action(data)
-            return {"status": "success", "action": action_type}
-        elif action_type == 'wait':
-            handle_wait_action(data)
-            return {"status": "success", "action": action_type}
-        # Add other action types as needed
-        else:
-            return {"status": "error", "error": f"Unknown action type in sequence: {action_type}"}
+        response = dispatch_action(data)
+        status_code = 200
+        if isinstance(response, tuple):
+            response, status_code = response[0], response[1]
+        result = response.get_json(silent=True) or {}
+        if status_code >= 400 and result.get('status') == 'success':
+            result['status'] = 'error'
+        return result
             
     except Exception as e:
         return {"status": "error", "error": str(e)}
@@ -730,6 +1049,8 @@ def handle_terminate_game():
                     terminated = True
             
             message = "Game terminated successfully" if terminated else "No running game to terminate"
+            if terminated:
+                broadcast_event("game_terminated", {"name": current_game_process_name})
             
             return jsonify({
                 "status": "success", 
@@ -840,6 +1161,130 @@ def health_check():
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({"status": "error", "error": str(e)}), 500
 
+# === PERSISTENT CONTROL CHANNEL ===
+# Length-prefixed TCP protocol: every message is an 8-byte header (JSON length, payload length,
+# both big-endian uint32) followed by a UTF-8 JSON object and an optional binary payload.
+# Requests carry an "id" that is echoed in the response; pushed events carry "event" instead.
+
+CHANNEL_HEADER = struct.Struct('>II')
+channel_port = None
+channel_clients = {}  # socket -> send lock
+channel_clients_lock = threading.Lock()
+
+def channel_send(sock, send_lock, message, payload=b''):
+    """Send one framed message on a control channel socket."""
+    body = json.dumps(message).encode('utf-8')
+    with send_lock:
+        sock.sendall(CHANNEL_HEADER.pack(len(body), len(payload)) + body + payload)
+
+def channel_recv_exact(sock, size):
+    """Read exactly size bytes from a socket."""
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Control channel closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def broadcast_event(event, data=None):
+    """Push an event to every connected control channel client."""
+    with channel_clients_lock:
+        clients = list(channel_clients.items())
+    for sock, send_lock in clients:
+        try:
+            channel_send(sock, send_lock, {"event": event, "data": data or {}, "timestamp": time.time()})
+        except OSError:
+            pass
+
+def handle_channel_request(message):
+    """
+    Execute one control channel request.
+    
+    Args:
+        message: Request with op and params
+    
+    Returns:
+        Tuple of (response dict, binary payload)
+    """
+    op = message.get('op')
+    params = message.get('params') or {}
+    
+    with app.app_context():
+        if op == 'ping':
+            return {"status": "success", "time": time.time()}, b''
+        elif op == 'action':
+            return perform_action_internal(params), b''
+        elif op == 'actions':
+            return run_action_batch(params.get('actions', []), params.get('stop_on_error', True)), b''
+        elif op == 'screenshot':
+            img_buffer, mimetype, native_width, native_height, scale = capture_screenshot(
+                params.get('region'), params.get('format', 'png').lower(),
+                max(1, min(100, int(params.get('quality', 85)))),
+                float(params.get('scale', 1.0)), params.get('max_width')
+            )
+            return {
+                "status": "success",
+                "mime_type": mimetype,
+                "native_width": native_width,
+                "native_height": native_height,
+                "scale": scale
+            }, img_buffer.getvalue()
+        elif op == 'screen_hash':
+            return {"status": "success", "hash": f"{compute_screen_hash():x}", "timestamp": time.time()}, b''
+        elif op == 'pixels':
+            result = sample_pixels(params.get('points'), params.get('regions'))
+            return {"status": "success", "timestamp": time.time(), **result}, b''
+        else:
+            return {"status": "error", "error": f"Unknown channel op: {op}"}, b''
+
+class ControlChannelHandler(socketserver.BaseRequestHandler):
+    """Serves one control channel connection; requests are executed in arrival order."""
+    
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_lock = threading.Lock()
+        with channel_clients_lock:
+            channel_clients[sock] = send_lock
+        logger.info(f"Control channel client connected: {self.client_address}")
+        
+        try:
+            channel_send(sock, send_lock, {"event": "hello", "data": {"version": "2.0"}, "timestamp": time.time()})
+            while True:
+                json_length, payload_length = CHANNEL_HEADER.unpack(channel_recv_exact(sock, CHANNEL_HEADER.size))
+                message = json.loads(channel_recv_exact(sock, json_length).decode('utf-8'))
+                if payload_length:
+                    channel_recv_exact(sock, payload_length)  # No request ops take a payload yet
+                
+                try:
+                    response, payload = handle_channel_request(message)
+                except Exception as e:
+                    logger.error(f"Control channel request failed: {str(e)}")
+                    response, payload = {"status": "error", "error": str(e)}, b''
+                response["id"] = message.get("id")
+                channel_send(sock, send_lock, response, payload)
+        except (ConnectionError, OSError, ValueError) as e:
+            logger.info(f"Control channel client disconnected: {self.client_address} ({str(e)})")
+        finally:
+            with channel_clients_lock:
+                channel_clients.pop(sock, None)
+
+class ControlChannelServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_control_channel(host, port):
+    """Start the control channel server on a background thread."""
+    global channel_port
+    server = ControlChannelServer((host, port), ControlChannelHandler)
+    channel_port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, name="ControlChannel", daemon=True)
+    thread.start()
+    logger.info(f"Control channel listening on {host}:{channel_port}")
+    return server
+
 if __name__ == '__main__':
     import argparse
     
@@ -847,6 +1292,8 @@ if __name__ == '__main__':
     parser.add_argument('--port', type=int, default=8080, help='Port to run the service on')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--channel-port', type=int, default=8081,
+                        help='Port for the persistent control channel (0 disables it)')
     args = parser.parse_args()
     
     logger.info("=" * 60)
@@ -866,7 +1313,14 @@ if __name__ == '__main__':
     logger.info("   Gaming-optimized input handling")
     logger.info("=" * 60)
     
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    if args.channel_port:
+        try:
+            start_control_channel(args.host, args.channel_port)
+        except OSError as e:
+            logger.error(f"Could not start control channel on port {args.channel_port}: {str(e)}")
+    
+    # The reloader would start a second control channel in the child process
+    app.run(host=args.host, port=args.port, debug=args.debug, use_reloader=False)
 
 # """
 # SUT Service - Run this on the System Under Test (SUT)
@@ -167,14 +167,11 @@ class AutomationGUI:
     def perform_auto_test(self):
         """Perform the actual auto-test"""
         try:
-            import requests
-            response = requests.get(f"{self.omniparser_url.get()}/probe", timeout=5)
-            if response.status_code == 200:
-                self.omniparser_status_label.config(text="Connected", foreground="green")
-                self.logger.info("Auto-connected to Omniparser server on startup!")
-            else:
-                self.omniparser_status_label.config(text="Connection Failed", foreground="red")
-                self.logger.info(f"Auto-test failed: HTTP {response.status_code}")
+            from modules.endpoint_pool import EndpointPool
+            # Several comma-separated servers count as connected if any of them answers
+            EndpointPool(self.omniparser_url.get(), probe_path="/probe", probe_interval=0).probe_all()
+            self.omniparser_status_label.config(text="Connected", foreground="green")
+            self.logger.info("Auto-connected to Omniparser server on startup!")
         except Exception as e:
             self.omniparser_status_label.config(text="Connection Failed", foreground="red")
             self.logger.info(f"Auto-test failed (server may not be running): {str(e)}")
@@ -509,14 +506,14 @@ class AutomationGUI:
     def test_omniparser_connection(self, auto_test=False):
         """Test connection to Omniparser server"""
         try:
-            import requests
-            response = requests.get(f"{self.omniparser_url.get()}/probe", timeout=5)
-            if response.status_code == 200:
-                self.omniparser_status_label.config(text="Connected", foreground="green")
+            from modules.endpoint_pool import EndpointPool
+            pool = EndpointPool(self.omniparser_url.get(), probe_path="/probe", probe_interval=0)
+            healthy = pool.probe_all()
+            self.omniparser_status_label.config(text="Connected", foreground="green")
+            if len(pool.endpoints) == 1:
                 messagebox.showinfo("Success", "Successfully connected to Omniparser server!")
             else:
-                self.omniparser_status_label.config(text="Connection Failed", foreground="red")
-                messagebox.showerror("Error", f"Failed to connect to Omniparser server: HTTP {response.status_code}")
+                messagebox.showinfo("Success", f"Connected to {healthy} of {len(pool.endpoints)} Omniparser servers")
         except Exception as e:
             self.omniparser_status_label.config(text="Connection Failed", foreground="red")
             messagebox.showerror("Error", f"Failed to connect to Omniparser server: {str(e)}")
@@ -711,7 +708,7 @@ class AutomationGUI:
             try:
                 from modules.network import NetworkManager
                 # Just test the connection, don't keep the object
-                test_network = NetworkManager(self.sut_ip.get(), int(self.sut_port.get()))
+                test_network = NetworkManager(self.sut_ip.get(), int(self.sut_port.get()), use_channel=False)
                 test_network.close()  # Close the test connection
                 
                 # Connection successful - proceed with automation
@@ -808,6 +805,7 @@ class AutomationGUI:
             from modules.gemma_client import GemmaClient
             from modules.qwen_client import QwenClient
             from modules.omniparser_client import OmniparserClient
+            from modules.detection_cache import CachedVisionClient
             from modules.annotator import Annotator
             from modules.simple_automation import SimpleAutomation
             from modules.game_launcher import GameLauncher
@@ -857,6 +855,9 @@ class AutomationGUI:
             elif self.vision_model.get() == 'omniparser':
                 self.logger.info("Using Omniparser for UI detection")
                 vision_model = OmniparserClient(self.omniparser_url.get())
+            
+            # Skip model round-trips when the screen has not changed
+            vision_model = CachedVisionClient(vision_model)
                 
             annotator = Annotator()
             game_launcher = GameLauncher(network)
@@ -872,6 +873,9 @@ class AutomationGUI:
                     self.logger.info(f"Launching game from: {self.game_path.get()}")
                     game_launcher.launch(self.game_path.get())
                     
+                    # Load the vision model while the game starts instead of on the first detection
+                    vision_model.warm_up_async()
+                    
                     # Wait for game to initialize
                     self.logger.info(f"Waiting {startup_wait} seconds for game to fully initialize...")
                     wait_time = startup_wait
@@ -921,6 +925,8 @@ class AutomationGUI:
                 
             finally:
                 # Cleanup
+                if 'screenshot_mgr' in locals():
+                    screenshot_mgr.close()
                 if 'network' in locals():
                     network.close()
                 if 'vision_model' in locals() and hasattr(vision_model, 'close'):
@@ -941,8 +947,10 @@ class AutomationGUI:
             from modules.gemma_client import GemmaClient
             from modules.qwen_client import QwenClient
             from modules.omniparser_client import OmniparserClient
+            from modules.detection_cache import CachedVisionClient
             from modules.annotator import Annotator
             from modules.decision_engine import DecisionEngine
+            from modules.pixel_probe import PixelProbe
             from modules.game_launcher import GameLauncher
             import datetime
             
@@ -990,9 +998,14 @@ class AutomationGUI:
             elif self.vision_model.get() == 'omniparser':
                 self.logger.info("Using Omniparser for UI detection")
                 vision_model = OmniparserClient(self.omniparser_url.get())
+            
+            # Skip model round-trips when the screen has not changed
+            vision_model = CachedVisionClient(vision_model)
                 
             annotator = Annotator()
             decision_engine = DecisionEngine(config)
+            pixel_probe = PixelProbe(network, screenshot_mgr)
+            pixel_checks = decision_engine.get_pixel_checks()
             game_launcher = GameLauncher(network)
             
             # Get game metadata
@@ -1006,6 +1019,9 @@ class AutomationGUI:
                     self.logger.info(f"Launching game from: {self.game_path.get()}")
                     game_launcher.launch(self.game_path.get())
                     
+                    # Load the vision model while the game starts instead of on the first detection
+                    vision_model.warm_up_async()
+                    
                     # Wait for game to initialize
                     self.logger.info(f"Waiting {startup_wait} seconds for game to fully initialize...")
                     wait_time = startup_wait
@@ -1026,6 +1042,7 @@ class AutomationGUI:
                 
                 # Main execution loop - state machine approach
                 iteration = 0
+                settle_by_default = config.get("enhanced_features", {}).get("wait_for_screen_settle", False)
                 current_state = "initial"
                 target_state = decision_engine.get_target_state()
                 
@@ -1061,22 +1078,25 @@ class AutomationGUI:
                     
                     # Capture screenshot - USE RUN-SPECIFIC DIRECTORY
                     screenshot_path = f"{run_dir}/screenshots/screenshot_{iteration}.png"
-                    screenshot_mgr.capture(screenshot_path)
+                    frame = screenshot_mgr.capture_for(screenshot_path, decision_engine.get_capture_region(current_state))
                     self.logger.info(f"Screenshot captured: {screenshot_path}")
                     
                     # Process with vision model
-                    bounding_boxes = vision_model.detect_ui_elements(screenshot_path)
+                    bounding_boxes = vision_model.detect_ui_elements(frame)
                     self.logger.info(f"Detected {len(bounding_boxes)} UI elements")
                     
                     # Annotate screenshot - USE RUN-SPECIFIC DIRECTORY
                     annotated_path = f"{run_dir}/annotated/annotated_{iteration}.png"
-                    annotator.draw_bounding_boxes(screenshot_path, bounding_boxes, annotated_path)
+                    annotator.draw_bounding_boxes(frame, bounding_boxes, annotated_path)
                     self.logger.info(f"Annotated screenshot saved: {annotated_path}")
                     
+                    # Sample the pixels behind the states' pixel_checks
+                    pixel_samples = pixel_probe.sample(pixel_checks) if pixel_checks else None
+                    
                     # Determine next action
                     previous_state = current_state
                     next_action, new_state = decision_engine.determine_next_action(
-                        current_state, bounding_boxes
+                        current_state, bounding_boxes, pixel_samples
                     )
                     
                     # Format the action for better logging
@@ -1093,6 +1113,12 @@ class AutomationGUI:
                             
                     self.logger.info(f"Next action: {action_str}, transitioning to state: {new_state}")
                     
+                    # Remember the screen before acting so we can wait for it to change and settle
+                    planned_transition = config.get("transitions", {}).get(f"{current_state}->{new_state}", {})
+                    wait_for_settle = (planned_transition.get("wait_for_settle", settle_by_default)
+                                       and bool(next_action) and next_action.get("type") != "wait")
+                    reference_hash = screenshot_mgr.get_screen_hash() if wait_for_settle else None
+                    
                     # Execute action
                     if next_action and not self.stop_event.is_set():
                         self.logger.info(f"Executing action: {action_str}")
@@ -1130,7 +1156,10 @@ class AutomationGUI:
                     transition = config.get("transitions", {}).get(transition_key, {})
                     delay = transition.get("expected_delay", 1)
                     
-                    time.sleep(delay)  # Wait before next iteration
+                    if wait_for_settle:
+                        screenshot_mgr.wait_for_settle(delay, reference_hash)
+                    else:
+                        time.sleep(delay)  # Wait before next iteration
                 
                 # Check if we reached the target state
                 if current_state == target_state:
@@ -1155,6 +1184,8 @@ class AutomationGUI:
             
             finally:
                 # Cleanup
+                if 'screenshot_mgr' in locals():
+                    screenshot_mgr.close()
                 if 'network' in locals():
                     network.close()
                 if 'vision_model' in locals() and hasattr(vision_model, 'close'):
@@ -17,8 +17,17 @@ from modules.screenshot import ScreenshotManager
 from modules.gemma_client import GemmaClient
 from modules.qwen_client import QwenClient
 from modules.omniparser_client import OmniparserClient
+from modules.detection_cache import DetectionCache, CachedVisionClient
+from modules.ensemble_client import EnsembleVisionClient
+from modules.cascade_client import CascadeVisionClient
+from modules.image_preprocessor import ImagePreprocessor
+from modules.template_matcher import TemplateMatcher, TemplateVisionClient
+from modules.archive_writer import configure_archive_writer
 from modules.annotator import Annotator
 from modules.decision_engine import DecisionEngine
+from modules.pixel_probe import PixelProbe
+from modules.screen_index import ScreenIndex
+from modules.box_set import BoxSet
 from modules.game_launcher import GameLauncher
 from modules.config_parser import ConfigParser
 
@@ -72,12 +81,58 @@ def parse_arguments():
     
     # Optional arguments with sensible defaults
     parser.add_argument('--sut-port', type=int, default=8080, help='Port for communication with SUT')
-    parser.add_argument('--vision-model', type=str, choices=['gemma', 'qwen', 'omniparser'], default='gemma',
+    parser.add_argument('--vision-model', type=str, choices=['gemma', 'qwen', 'omniparser', 'ensemble', 'cascade'],
+                      default='gemma',
                       help='Vision model to use for UI detection (default: gemma)')
+    parser.add_argument('--ensemble-models', type=str, default='omniparser,gemma',
+                      help='Comma-separated models queried concurrently by --vision-model ensemble')
+    parser.add_argument('--cascade-tiers', type=str, default='template,omniparser,gemma',
+                      help='Comma-separated tiers tried in order by --vision-model cascade, cheapest first')
+    parser.add_argument('--omniparser-url', type=str, default='http://localhost:8000',
+                      help='Omniparser server URL used by the ensemble and cascade (LLMs use --model-url); '
+                           'comma-separate several servers to load-balance over them')
     parser.add_argument('--model-url', type=str, default='http://127.0.0.1:1234', 
-                      help='URL for the vision model API (default: http://127.0.0.1:1234)')
+                      help='URL for the vision model API (default: http://127.0.0.1:1234); '
+                           'comma-separate several servers to load-balance over them')
+    parser.add_argument('--upload-max-side', type=int, default=None,
+                      help='Longest image side sent to Gemma/Qwen (default: 896 for Gemma, none for Qwen)')
+    parser.add_argument('--upload-token-budget', type=int, default=None,
+                      help='Image tokens sent to Gemma/Qwen, for patch-based models (default: 1280 for Qwen)')
+    parser.add_argument('--upload-format', type=str, choices=['auto', 'png', 'jpeg'], default='auto',
+                      help='Image format sent to Gemma/Qwen; auto picks JPEG for rendered scenes, PNG for flat UI')
+    parser.add_argument('--no-prompt-cache', action='store_true',
+                      help='Do not send llama.cpp prompt-cache hints (cache_prompt) with LLM requests')
+    parser.add_argument('--model-slot', type=int, default=None,
+                      help='llama.cpp server slot to pin LLM requests to, so the cached system prompt is reused')
+    parser.add_argument('--no-stream', action='store_true',
+                      help='Wait for complete LLM responses instead of streaming and stopping once the targets are found')
     parser.add_argument('--max-iterations', type=int, default=50,
                       help='Maximum number of iterations before terminating')
+    parser.add_argument('--detection-cache-size', type=int, default=32,
+                      help='Number of detections kept in the screenshot hash cache (0 disables the cache)')
+    parser.add_argument('--detection-cache-distance', type=int, default=4,
+                      help='Maximum Hamming distance for two screenshots to reuse a cached detection')
+    parser.add_argument('--screenshot-format', type=str, choices=['png', 'jpeg', 'webp'], default='png',
+                      help='Screenshot transport format requested from the SUT (default: png)')
+    parser.add_argument('--screenshot-quality', type=int, default=85,
+                      help='Quality for jpeg/webp screenshots (1-100, default: 85)')
+    parser.add_argument('--screenshot-scale', type=float, default=1.0,
+                      help='Downscale factor applied on the SUT before sending (detections are mapped back to native resolution)')
+    parser.add_argument('--channel-port', type=int, default=None,
+                      help='SUT control channel port (defaults to the port advertised by the SUT)')
+    parser.add_argument('--no-channel', action='store_true',
+                      help='Use plain HTTP requests instead of the persistent control channel')
+    parser.add_argument('--wait-for-settle', action='store_true',
+                      help='Wait for the SUT screen to change and settle (up to expected_delay) instead of sleeping')
+    parser.add_argument('--archive-queue-size', type=int, default=64,
+                      help='Maximum number of screenshots/annotations waiting to be written to disk')
+    parser.add_argument('--archive-policy', type=str, choices=['block', 'drop_oldest', 'drop_newest'],
+                      default='block',
+                      help='What to do when the archive queue is full (default: block)')
+    parser.add_argument('--screen-index-dir', type=str, default='screen_index',
+                      help='Directory for the per-game index of confirmed screens (default: screen_index)')
+    parser.add_argument('--screen-index', action='store_true',
+                      help='Recognise screens confirmed in earlier runs from the index instead of calling the vision model')
     
     return parser.parse_args()
 
@@ -203,22 +258,73 @@ def main():
     
     # Initialize components
     try:
-        network = NetworkManager(args.sut_ip, args.sut_port)
+        configure_archive_writer(args.archive_queue_size, args.archive_policy)
+        network = NetworkManager(args.sut_ip, args.sut_port,
+                                 screenshot_format=args.screenshot_format,
+                                 screenshot_quality=args.screenshot_quality,
+                                 screenshot_scale=args.screenshot_scale,
+                                 use_channel=not args.no_channel,
+                                 channel_port=args.channel_port)
         screenshot_mgr = ScreenshotManager(network)
         
+        # Frames are shrunk to what the LLM backend actually sees before upload
+        def upload_preprocessor(backend):
+            return ImagePreprocessor.for_backend(backend, max_side=args.upload_max_side,
+                                                 token_budget=args.upload_token_budget,
+                                                 image_format=args.upload_format)
+        
+        llm_options = {"stream": not args.no_stream, "cache_prompt": not args.no_prompt_cache,
+                       "slot_id": args.model_slot}
+        
         # Initialize the vision model based on user selection
         if args.vision_model == 'gemma':
             logger.info("Using Gemma for UI detection")
-            vision_model = GemmaClient(args.model_url)
+            vision_model = GemmaClient(args.model_url, preprocessor=upload_preprocessor('gemma'), **llm_options)
         elif args.vision_model == 'qwen':
             logger.info("Using Qwen VL for UI detection")
-            vision_model = QwenClient(args.model_url)
+            vision_model = QwenClient(args.model_url, preprocessor=upload_preprocessor('qwen'), **llm_options)
         elif args.vision_model == 'omniparser':
             logger.info("Using Omniparser for UI detection")
             vision_model = OmniparserClient(args.model_url)
+        elif args.vision_model in ('ensemble', 'cascade'):
+            def create_member(name):
+                if name == 'gemma':
+                    return GemmaClient(args.model_url, preprocessor=upload_preprocessor('gemma'), **llm_options)
+                elif name == 'qwen':
+                    return QwenClient(args.model_url, preprocessor=upload_preprocessor('qwen'), **llm_options)
+                elif name == 'omniparser':
+                    return OmniparserClient(args.omniparser_url)
+                elif name == 'template' and args.vision_model == 'cascade':
+                    template_dir = config_parser.get_config().get("enhanced_features", {}).get("template_dir", "templates")
+                    if not os.path.isabs(template_dir):
+                        template_dir = os.path.join(os.path.dirname(os.path.abspath(config_path)), template_dir)
+                    return TemplateVisionClient(TemplateMatcher(template_dir))
+                raise ValueError(f"Unknown {args.vision_model} model: {name}")
+            
+            if args.vision_model == 'ensemble':
+                members = [create_member(name.strip().lower()) for name in args.ensemble_models.split(',')]
+                logger.info(f"Using ensemble of {args.ensemble_models} for UI detection")
+                vision_model = EnsembleVisionClient(members)
+            else:
+                tiers = [(name.strip().lower(), create_member(name.strip().lower()))
+                         for name in args.cascade_tiers.split(',')]
+                logger.info(f"Using detection cascade {args.cascade_tiers} for UI detection")
+                vision_model = CascadeVisionClient(tiers)
+        
+        # Skip model round-trips when the screen has not changed
+        if args.detection_cache_size > 0:
+            vision_model = CachedVisionClient(
+                vision_model,
+                DetectionCache(max_entries=args.detection_cache_size,
+                               max_distance=args.detection_cache_distance)
+            )
         
         annotator = Annotator()
         decision_engine = DecisionEngine(config_parser.get_config())
+        pixel_probe = PixelProbe(network, screenshot_mgr)
+        
+        # Screens confirmed in earlier runs are recognised without a model call
+        screen_index = ScreenIndex.for_game(game_name, args.screen_index_dir) if args.screen_index else None
         game_launcher = GameLauncher(network)
         
         # Extract benchmark metadata
@@ -228,6 +334,11 @@ def main():
         
         # Main execution loop
         iteration = 0
+        settle_by_default = (args.wait_for_settle or
+                             config_parser.get_config().get("enhanced_features", {}).get("wait_for_screen_settle", False))
+        pixel_poll_interval = config_parser.get_config().get("enhanced_features", {}).get("pixel_poll_interval", 0.1)
+        locate_mode = config_parser.get_config().get("enhanced_features", {}).get("locate_mode", True)
+        pixel_checks = decision_engine.get_pixel_checks()
         current_state = "initial"
         target_state = decision_engine.get_target_state()
         
@@ -240,6 +351,9 @@ def main():
             logger.info(f"Launching game from: {args.game_path}")
             game_launcher.launch(args.game_path)
             
+            # Load the vision model while the game starts instead of on the first detection
+            vision_model.warm_up_async()
+            
             # Get startup wait time from config or use default
             startup_wait = game_metadata.get("startup_wait", 30)
             logger.info(f"Waiting {startup_wait} seconds for game to fully initialize...")
@@ -271,26 +385,72 @@ def main():
                     state_start_time = time.time()
                     continue
                     
-                # Capture screenshot - USE RUN DIRECTORY
-                screenshot_path = f"{dirs['screenshots_dir']}/screenshot_{iteration}.png"
-                screenshot_mgr.capture(screenshot_path)
-                logger.info(f"Screenshot captured: {screenshot_path}")
+                # Sample the pixels behind all states' pixel_checks (a few bytes, no image)
+                pixel_samples = pixel_probe.sample(pixel_checks) if pixel_checks else None
                 
-                # Process with vision model
-                bounding_boxes = vision_model.detect_ui_elements(screenshot_path)
-                logger.info(f"Detected {len(bounding_boxes)} UI elements")
+                if decision_engine.needs_vision(current_state):
+                    # Capture screenshot - USE RUN DIRECTORY
+                    screenshot_path = f"{dirs['screenshots_dir']}/screenshot_{iteration}.png"
+                    frame = screenshot_mgr.capture_for(screenshot_path, decision_engine.get_capture_region(current_state))
+                    logger.info(f"Screenshot captured: {screenshot_path}")
+                    
+                    # Process with vision model, unless the screen is a confirmed one from an earlier run
+                    index_match = screen_index.lookup(frame) if screen_index else None
+                    if index_match and not decision_engine.detection_sufficient(current_state, index_match.bounding_boxes):
+                        # The stored detection can't show a popup over a known screen, so states that
+                        # exclude elements (and screens without the click target) still go to the model
+                        logger.info(f"Screen index match {index_match.label} is not enough to act on - using the vision model")
+                        index_match = None
+                    if index_match:
+                        bounding_boxes = index_match.bounding_boxes
+                        logger.info(f"Recognised screen as {index_match.label} from the screen index "
+                                    f"(distance {index_match.distance}) - skipping vision model")
+                    elif getattr(vision_model, "accepts_tiers", False):
+                        # Cascade: stop at the cheapest tier that identifies the state and finds the click target
+                        bounding_boxes = vision_model.detect_ui_elements(
+                            frame,
+                            targets=decision_engine.get_expected_elements(current_state),
+                            accept=lambda boxes: decision_engine.detection_sufficient(current_state, boxes),
+                            tiers=decision_engine.get_vision_tiers(current_state)
+                        )
+                        logger.info(f"Detected {len(bounding_boxes)} UI elements")
+                    elif getattr(vision_model, "accepts_targets", False):
+                        # Streaming LLMs and ensembles can stop once the state and click target are found
+                        bounding_boxes = vision_model.detect_ui_elements(
+                            frame,
+                            targets=decision_engine.get_expected_elements(current_state),
+                            accept=lambda boxes: decision_engine.detection_sufficient(current_state, boxes)
+                        )
+                        logger.info(f"Detected {len(bounding_boxes)} UI elements")
+                    else:
+                        bounding_boxes = vision_model.detect_ui_elements(frame)
+                        logger.info(f"Detected {len(bounding_boxes)} UI elements")
+                    
+                    # Annotate screenshot - USE RUN DIRECTORY
+                    annotated_path = f"{dirs['annotated_dir']}/annotated_{iteration}.png"
+                    annotator.draw_bounding_boxes(frame, bounding_boxes, annotated_path)
+                    logger.info(f"Annotated screenshot saved: {annotated_path}")
+                else:
+                    logger.info(f"States around {current_state} are decided by pixel checks, skipping screenshot")
+                    frame, index_match = None, None
+                    bounding_boxes = BoxSet()
                 
-                # Annotate screenshot - USE RUN DIRECTORY
-                annotated_path = f"{dirs['annotated_dir']}/annotated_{iteration}.png"
-                annotator.draw_bounding_boxes(screenshot_path, bounding_boxes, annotated_path)
-                logger.info(f"Annotated screenshot saved: {annotated_path}")
+                # A click target the detection missed can be located on this frame directly
+                if frame is not None and locate_mode and hasattr(vision_model, "locate"):
+                    decision_engine.locator = lambda target, frame=frame: vision_model.locate(frame, target)
+                else:
+                    decision_engine.locator = None
                 
                 # Determine next action
                 previous_state = current_state
                 next_action, new_state = decision_engine.determine_next_action(
-                    current_state, bounding_boxes
+                    current_state, bounding_boxes, pixel_samples
                 )
                 
+                # Grow the screen index from fresh detections the engine confirmed
+                if screen_index and frame is not None and not index_match and decision_engine.confirmed_state:
+                    screen_index.add(frame, decision_engine.confirmed_state, bounding_boxes)
+                
                 # Format the action for better logging
                 action_str = ""
                 if next_action:
@@ -305,6 +465,12 @@ def main():
                 
                 logger.info(f"Next action: {action_str}, transitioning to state: {new_state}")
                 
+                # Remember the screen before acting so we can wait for it to change and settle
+                planned_transition = config_parser.get_config().get("transitions", {}).get(f"{current_state}->{new_state}", {})
+                wait_for_settle = (planned_transition.get("wait_for_settle", settle_by_default)
+                                   and bool(next_action) and next_action.get("type") != "wait")
+                reference_hash = screenshot_mgr.get_screen_hash() if wait_for_settle else None
+                
                 # Execute action
                 if next_action:
                     logger.info(f"Executing action: {action_str}")
@@ -312,13 +478,23 @@ def main():
                     # Handle "wait" actions locally instead of sending to SUT
                     if next_action.get("type") == "wait":
                         duration = next_action.get("duration", 1)
-                        logger.info(f"Waiting for {duration} seconds...")
-                        
-                        # Simple wait for main.py (no interruption check needed)
-                        for i in range(duration):
-                            time.sleep(1)
-                            if i % 10 == 0 and i > 0:  # Log every 10 seconds for long waits
-                                logger.info(f"Still waiting... {i}/{duration} seconds elapsed")
+                        arrival_checks = decision_engine.get_pixel_checks(new_state)
+                        if arrival_checks:
+                            # End the wait as soon as the next state's pixels show up
+                            logger.info(f"Waiting up to {duration} seconds for {new_state} pixel checks...")
+                            wait_start = time.time()
+                            if pixel_probe.wait_for(arrival_checks, duration, pixel_poll_interval):
+                                logger.info(f"Pixel checks for {new_state} passed after {time.time() - wait_start:.1f}s")
+                            else:
+                                logger.info(f"Pixel checks for {new_state} did not pass within {duration}s")
+                        else:
+                            logger.info(f"Waiting for {duration} seconds...")
+                            
+                            # Simple wait for main.py (no interruption check needed)
+                            for i in range(duration):
+                                time.sleep(1)
+                                if i % 10 == 0 and i > 0:  # Log every 10 seconds for long waits
+                                    logger.info(f"Still waiting... {i}/{duration} seconds elapsed")
                                 
                         logger.info(f"Wait completed")
                     else:
@@ -339,7 +515,10 @@ def main():
                 transition = config_parser.get_config().get("transitions", {}).get(transition_key, {})
                 delay = transition.get("expected_delay", 1)
                 
-                time.sleep(delay)  # Wait before next iteration
+                if wait_for_settle:
+                    screenshot_mgr.wait_for_settle(delay, reference_hash)
+                else:
+                    time.sleep(delay)  # Wait before next iteration
             
             # Check if we reached the target state
             if current_state == target_state:
@@ -357,7 +536,11 @@ def main():
         finally:
             # Cleanup
             logger.info("Cleaning up resources")
+            screenshot_mgr.close()
             network.close()
+            if screen_index:
+                screen_index.save()
+                screen_index.log_stats()
             if hasattr(vision_model, 'close'):
                 vision_model.close()
             logger.info("Execution completed")
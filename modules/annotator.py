@@ -5,27 +5,31 @@ Annotator module for visualizing detected UI elements on screenshots.
 import os
 import logging
 import random
-from typing import List
+from typing import List, Union
 from PIL import Image, ImageDraw, ImageFont
 import colorsys
 
 from modules.gemma_client import BoundingBox
+from modules.frame import Frame
+from modules.archive_writer import ArchiveWriter, get_archive_writer
 
 logger = logging.getLogger(__name__)
 
 class Annotator:
     """Handles drawing bounding boxes on screenshots."""
     
-    def __init__(self, font_path: str = None, font_size: int = 14):
+    def __init__(self, font_path: str = None, font_size: int = 14, archive_writer: ArchiveWriter = None):
         """
         Initialize the annotator.
         
         Args:
             font_path: Path to a TrueType font file (optional)
             font_size: Font size for labels
+            archive_writer: Background writer for annotated images (defaults to the shared one)
         """
         self.font_size = font_size
         self.font = None
+        self.archive_writer = archive_writer or get_archive_writer()
         
         # Try to load font if provided
         if font_path and os.path.exists(font_path):
@@ -93,12 +97,12 @@ class Annotator:
         # As a last resort, remove any remaining non-ASCII characters
         return ''.join(c for c in text if ord(c) < 128)
     
-    def draw_bounding_boxes(self, image_path: str, bboxes: List[BoundingBox], output_path: str) -> bool:
+    def draw_bounding_boxes(self, image: Union[Frame, str], bboxes: List[BoundingBox], output_path: str) -> bool:
         """
-        Draw bounding boxes on an image and save the result.
+        Draw bounding boxes on an image and queue the result to be saved.
         
         Args:
-            image_path: Path to the original screenshot
+            image: Frame or path of the original screenshot
             bboxes: List of BoundingBox objects to draw
             output_path: Path to save the annotated image
         
@@ -109,11 +113,10 @@ class Annotator:
             IOError: If there's an error processing or saving the image
         """
         try:
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # Open the image
-            image = Image.open(image_path)
+            # Draw on a copy so the frame's decoded image stays clean for other consumers
+            frame = Frame.coerce(image)
+            image = frame.image.convert("RGB")
+            bboxes = frame.map_boxes_to_image(bboxes)
             draw = ImageDraw.Draw(image)
             
             # Get unique element types for color assignment
@@ -159,9 +162,9 @@ class Annotator:
                     # Fallback to a very simple label if text rendering fails
                     draw.rectangle([x1, y1 - 15, x1 + 40, y1], fill=color)
             
-            # Save the annotated image
-            image.save(output_path)
-            logger.info(f"Annotated image saved to {output_path}")
+            # Encoding and saving happen on the archive writer thread
+            self.archive_writer.write_image(output_path, image)
+            logger.info(f"Annotated image queued for {output_path}")
             return True
             
         except Exception as e:
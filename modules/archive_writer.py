@@ -0,0 +1,245 @@
+"""
+Background writer for run artifacts (screenshots, annotated images, JSON dumps).
+Keeps disk I/O off the automation thread using a bounded queue with a
+configurable backpressure/drop policy.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ArchiveWriter:
+    """Writes files on a background thread from a bounded queue."""
+
+    POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(self, max_queue: int = 64, policy: str = "block"):
+        """
+        Initialize the archive writer.
+
+        Args:
+            max_queue: Maximum number of pending writes
+            policy: What to do when the queue is full:
+                    "block" waits for room (backpressure on the caller),
+                    "drop_oldest" discards the oldest pending write,
+                    "drop_newest" discards the write being submitted
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown archive policy '{policy}', expected one of {self.POLICIES}")
+
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._in_progress = 0
+        self._thread = None
+        self._closing = False
+
+        # Metrics
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_write_seconds = 0.0
+        self.max_write_seconds = 0.0
+
+        logger.info(f"ArchiveWriter initialized (max_queue: {self.max_queue}, policy: {policy})")
+
+    def submit(self, path: str, write_fn: Callable[[str], None]) -> bool:
+        """
+        Queue a write.
+
+        Args:
+            path: Destination file path (parent directories are created)
+            write_fn: Callable that writes the file given its path
+
+        Returns:
+            True if the write was queued, False if it was dropped
+        """
+        with self._condition:
+            self._ensure_thread()
+            self.submitted += 1
+
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    logger.warning(f"Archive queue full, dropping write of {path}")
+                    return False
+                elif self.policy == "drop_oldest":
+                    dropped_path, _ = self._queue.popleft()
+                    self.dropped += 1
+                    logger.warning(f"Archive queue full, dropping pending write of {dropped_path}")
+                else:
+                    while len(self._queue) >= self.max_queue:
+                        self._condition.wait()
+
+            self._queue.append((path, write_fn))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._condition.notify_all()
+            return True
+
+    def write_bytes(self, path: str, data: bytes) -> bool:
+        """Queue raw bytes to be written to a file."""
+        def write(target):
+            with open(target, "wb") as f:
+                f.write(data)
+        return self.submit(path, write)
+
+    def write_json(self, path: str, obj: Any) -> bool:
+        """Queue a JSON-serializable object to be written to a file."""
+        def write(target):
+            with open(target, "w", encoding="utf-8") as f:
+                json.dump(obj, f, indent=2)
+        return self.submit(path, write)
+
+    def write_image(self, path: str, image) -> bool:
+        """Queue a PIL image to be encoded and saved (encoding also happens off-thread)."""
+        return self.submit(path, image.save)
+
+    def _ensure_thread(self):
+        """Start the writer thread if it is not running (caller holds the lock)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="ArchiveWriter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Writer thread main loop."""
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                path, write_fn = self._queue.popleft()
+                self._in_progress += 1
+                self._condition.notify_all()
+
+            start_time = time.time()
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                write_fn(path)
+                succeeded = True
+                logger.debug(f"Archived {path}")
+            except Exception as e:
+                succeeded = False
+                logger.error(f"Failed to write {path}: {str(e)}")
+            elapsed = time.time() - start_time
+
+            with self._condition:
+                self._in_progress -= 1
+                if succeeded:
+                    self.written += 1
+                    self.total_write_seconds += elapsed
+                    self.max_write_seconds = max(self.max_write_seconds, elapsed)
+                else:
+                    self.failed += 1
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued writes have completed.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the queue drained, False on timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._queue or self._in_progress:
+                if self._thread is None or not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Archive flush timed out with {len(self._queue)} writes pending")
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Flush pending writes, stop the writer thread and log metrics.
+        The writer restarts automatically if used again.
+
+        Args:
+            timeout: Maximum seconds to wait for pending writes
+        """
+        self.flush(timeout)
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.log_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get writer metrics.
+
+        Returns:
+            Dictionary with queue depth, counters and write latency
+        """
+        with self._condition:
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_depth,
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "avg_write_seconds": self.total_write_seconds / self.written if self.written else 0.0,
+                "max_write_seconds": self.max_write_seconds
+            }
+
+    def log_stats(self):
+        """Log writer metrics in a readable format."""
+        stats = self.get_stats()
+        logger.info(f"Archive writer: {stats['written']} written, {stats['dropped']} dropped, "
+                    f"{stats['failed']} failed, max queue depth {stats['max_queue_depth']}, "
+                    f"avg write {stats['avg_write_seconds'] * 1000:.1f}ms "
+                    f"(max {stats['max_write_seconds'] * 1000:.1f}ms)")
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+def get_archive_writer() -> ArchiveWriter:
+    """Get the process-wide archive writer shared by the screenshot, annotation and Omniparser code."""
+    global _default_writer
+    with _default_lock:
+        if _default_writer is None:
+            _default_writer = ArchiveWriter()
+        return _default_writer
+
+def configure_archive_writer(max_queue: int = 64, policy: str = "block") -> ArchiveWriter:
+    """
+    Replace the shared archive writer with one using the given settings.
+
+    Args:
+        max_queue: Maximum number of pending writes
+        policy: Queue-full policy ("block", "drop_oldest" or "drop_newest")
+
+    Returns:
+        The new shared ArchiveWriter
+    """
+    global _default_writer
+    with _default_lock:
+        if _default_writer is not None:
+            _default_writer.close()
+        _default_writer = ArchiveWriter(max_queue, policy)
+        return _default_writer
@@ -0,0 +1,278 @@
+"""
+Columnar container for detected UI elements.
+Keeps coordinates and confidences in NumPy arrays (with interned type and
+text columns) so filtering, hit-testing, de-duplication and region queries
+run vectorized, while still behaving like a list of BoundingBox objects.
+"""
+
+import sys
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BoundingBox:
+    """Represents a UI element's bounding box."""
+    x: int
+    y: int
+    width: int
+    height: int
+    confidence: float
+    element_type: str
+    element_text: str = ""
+
+class BoxSet(Sequence):
+    """Immutable set of UI elements stored column-wise; iterates as BoundingBox."""
+
+    def __init__(self, x=(), y=(), width=(), height=(), confidence=(),
+                 element_types: Iterable[str] = (), element_texts: Iterable[str] = ()):
+        """
+        Initialize from columns.
+
+        Args:
+            x, y, width, height: Box coordinates in pixels
+            confidence: Detection confidences
+            element_types: Element type per box
+            element_texts: Element text per box
+        """
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.width = np.asarray(width, dtype=np.int32)
+        self.height = np.asarray(height, dtype=np.int32)
+        self.confidence = np.asarray(confidence, dtype=np.float64)
+
+        # Types come from a small vocabulary, so store codes into a shared list
+        self.types: List[str] = []
+        codes = {}
+        type_codes = []
+        for element_type in element_types:
+            code = codes.get(element_type)
+            if code is None:
+                code = codes[element_type] = len(self.types)
+                self.types.append(element_type)
+            type_codes.append(code)
+        self.type_codes = np.asarray(type_codes, dtype=np.int32)
+        self.texts: List[str] = [sys.intern(text or "") for text in element_texts]
+
+        if not (len(self.x) == len(self.y) == len(self.width) == len(self.height) ==
+                len(self.confidence) == len(self.type_codes) == len(self.texts)):
+            raise ValueError("BoxSet columns must all have the same length")
+
+        self._boxes: List[Optional[BoundingBox]] = [None] * len(self.texts)
+
+    @classmethod
+    def from_boxes(cls, boxes: Iterable[BoundingBox]) -> 'BoxSet':
+        """
+        Build a BoxSet from BoundingBox objects (a BoxSet is returned unchanged).
+
+        Args:
+            boxes: BoundingBox objects
+
+        Returns:
+            BoxSet with the same elements in the same order
+        """
+        if isinstance(boxes, BoxSet):
+            return boxes
+        boxes = list(boxes)
+        return cls([b.x for b in boxes], [b.y for b in boxes], [b.width for b in boxes],
+                   [b.height for b in boxes], [b.confidence for b in boxes],
+                   [b.element_type for b in boxes], [b.element_text for b in boxes])
+
+    def _take(self, indices) -> 'BoxSet':
+        """New BoxSet with the elements at the given indices (or boolean mask)."""
+        indices = np.flatnonzero(indices) if np.asarray(indices).dtype == bool else np.asarray(indices, dtype=np.intp)
+        subset = BoxSet.__new__(BoxSet)
+        subset.x = self.x[indices]
+        subset.y = self.y[indices]
+        subset.width = self.width[indices]
+        subset.height = self.height[indices]
+        subset.confidence = self.confidence[indices]
+        subset.types = self.types
+        subset.type_codes = self.type_codes[indices]
+        subset.texts = [self.texts[i] for i in indices]
+        subset._boxes = [self._boxes[i] for i in indices]
+        return subset
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._take(np.arange(len(self))[index])
+        if index < 0:
+            index += len(self)
+        box = self._boxes[index]
+        if box is None:
+            # Materialize once so repeated access returns the same object
+            box = BoundingBox(
+                x=int(self.x[index]),
+                y=int(self.y[index]),
+                width=int(self.width[index]),
+                height=int(self.height[index]),
+                confidence=float(self.confidence[index]),
+                element_type=self.types[self.type_codes[index]],
+                element_text=self.texts[index]
+            )
+            self._boxes[index] = box
+        return box
+
+    def __repr__(self) -> str:
+        return f"BoxSet({len(self)} elements)"
+
+    @property
+    def element_types(self) -> List[str]:
+        """Element type of every box."""
+        return [self.types[code] for code in self.type_codes]
+
+    @property
+    def centers(self) -> np.ndarray:
+        """(N, 2) array of box centers."""
+        return np.stack([self.x + self.width / 2, self.y + self.height / 2], axis=1)
+
+    def filter(self, element_type: Optional[str] = None, min_confidence: Optional[float] = None,
+               region: Optional[Tuple[int, int, int, int]] = None) -> 'BoxSet':
+        """
+        Select boxes by type, confidence and region.
+
+        Args:
+            element_type: Keep only this type ("any" or None keeps all)
+            min_confidence: Keep boxes at or above this confidence
+            region: Keep boxes whose center lies in (x, y, width, height)
+
+        Returns:
+            Filtered BoxSet
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if element_type and element_type != "any":
+            code = self.types.index(element_type) if element_type in self.types else -1
+            mask &= self.type_codes == code
+        if min_confidence is not None:
+            mask &= self.confidence >= min_confidence
+        if region is not None:
+            mask &= self.in_region_mask(region)
+        return self._take(mask)
+
+    def in_region_mask(self, region: Tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Boolean mask of boxes whose center lies inside a region (same rule as box_in_region).
+
+        Args:
+            region: (x, y, width, height)
+
+        Returns:
+            Boolean array
+        """
+        region_x, region_y, region_width, region_height = region
+        centers = self.centers
+        return ((centers[:, 0] >= region_x) & (centers[:, 0] <= region_x + region_width) &
+                (centers[:, 1] >= region_y) & (centers[:, 1] <= region_y + region_height))
+
+    def in_region(self, region: Tuple[int, int, int, int]) -> 'BoxSet':
+        """Boxes whose center lies inside a region."""
+        return self._take(self.in_region_mask(region))
+
+    def containing_point(self, x: float, y: float) -> 'BoxSet':
+        """
+        Boxes that contain a point, smallest first (the most specific element under the cursor).
+
+        Args:
+            x: Screen x coordinate
+            y: Screen y coordinate
+
+        Returns:
+            BoxSet of boxes containing the point
+        """
+        mask = (self.x <= x) & (x <= self.x + self.width) & (self.y <= y) & (y <= self.y + self.height)
+        indices = np.flatnonzero(mask)
+        areas = self.width[indices].astype(np.int64) * self.height[indices]
+        return self._take(indices[np.argsort(areas, kind="stable")])
+
+    def nearest(self, x: float, y: float, k: int = 1) -> 'BoxSet':
+        """
+        The k boxes whose centers are closest to a point.
+
+        Args:
+            x: Screen x coordinate
+            y: Screen y coordinate
+            k: Number of boxes to return
+
+        Returns:
+            BoxSet ordered by distance
+        """
+        if not len(self):
+            return self
+        distances = np.hypot(*(self.centers - np.array([x, y])).T)
+        return self._take(np.argsort(distances, kind="stable")[:k])
+
+    def iou_matrix(self, other: Optional['BoxSet'] = None) -> np.ndarray:
+        """
+        Pairwise intersection-over-union.
+
+        Args:
+            other: Second BoxSet (defaults to self)
+
+        Returns:
+            (len(self), len(other)) array of IoU values
+        """
+        other = self if other is None else other
+        left = np.maximum(self.x[:, None], other.x[None, :])
+        top = np.maximum(self.y[:, None], other.y[None, :])
+        right = np.minimum((self.x + self.width)[:, None], (other.x + other.width)[None, :])
+        bottom = np.minimum((self.y + self.height)[:, None], (other.y + other.height)[None, :])
+        intersection = np.clip(right - left, 0, None).astype(np.float64) * np.clip(bottom - top, 0, None)
+        area_self = self.width.astype(np.float64) * self.height
+        area_other = other.width.astype(np.float64) * other.height
+        union = area_self[:, None] + area_other[None, :] - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    def deduplicate(self, iou_threshold: float = 0.7) -> 'BoxSet':
+        """
+        Drop boxes overlapping a higher-confidence box of the same text (non-maximum suppression).
+
+        Args:
+            iou_threshold: Overlap above which two boxes count as duplicates
+
+        Returns:
+            BoxSet without duplicates, in the original order
+        """
+        if len(self) < 2:
+            return self
+        overlaps = self.iou_matrix() > iou_threshold
+        order = np.argsort(-self.confidence, kind="stable")
+        keep = np.ones(len(self), dtype=bool)
+        for index in order:
+            if not keep[index]:
+                continue
+            duplicates = np.flatnonzero(overlaps[index] & keep)
+            for other in duplicates:
+                if other != index and self.texts[other].lower() == self.texts[index].lower():
+                    keep[other] = False
+        removed = len(self) - int(keep.sum())
+        if removed:
+            logger.debug(f"Removed {removed} duplicate UI elements")
+        return self._take(keep)
+
+    def transform(self, factor: float, shift_x: float = 0, shift_y: float = 0) -> 'BoxSet':
+        """
+        Scale and shift all boxes (used to map between image and screen coordinates).
+
+        Args:
+            factor: Scale applied to coordinates and sizes
+            shift_x: Added to x after scaling
+            shift_y: Added to y after scaling
+
+        Returns:
+            Transformed BoxSet
+        """
+        transformed = self._take(np.arange(len(self)))
+        transformed.x = np.rint(self.x * factor + shift_x).astype(np.int32)
+        transformed.y = np.rint(self.y * factor + shift_y).astype(np.int32)
+        transformed.width = np.rint(self.width * factor).astype(np.int32)
+        transformed.height = np.rint(self.height * factor).astype(np.int32)
+        transformed._boxes = [None] * len(self)
+        return transformed
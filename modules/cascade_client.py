@@ -0,0 +1,163 @@
+"""
+Tiered detection cascade.
+Tries vision clients from cheapest to most capable (local template matching,
+then Omniparser, then an LLM) and stops at the first tier whose result
+satisfies the step's selectors, so easy screens never pay for the big model.
+"""
+
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from modules.gemma_client import BoundingBox
+from modules.frame import Frame
+from modules.vision_client import VisionClient
+from modules.element_matcher import count_satisfied, targets_satisfied
+
+logger = logging.getLogger(__name__)
+
+class CascadeVisionClient(VisionClient):
+    """Runs vision clients one after another until one result is good enough."""
+
+    # Lets the runners pass the elements they are looking for and per-step tier overrides
+    accepts_targets = True
+    accepts_tiers = True
+
+    def __init__(self, tiers: List[Tuple[str, VisionClient]]):
+        """
+        Initialize the cascade.
+
+        Args:
+            tiers: (name, client) pairs, cheapest first
+
+        Raises:
+            ValueError: If no tiers are given or a name is repeated
+        """
+        if not tiers:
+            raise ValueError("CascadeVisionClient needs at least one tier")
+        names = [name for name, _ in tiers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate cascade tier names: {names}")
+        self.tiers = tiers
+        self.stats: Dict[str, Dict[str, float]] = {
+            name: {"calls": 0, "hits": 0, "errors": 0, "seconds": 0.0} for name in names
+        }
+        self.requests = 0
+        logger.info(f"CascadeVisionClient initialized with tiers: {' -> '.join(names)}")
+
+    def _select_tiers(self, tiers: Optional[List[str]]) -> List[Tuple[str, VisionClient]]:
+        """Tiers to run for one request (an override lists names in the order to try)."""
+        if not tiers:
+            return self.tiers
+        by_name = dict(self.tiers)
+        selected = [(name, by_name[name]) for name in tiers if name in by_name]
+        unknown = [name for name in tiers if name not in by_name]
+        if unknown:
+            logger.warning(f"Ignoring unknown cascade tiers {unknown} (available: {list(by_name)})")
+        return selected or self.tiers
+
+    def detect_ui_elements(self, image: Union[Frame, str], targets: List[Dict[str, Any]] = None,
+                           accept: Callable[[List[BoundingBox]], bool] = None,
+                           tiers: Optional[List[str]] = None) -> List[BoundingBox]:
+        """
+        Run the tiers in order and return the first acceptable result.
+
+        A result is acceptable if it matches all targets (or satisfies accept);
+        without either, the first non-empty result wins. If no tier produces an
+        acceptable result, the one matching the most targets is returned.
+
+        Args:
+            image: Frame or path of the screenshot image
+            targets: Element definitions the caller is looking for
+            accept: Custom predicate over the detected elements
+            tiers: Tier names to try instead of the configured order
+
+        Returns:
+            List of detected UI elements with bounding boxes
+
+        Raises:
+            RuntimeError: If every tier failed
+        """
+        frame = Frame.coerce(image)
+        if accept is None:
+            if targets:
+                accept = lambda boxes: targets_satisfied(targets, boxes)
+            else:
+                accept = lambda boxes: len(boxes) > 0
+
+        self.requests += 1
+        results = []
+        errors = []
+        for name, client in self._select_tiers(tiers):
+            stats = self.stats[name]
+            stats["calls"] += 1
+            start_time = time.time()
+            try:
+                if targets and getattr(client, "accepts_targets", False):
+                    boxes = client.detect_ui_elements(frame, targets=targets)
+                else:
+                    boxes = client.detect_ui_elements(frame)
+            except Exception as e:
+                stats["errors"] += 1
+                stats["seconds"] += time.time() - start_time
+                logger.warning(f"Cascade tier {name} failed: {str(e)}")
+                errors.append(f"{name}: {str(e)}")
+                continue
+            elapsed = time.time() - start_time
+            stats["seconds"] += elapsed
+
+            results.append((name, boxes))
+            if accept(boxes):
+                stats["hits"] += 1
+                logger.info(f"Cascade: tier {name} satisfied the request ({len(boxes)} elements, {elapsed:.2f}s)")
+                return boxes
+            logger.info(f"Cascade: tier {name} was not enough ({len(boxes)} elements, {elapsed:.2f}s)")
+
+        if not results:
+            raise RuntimeError(f"All cascade tiers failed: {errors}")
+
+        # No tier satisfied the criteria - return the closest result
+        name, boxes = max(results, key=lambda r: (count_satisfied(targets or [], r[1]), len(r[1])))
+        logger.info(f"Cascade: no tier satisfied the request, using {name} ({len(boxes)} elements)")
+        return boxes
+
+    def warm_up(self):
+        """Warm up all tiers concurrently."""
+        for future in [client.warm_up_async() for _, client in self.tiers]:
+            future.result()
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-tier counters.
+
+        Returns:
+            Dictionary per tier with calls, hits, errors, hit_rate (hits per call),
+            share (hits per request) and avg_seconds
+        """
+        breakdown = {}
+        for name, stats in self.stats.items():
+            calls = stats["calls"]
+            breakdown[name] = {
+                "calls": calls,
+                "hits": stats["hits"],
+                "errors": stats["errors"],
+                "hit_rate": stats["hits"] / calls if calls else 0.0,
+                "share": stats["hits"] / self.requests if self.requests else 0.0,
+                "avg_seconds": stats["seconds"] / calls if calls else 0.0
+            }
+        return breakdown
+
+    def log_stats(self):
+        """Log the latency and hit-rate breakdown per tier."""
+        logger.info(f"Cascade breakdown over {self.requests} requests:")
+        for name, stats in self.get_stats().items():
+            logger.info(f"  {name:<12} calls {stats['calls']:>4}  hits {stats['hits']:>4} "
+                        f"({stats['hit_rate']:.0%} of calls, {stats['share']:.0%} of requests)  "
+                        f"errors {stats['errors']:>3}  avg {stats['avg_seconds']:.2f}s")
+
+    def close(self):
+        """Log the per-tier breakdown and close all tiers."""
+        self.log_stats()
+        for _, client in self.tiers:
+            if hasattr(client, 'close'):
+                client.close()
@@ -0,0 +1,221 @@
+"""
+Persistent control channel to the SUT service.
+Multiplexes actions, screenshots and pushed events over one length-prefixed
+TCP connection, supports pipelined requests and reconnects with backoff.
+"""
+
+import json
+import time
+import random
+import socket
+import struct
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 8-byte header: JSON length and payload length, both big-endian uint32
+CHANNEL_HEADER = struct.Struct(">II")
+
+class ChannelSendError(ConnectionError):
+    """A request could not be written to the channel, so the SUT never received it."""
+
+class ControlChannel:
+    """Client side of the SUT control channel."""
+
+    def __init__(self, host: str, port: int, connect_timeout: float = 3.0,
+                 request_timeout: float = 15.0, max_backoff: float = 10.0):
+        """
+        Initialize the control channel and connect.
+
+        Args:
+            host: SUT IP address
+            port: Control channel port on the SUT
+            connect_timeout: Timeout for establishing the TCP connection
+            request_timeout: Default timeout for a request/response round-trip
+            max_backoff: Upper bound for the reconnect delay in seconds
+
+        Raises:
+            ConnectionError: If the first connection attempt fails
+        """
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.max_backoff = max_backoff
+
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._next_id = 1
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._connected = threading.Event()
+        self._closed = False
+        self.reconnects = 0
+
+        self._connect()
+        self._reader = threading.Thread(target=self._reader_loop, name="ControlChannelReader", daemon=True)
+        self._reader.start()
+
+    @property
+    def connected(self) -> bool:
+        """True while the TCP connection is up."""
+        return self._connected.is_set()
+
+    def add_event_listener(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """
+        Register a callback for events pushed by the SUT.
+
+        Args:
+            callback: Called as callback(event_name, data) on the reader thread
+        """
+        self._listeners.append(callback)
+
+    def request_async(self, op: str, params: Dict[str, Any] = None) -> Future:
+        """
+        Send a request without waiting for the response (pipelining).
+
+        Args:
+            op: Operation name (action, actions, screenshot, screen_hash, ping)
+            params: Operation parameters
+
+        Returns:
+            Future resolving to (response dict, payload bytes)
+
+        Raises:
+            ChannelSendError: If the channel is not connected or the request could not be written
+        """
+        if not self.connected:
+            raise ChannelSendError("Control channel is not connected")
+
+        future = Future()
+        with self._pending_lock:
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = future
+        future.request_id = request_id
+
+        body = json.dumps({"id": request_id, "op": op, "params": params or {}}).encode("utf-8")
+        try:
+            with self._send_lock:
+                self._sock.sendall(CHANNEL_HEADER.pack(len(body), 0) + body)
+        except OSError as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            self._handle_disconnect(e)
+            raise ChannelSendError(f"Control channel send failed: {str(e)}")
+        return future
+
+    def request(self, op: str, params: Dict[str, Any] = None,
+                timeout: Optional[float] = None) -> Tuple[Dict[str, Any], bytes]:
+        """
+        Send a request and wait for its response.
+
+        Args:
+            op: Operation name
+            params: Operation parameters
+            timeout: Seconds to wait (defaults to request_timeout)
+
+        Returns:
+            Tuple of (response dict, payload bytes)
+
+        Raises:
+            ChannelSendError: If the request could not be sent (safe to retry elsewhere)
+            ConnectionError: If the channel drops after the request was sent
+            TimeoutError: If no response arrives in time (the SUT may still run the request)
+        """
+        future = self.request_async(op, params)
+        try:
+            return future.result(timeout or self.request_timeout)
+        except FutureTimeoutError:
+            # Forget the request so a late response doesn't leave the future behind
+            with self._pending_lock:
+                self._pending.pop(future.request_id, None)
+            raise TimeoutError(f"Control channel request '{op}' timed out")
+
+    def _connect(self):
+        """Open the TCP connection."""
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(None)
+        self._sock = sock
+        self._connected.set()
+        logger.info(f"Control channel connected to {self.host}:{self.port}")
+
+    def _recv_exact(self, size: int) -> bytes:
+        chunks = []
+        while size > 0:
+            chunk = self._sock.recv(min(size, 1 << 20))
+            if not chunk:
+                raise ConnectionError("Control channel closed by SUT")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _reader_loop(self):
+        """Read responses and events; reconnect with jittered exponential backoff on failure."""
+        backoff = 0.5
+        while not self._closed:
+            if not self.connected:
+                try:
+                    self._connect()
+                    self.reconnects += 1
+                    backoff = 0.5
+                except OSError as e:
+                    delay = random.uniform(0, backoff)
+                    logger.debug(f"Control channel reconnect failed ({str(e)}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+
+            try:
+                json_length, payload_length = CHANNEL_HEADER.unpack(self._recv_exact(CHANNEL_HEADER.size))
+                message = json.loads(self._recv_exact(json_length).decode("utf-8"))
+                payload = self._recv_exact(payload_length) if payload_length else b""
+            except (OSError, ValueError) as e:
+                if not self._closed:
+                    self._handle_disconnect(e)
+                continue
+
+            if "event" in message:
+                self._dispatch_event(message["event"], message.get("data", {}))
+                continue
+
+            with self._pending_lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result((message, payload))
+
+    def _dispatch_event(self, event: str, data: Dict[str, Any]):
+        logger.debug(f"Control channel event: {event} {data}")
+        for callback in list(self._listeners):
+            try:
+                callback(event, data)
+            except Exception as e:
+                logger.warning(f"Control channel event listener failed: {str(e)}")
+
+    def _handle_disconnect(self, error: Exception):
+        """Mark the channel down and fail in-flight requests so callers can fall back."""
+        if not self._connected.is_set():
+            return
+        self._connected.clear()
+        logger.warning(f"Control channel lost: {str(error)}")
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Control channel lost: {str(error)}"))
+
+    def close(self):
+        """Close the channel and stop reconnecting."""
+        self._closed = True
+        self._handle_disconnect(ConnectionError("closed"))
+        logger.info("Control channel closed")
@@ -5,9 +5,15 @@ Supports flexible text matching and state context for any game benchmark.
 
 import logging
 import time
-from typing import List, Dict, Any, Tuple, Optional, Set
+from typing import List, Dict, Any, Callable, Tuple, Optional, Set
 
 from modules.gemma_client import BoundingBox
+from modules.frame import parse_region, union_regions, box_in_region
+from modules.state_matcher import StateMatcher
+from modules.element_matcher import SPATIAL_KEYS, text_matches, find_matching_element
+from modules.fuzzy_matcher import DEFAULT_FUZZY_THRESHOLD
+from modules.pixel_probe import PixelCheck, PixelSamples, parse_pixel_checks, checks_pass
+from modules.locate import can_locate
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +40,25 @@ class DecisionEngine:
         self.state_start_times = {}  # Track when we entered each state
         self.benchmark_started_at = None
         self.benchmark_completed_at = None
+        self.confirmed_state = None  # State the last frame was positively identified as (for the screen index)
+        # Targeted lookup of one element on the current frame, set by the runner (e.g. a vision client's locate)
+        self.locator: Optional[Callable[[Dict[str, Any]], List[BoundingBox]]] = None
         
         # Build state graph for validation
         self.state_graph = self._build_state_graph()
         
+        # Compile all required/excluded element rules once so a frame is matched in one pass
+        self.state_matcher = StateMatcher(self.states)
+        
+        # Pixel-probe predicates, evaluated from a few sampled colors instead of a detection
+        self.pixel_checks: Dict[str, List[PixelCheck]] = {}
+        for state_name, state_def in self.states.items():
+            if state_def and state_def.get("pixel_checks"):
+                try:
+                    self.pixel_checks[state_name] = parse_pixel_checks(state_def["pixel_checks"])
+                except ValueError as e:
+                    logger.error(f"Ignoring pixel_checks of state {state_name}: {str(e)}")
+        
         logger.info(f"DecisionEngine initialized for {self.game_name} with {len(self.states)} states")
         logger.info(f"Initial state: {self.current_state}, Target state: {self.target_state}")
     
@@ -68,113 +89,194 @@ class DecisionEngine:
         """
         return self.target_state
     
-    def _find_matching_element(self, state_def: Dict[str, Any], 
-                          bounding_boxes: List[BoundingBox]) -> Optional[BoundingBox]:
+    def _element_region(self, element_def: Dict[str, Any]) -> Optional[Tuple[int, int, int, int]]:
+        """Get an element definition's search_region, ignoring malformed values."""
+        try:
+            return parse_region(element_def.get("search_region"))
+        except ValueError as e:
+            logger.warning(f"Ignoring {str(e)}")
+            return None
+    
+    def get_capture_region(self, current_state: str) -> Optional[Tuple[int, int, int, int]]:
         """
-        Find a UI element that matches the state definition with flexible matching.
+        Get the screen region that is enough to evaluate the next iteration.
+        
+        A region is only returned if every element the engine may need from the current
+        state - required/excluded elements of the current and possible next states, and
+        click targets of the outgoing transitions - declares a search_region.
         
         Args:
-            state_def: State definition from the config
-            bounding_boxes: List of detected UI elements
+            current_state: Current state name
         
         Returns:
-            Matching BoundingBox or None if no match
+            (x, y, width, height) covering all search regions, or None to capture the full screen
         """
-        # First check if any excluded elements are present
-        exclude_elements = state_def.get("exclude_elements", [])
-        for excluded in exclude_elements:
-            excl_type = excluded.get("type", "any")
-            excl_text = excluded.get("text", "")
-            excl_match_type = excluded.get("text_match", "exact")
-            
-            for bbox in bounding_boxes:
-                # Type matching for excluded elements
-                type_match = (excl_type == "any" or 
-                            not excl_type or 
-                            bbox.element_type == excl_type)
-                
-                # Text matching for excluded elements
-                text_match = False
-                if bbox.element_text and excl_text:
-                    if excl_match_type == "exact":
-                        text_match = excl_text.lower() == bbox.element_text.lower()
-                    elif excl_match_type == "contains":
-                        text_match = excl_text.lower() in bbox.element_text.lower()
-                    elif excl_match_type == "startswith":
-                        text_match = bbox.element_text.lower().startswith(excl_text.lower())
-                    elif excl_match_type == "endswith":
-                        text_match = bbox.element_text.lower().endswith(excl_text.lower())
-                elif not excl_text:
-                    text_match = True
-                    
-                if type_match and text_match:
-                    # Found an excluded element - this state cannot be a match
-                    excluded_details = f"type: '{bbox.element_type}', text: '{bbox.element_text}'"
-                    logger.info(f"Found excluded element: {excluded_details} - state cannot be matched")
-                    return None
-        
-        # Now check for required elements
-        required_elements = state_def.get("required_elements", [])
-        
-        # If we have no required elements, but passed the exclusion check, it's a match
-        if not required_elements:
-            logger.debug("No required elements specified, and no excluded elements found")
-            return BoundingBox(x=0, y=0, width=0, height=0, confidence=1.0, 
-                            element_type="dummy", element_text="No required elements")
-        
-        # Check each required element
-        for required in required_elements:
-            req_type = required.get("type", "any")
-            req_text = required.get("text", "")
-            text_match_type = required.get("text_match", "exact")
-            min_confidence = required.get("required_confidence", 0.6)
-            
-            # Try to find a matching element
-            matched = False
-            for bbox in bounding_boxes:
-                # Type matching - handle "any" type
-                type_match = (req_type == "any" or 
-                            not req_type or 
-                            bbox.element_type == req_type)
-                
-                # Text matching with different strategies
-                text_match = False
-                if bbox.element_text and req_text:
-                    if text_match_type == "exact":
-                        text_match = req_text.lower() == bbox.element_text.lower()
-                    elif text_match_type == "contains":
-                        text_match = req_text.lower() in bbox.element_text.lower()
-                    elif text_match_type == "startswith":
-                        text_match = bbox.element_text.lower().startswith(req_text.lower())
-                    elif text_match_type == "endswith":
-                        text_match = bbox.element_text.lower().endswith(req_text.lower())
-                elif not req_text:  # If no text requirement, consider it a match
-                    text_match = True
-                
-                # Confidence threshold check
-                confidence_match = bbox.confidence >= min_confidence
-                
-                if type_match and text_match and confidence_match:
-                    match_details = f"type: '{bbox.element_type}', text: '{bbox.element_text}'"
-                    required_details = f"required type: '{req_type}', required text: '{req_text}'"
-                    logger.info(f"Found matching element: {match_details} matches {required_details}")
-                    matched = True
-                    matching_bbox = bbox
-                    break
-            
-            # If any required element is not found, the state doesn't match
-            if not matched:
-                logger.debug(f"Required element not found: {required}")
+        element_defs = []
+        candidate_states = [current_state]
+        for transition_key, transition in self.transitions.items():
+            if transition_key.startswith(f"{current_state}->"):
+                candidate_states.append(transition_key.split("->")[1])
+                if transition.get("action") == "click" and "hardcoded_coords" not in transition:
+                    element_defs.append(transition.get("target", {}))
+        
+        for state_name in candidate_states:
+            state_def = self.states.get(state_name)
+            if not state_def or not state_def.get("required_elements"):
+                return None
+            element_defs.extend(state_def.get("required_elements", []))
+            element_defs.extend(state_def.get("exclude_elements", []))
+        
+        regions = []
+        for element_def in element_defs:
+            region = self._element_region(element_def)
+            if region is None:
                 return None
+            regions.append(region)
+        
+        return union_regions(regions)
+    
+    def get_pixel_checks(self, state_name: Optional[str] = None) -> List[PixelCheck]:
+        """
+        Get the pixel checks of one state, or of every state.
+        
+        Args:
+            state_name: State name, or None for all states (sampled together each iteration)
+        
+        Returns:
+            Compiled pixel checks
+        """
+        if state_name is not None:
+            return self.pixel_checks.get(state_name, [])
+        return [check for checks in self.pixel_checks.values() for check in checks]
+    
+    def needs_vision(self, current_state: str) -> bool:
+        """
+        Check whether the next iteration needs a screenshot and detection at all.
+        
+        Not needed when the current and possible next states are told apart by
+        pixel checks alone and no outgoing transition has to find a click target.
+        
+        Args:
+            current_state: Current state name
+        
+        Returns:
+            False if pixel samples are enough to decide the next step
+        """
+        candidate_states = [current_state]
+        for transition_key, transition in self.transitions.items():
+            if transition_key.startswith(f"{current_state}->"):
+                candidate_states.append(transition_key.split("->")[1])
+                if transition.get("action") == "click" and "hardcoded_coords" not in transition:
+                    return True
         
-        # If we get here, all required elements were found and no excluded elements were found
-        return matching_bbox
+        if not any(state_name in self.pixel_checks for state_name in candidate_states):
+            return True
+        for state_name in candidate_states:
+            state_def = self.states.get(state_name) or {}
+            if state_def.get("required_elements") or state_def.get("exclude_elements"):
+                return True
+        return False
+    
+    def get_expected_elements(self, current_state: str) -> List[Dict[str, Any]]:
+        """
+        Get the element definitions the next iteration may look for.
+        
+        Args:
+            current_state: Current state name
+        
+        Returns:
+            Required elements of the current and possible next states, and click targets
+            of the outgoing transitions
+        """
+        element_defs = []
+        candidate_states = [current_state]
+        for transition_key, transition in self.transitions.items():
+            if transition_key.startswith(f"{current_state}->"):
+                candidate_states.append(transition_key.split("->")[1])
+                if transition.get("action") == "click" and "hardcoded_coords" not in transition:
+                    element_defs.append(transition.get("target", {}))
+        for state_name in candidate_states:
+            element_defs.extend((self.states.get(state_name) or {}).get("required_elements", []))
+        unique_defs = []
+        for element_def in element_defs:
+            if element_def and element_def not in unique_defs:
+                unique_defs.append(element_def)
+        return unique_defs
+    
+    def detection_sufficient(self, current_state: str, bounding_boxes: List[BoundingBox]) -> bool:
+        """
+        Check whether a detection is good enough to act on (used to stop a cascade or a streamed response early).
+        
+        It is if the state _identify_current_state would pick among the current and
+        possible next states is positively identified by its required elements and,
+        when the transition that would be taken from it is a click, its target is found.
+        States with exclude_elements are never decided early: the excluded element
+        (e.g. a popup) may simply not have been detected yet.
+        
+        Args:
+            current_state: Current state name
+            bounding_boxes: Detected UI elements
+        
+        Returns:
+            True if no more capable vision model is needed
+        """
+        candidate_states = [key.split("->")[1] for key in self.transitions if key.startswith(f"{current_state}->")]
+        candidate_states.append(current_state)
+        state_matches = self.state_matcher.match(bounding_boxes)
+        
+        for state_name in candidate_states:
+            state_def = self.states.get(state_name) or {}
+            result = state_matches.get(state_name)
+            if not state_def.get("required_elements") or result is None or not result.matched:
+                continue
+            # This is the state that would be identified - decide on it alone
+            if state_def.get("exclude_elements"):
+                return False
+            if state_name == self.target_state:
+                return True
+            next_state = self._next_transition_state(state_name)
+            transition = self.transitions.get(f"{state_name}->{next_state}", {}) if next_state else {}
+            if transition.get("action") != "click" or "hardcoded_coords" in transition:
+                return True
+            # Click targets default to exact text matching, as in _get_action_for_transition
+            target = transition.get("target", {})
+            return find_matching_element(dict(target, text_match=target.get("text_match", "exact")),
+                                         bounding_boxes) is not None
+        return False
+    
+    def get_vision_tiers(self, current_state: str) -> Optional[List[str]]:
+        """Get the state's vision_tiers override for a detection cascade, if any."""
+        return (self.states.get(current_state) or {}).get("vision_tiers")
     
-    def _identify_current_state(self, bounding_boxes: List[BoundingBox]) -> str:
+    def _identify_current_state(self, bounding_boxes: List[BoundingBox],
+                                pixel_samples: Optional[PixelSamples] = None) -> str:
         """
         Identify the current UI state based on detected elements, using a sequential approach.
         First checks possible next states, then current state, then all states as fallback.
+        States with pixel_checks also need those to pass on the sampled colors.
         """
+        # Score every state against the frame in one pass
+        state_matches = self.state_matcher.match(bounding_boxes)
+        
+        def is_match(state_name: str) -> bool:
+            if state_name in self.pixel_checks and not checks_pass(self.pixel_checks[state_name], pixel_samples):
+                logger.debug(f"Pixel checks of state {state_name} did not pass")
+                return False
+            result = state_matches.get(state_name)
+            if result is None:
+                # States without a definition have no requirements, so they always match
+                return True
+            if result.matched:
+                element = result.element
+                if element is not None:
+                    logger.info(f"Found matching element: type: '{element.element_type}', text: '{element.element_text}' "
+                                f"for state {state_name}")
+            elif result.excluded:
+                excluded = result.excluded[0]
+                logger.debug(f"Found excluded element: type: '{excluded.element_type}', text: '{excluded.element_text}' "
+                             f"- state {state_name} cannot be matched")
+            return result.matched
+        
         # 1. FIRST: Check states we can directly transition to from current state
         possible_next_states = []
         for transition_key in self.transitions:
@@ -184,25 +286,23 @@ class DecisionEngine:
         
         # Check these next states first (most likely states)
         for state_name in possible_next_states:
-            state_def = self.states.get(state_name, {})
-            if self._find_matching_element(state_def, bounding_boxes):
+            if is_match(state_name):
                 logger.info(f"Found matching next state: {state_name}")
                 return state_name
         
         # 2. SECOND: Check if we're still in current state
-        current_state_def = self.states.get(self.current_state, {})
-        if self._find_matching_element(current_state_def, bounding_boxes):
+        if is_match(self.current_state):
             logger.info(f"Still in current state: {self.current_state}")
             return self.current_state
         
         # 3. THIRD: As fallback, check all states (for recovery from unexpected situations)
         logger.info("No expected state matched, checking all states as fallback")
-        for state_name, state_def in self.states.items():
+        for state_name in self.states:
             # Skip states we already checked
             if state_name == self.current_state or state_name in possible_next_states:
                 continue
                 
-            if self._find_matching_element(state_def, bounding_boxes):
+            if is_match(state_name):
                 logger.info(f"Found unexpected state: {state_name}")
                 return state_name
         
@@ -302,27 +402,27 @@ class DecisionEngine:
             element_type = target_element.get("type", "any")
             element_text = target_element.get("text", "")
             text_match_type = target_element.get("text_match", "exact")
+            target_region = self._element_region(target_element)
+            
+            # Selectors with spatial predicates (below, nearest_to, index, ...) pick among repeated texts
+            candidates = bounding_boxes
+            if any(key in target_element for key in SPATIAL_KEYS):
+                spatial_match = find_matching_element(dict(target_element, text_match=text_match_type), bounding_boxes)
+                candidates = [spatial_match] if spatial_match else []
             
             # Look for a matching element with the improved matching strategy
-            for bbox in bounding_boxes:
+            for bbox in candidates:
+                if not box_in_region(bbox, target_region):
+                    continue
+                
                 # Type matching - handle "any" type
                 type_match = (element_type == "any" or 
                              not element_type or 
                              bbox.element_type == element_type)
                 
-                # Text matching with different strategies
-                text_match = False
-                if bbox.element_text and element_text:
-                    if text_match_type == "exact":
-                        text_match = element_text.lower() == bbox.element_text.lower()
-                    elif text_match_type == "contains":
-                        text_match = element_text.lower() in bbox.element_text.lower()
-                    elif text_match_type == "startswith":
-                        text_match = bbox.element_text.lower().startswith(element_text.lower())
-                    elif text_match_type == "endswith":
-                        text_match = bbox.element_text.lower().endswith(element_text.lower())
-                elif not element_text:  # If no text requirement, consider it a match
-                    text_match = True
+                # Text matching with different strategies (no text requirement always matches)
+                text_match = text_matches(bbox.element_text, element_text, text_match_type,
+                                          target_element.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD))
                 
                 if type_match and text_match:
                     # Calculate center point for click
@@ -336,6 +436,24 @@ class DecisionEngine:
                         "y": center_y
                     }
             
+            # The state is known and only its click target is missing - ask for that one element
+            if self.locator and can_locate(target_element):
+                locate_def = dict(target_element, text_match=text_match_type)
+                try:
+                    bbox = find_matching_element(locate_def, self.locator(locate_def))
+                except Exception as e:
+                    logger.warning(f"Targeted locate failed: {str(e)}")
+                    bbox = None
+                if bbox and box_in_region(bbox, target_region):
+                    center_x = bbox.x + (bbox.width // 2)
+                    center_y = bbox.y + (bbox.height // 2)
+                    logger.info(f"Action: Click at ({center_x}, {center_y}) on located {bbox.element_type}")
+                    return {
+                        "type": "click",
+                        "x": center_x,
+                        "y": center_y
+                    }
+            
             # If we're here, we couldn't find a matching element
             logger.warning(f"Could not find matching element for click in transition {transition_key}")
             
@@ -394,6 +512,17 @@ class DecisionEngine:
         Returns:
             Next state name or empty string if no valid transition
         """
+        selected = self._next_transition_state(current_state)
+        if not selected:
+            logger.warning(f"No transitions defined from state {current_state}")
+        elif sum(key.startswith(f"{current_state}->") for key in self.transitions) > 1 and selected not in self.visited_states:
+            logger.info(f"Selected unvisited state: {selected}")
+        else:
+            logger.info(f"Selected next state: {selected}")
+        return selected
+    
+    def _next_transition_state(self, current_state: str) -> str:
+        """Pick the next state without logging (also used to predict the click target)."""
         # Find possible next states from the current state
         possible_transitions = []
         for transition_key in self.transitions:
@@ -402,7 +531,6 @@ class DecisionEngine:
                 possible_transitions.append(target_state)
         
         if not possible_transitions:
-            logger.warning(f"No transitions defined from state {current_state}")
             return ""
         
         # Apply context-aware selection if we have multiple options
@@ -410,17 +538,13 @@ class DecisionEngine:
             # Prefer states we haven't visited yet
             unvisited = [s for s in possible_transitions if s not in self.visited_states]
             if unvisited:
-                selected = unvisited[0]
-                logger.info(f"Selected unvisited state: {selected}")
-                return selected
+                return unvisited[0]
                 
             # If all have been visited, use other heuristics
             # ...
         
         # Default to first option
-        selected = possible_transitions[0]
-        logger.info(f"Selected next state: {selected}")
-        return selected
+        return possible_transitions[0]
     
     def get_fallback_action(self, current_state: str) -> Dict[str, Any]:
         """
@@ -449,13 +573,15 @@ class DecisionEngine:
         return {"type": "key", "key": "escape"}
     
     def determine_next_action(self, current_state: str, 
-                            bounding_boxes: List[BoundingBox]) -> Tuple[Dict[str, Any], str]:
+                            bounding_boxes: List[BoundingBox],
+                            pixel_samples: Optional[PixelSamples] = None) -> Tuple[Dict[str, Any], str]:
         """
         Determine the next action to take based on the current state and UI elements.
         
         Args:
             current_state: Current state name
             bounding_boxes: List of detected UI elements
+            pixel_samples: Colors sampled for the states' pixel_checks
         
         Returns:
             Tuple of (action_dict, new_state)
@@ -468,7 +594,12 @@ class DecisionEngine:
             logger.info(f"Updated state history: {' -> '.join(self.state_history)}")
         
         # Verify the current state by checking UI elements
-        verified_state = self._identify_current_state(bounding_boxes)
+        verified_state = self._identify_current_state(bounding_boxes, pixel_samples)
+        
+        # Only states backed by required elements or pixel checks count as confirmed
+        verified_def = self.states.get(verified_state) or {}
+        has_evidence = bool(verified_def.get("required_elements")) or verified_state in self.pixel_checks
+        self.confirmed_state = verified_state if has_evidence else None
         
         # If the verified state doesn't match the expected current state, use the verified one
         if verified_state != "unknown" and verified_state != current_state:
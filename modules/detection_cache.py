@@ -0,0 +1,262 @@
+"""
+Perceptual-hash detection cache for the vision clients.
+Returns previously parsed UI elements when the screen has not changed,
+so idle menus and running benchmarks don't pay for a model round-trip.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Union
+
+from PIL import Image
+
+from modules.gemma_client import BoundingBox
+from modules.box_set import BoxSet
+from modules.frame import Frame
+from modules.vision_client import VisionClient
+from modules.element_matcher import targets_satisfied
+
+logger = logging.getLogger(__name__)
+
+def compute_dhash(image: Image.Image, hash_size: int = 16) -> int:
+    """
+    Compute a difference hash (dHash) of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail and
+    each bit records whether a pixel is brighter than its right-hand neighbour.
+
+    Args:
+        image: PIL image to hash
+        hash_size: Number of bits per row/column (hash has hash_size^2 bits)
+
+    Returns:
+        Hash as an integer
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """
+    Count the differing bits between two hashes.
+
+    Args:
+        hash_a: First hash
+        hash_b: Second hash
+
+    Returns:
+        Number of differing bits
+    """
+    return bin(hash_a ^ hash_b).count("1")
+
+class DetectionCache:
+    """LRU cache of detection results keyed by screenshot perceptual hash."""
+
+    def __init__(self, max_entries: int = 32, max_distance: int = 4, hash_size: int = 16):
+        """
+        Initialize the detection cache.
+
+        Args:
+            max_entries: Maximum number of cached detections (least recently used are evicted)
+            max_distance: Maximum Hamming distance for two screenshots to count as the same screen
+            hash_size: dHash size (hash has hash_size^2 bits)
+        """
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._entries = OrderedDict()  # (context, hash) -> list of BoundingBox
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.inference_seconds = 0.0  # Time spent in the model on misses
+
+        logger.info(f"DetectionCache initialized (max_entries: {max_entries}, max_distance: {max_distance}, "
+                    f"hash bits: {hash_size * hash_size})")
+
+    def hash_image(self, image: Image.Image) -> int:
+        """Compute the cache key for an image."""
+        return compute_dhash(image, self.hash_size)
+
+    def lookup(self, image_hash: int, context: Any = None, count: bool = True) -> Optional[List[BoundingBox]]:
+        """
+        Find a cached detection for a screenshot hash.
+
+        Args:
+            image_hash: dHash of the screenshot
+            context: Capture geometry (region/scale); only entries with the same context match
+            count: Count the hit or miss now; pass False if the caller may still
+                   reject the result, and call record_hit/record_miss once decided
+
+        Returns:
+            Cached BoxSet, or None on a miss
+        """
+        with self._lock:
+            best_key = None
+            best_distance = self.max_distance + 1
+
+            # Most recently used entries are the most likely match
+            for key in reversed(self._entries):
+                cached_context, cached_hash = key
+                if cached_context != context:
+                    continue
+                distance = hamming_distance(image_hash, cached_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+
+            if best_key is None:
+                if count:
+                    self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            if count:
+                self.hits += 1
+            logger.debug(f"Detection cache hit (distance: {best_distance})")
+            return self._entries[best_key]  # BoxSets are immutable, so no copy is needed
+
+    def record_hit(self):
+        """Count a lookup(count=False) result the caller used."""
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        """Count a lookup(count=False) that found nothing usable."""
+        with self._lock:
+            self.misses += 1
+
+    def store(self, image_hash: int, bounding_boxes: List[BoundingBox], inference_seconds: float = 0.0,
+              context: Any = None):
+        """
+        Store a detection result.
+
+        Args:
+            image_hash: dHash of the screenshot
+            bounding_boxes: Parsed detection result
+            inference_seconds: How long the model call took (used to estimate time saved)
+            context: Capture geometry (region/scale) the result belongs to
+        """
+        key = (context, image_hash)
+        with self._lock:
+            self.inference_seconds += inference_seconds
+            self._entries[key] = BoxSet.from_boxes(bounding_boxes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached detections (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+
+        Returns:
+            Dictionary with hits, misses, hit rate, evictions and estimated time saved
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_inference = self.inference_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "avg_inference_seconds": avg_inference,
+                "estimated_seconds_saved": self.hits * avg_inference
+            }
+
+    def log_stats(self):
+        """Log cache counters in a readable format."""
+        stats = self.get_stats()
+        logger.info(f"Detection cache: {stats['hits']} hits / {stats['misses']} misses "
+                    f"(hit rate {stats['hit_rate']:.0%}), {stats['hits']} inference calls saved, "
+                    f"~{stats['estimated_seconds_saved']:.1f}s saved")
+
+class CachedVisionClient(VisionClient):
+    """
+    Puts a DetectionCache in front of any vision client
+    (GemmaClient, QwenClient or OmniparserClient).
+    """
+
+    def __init__(self, client, cache: DetectionCache = None):
+        """
+        Initialize the cached client.
+
+        Args:
+            client: Vision client exposing detect_ui_elements(image, ...)
+            cache: DetectionCache to use (a default one is created if omitted)
+        """
+        self.client = client
+        self.cache = cache or DetectionCache()
+        logger.info(f"Detection cache enabled for {type(client).__name__}")
+
+    def detect_ui_elements(self, image: Union[Frame, str], *args, **kwargs) -> List[BoundingBox]:
+        """
+        Detect UI elements, reusing a cached result if the screen is unchanged.
+
+        Args:
+            image: Frame or path of the screenshot image
+            *args, **kwargs: Passed through to the wrapped client on a miss
+
+        Returns:
+            List of detected UI elements with bounding boxes
+        """
+        try:
+            frame = Frame.coerce(image)
+            image_hash = self.cache.hash_image(frame.image)
+            # Cached boxes are in screen coordinates, so they only apply to frames with the same geometry
+            context = (frame.offset_x, frame.offset_y, frame.scale, frame.size)
+        except Exception as e:
+            logger.warning(f"Could not hash screenshot for detection cache: {str(e)}")
+            return self.client.detect_ui_elements(image, *args, **kwargs)
+
+        # Counted only after the request's own check, so rejected entries are misses
+        cached = self.cache.lookup(image_hash, context, count=False)
+        targets = kwargs.get("targets")
+        accept = kwargs.get("accept")
+        if cached is not None and (accept or targets):
+            # An ensemble or cascade result cached for other targets may come from a different model
+            if not (accept(cached) if accept else targets_satisfied(targets, cached)):
+                logger.debug("Cached detection does not satisfy the request, re-running inference")
+                cached = None
+        if cached is not None:
+            self.cache.record_hit()
+            logger.info(f"Screen unchanged - reusing {len(cached)} cached UI elements for {frame.name}")
+            return cached
+        self.cache.record_miss()
+
+        start_time = time.time()
+        bounding_boxes = self.client.detect_ui_elements(frame, *args, **kwargs)
+        self.cache.store(image_hash, bounding_boxes, time.time() - start_time, context)
+        return bounding_boxes
+
+    def warm_up(self):
+        """Warm up the wrapped client."""
+        self.client.warm_up()
+
+    def __getattr__(self, name):
+        # Everything else (e.g. _format_bounding_boxes, api_url) comes from the wrapped client
+        return getattr(self.client, name)
+
+    def close(self):
+        """Log cache statistics and close the wrapped client."""
+        self.cache.log_stats()
+        if hasattr(self.client, 'close'):
+            self.client.close()
@@ -0,0 +1,219 @@
+"""
+Element matching shared by the step runner and the vision ensemble.
+Decides whether a detected UI element satisfies a find/verify definition
+from the game config (type, text, text_match and search_region).
+"""
+
+import math
+import logging
+from typing import Any, Dict, List, Optional
+
+from modules.box_set import BoundingBox
+from modules.frame import parse_region, parse_point, box_in_region
+from modules.spatial_index import get_spatial_index
+from modules.fuzzy_matcher import DEFAULT_FUZZY_THRESHOLD, similarity, get_fuzzy_index
+
+logger = logging.getLogger(__name__)
+
+# Selector keys that position an element relative to the screen or to another element
+DIRECTION_KEYS = ("below", "above", "left_of", "right_of")
+SPATIAL_KEYS = ("within", "nearest_to", "index") + DIRECTION_KEYS
+
+def text_matches(element_text: str, target_text: str, match_type: str = "contains",
+                 threshold: float = DEFAULT_FUZZY_THRESHOLD) -> bool:
+    """
+    Compare an element's text with a target text (case-insensitive).
+
+    Args:
+        element_text: Text detected for the element
+        target_text: Text from the config
+        match_type: exact, contains, startswith, endswith or fuzzy
+        threshold: Minimum similarity for fuzzy matching (0-1)
+
+    Returns:
+        True if the text matches (always True when no target text is given)
+    """
+    if not target_text:
+        return True
+    if not element_text:
+        return False
+
+    element_lower = element_text.lower()
+    target_lower = target_text.lower()
+    if match_type == "exact":
+        return target_lower == element_lower
+    elif match_type == "contains":
+        return target_lower in element_lower
+    elif match_type == "startswith":
+        return element_lower.startswith(target_lower)
+    elif match_type == "endswith":
+        return element_lower.endswith(target_lower)
+    elif match_type == "fuzzy":
+        return similarity(element_text, target_text) >= threshold
+    return False
+
+def find_matching_element(target_def: Dict[str, Any], bounding_boxes: List[BoundingBox]) -> Optional[BoundingBox]:
+    """
+    Find the first UI element matching a target definition.
+
+    Args:
+        target_def: Element definition with type, text, text_match and optional
+                    search_region, required_confidence and spatial predicates
+        bounding_boxes: Detected UI elements
+
+    Returns:
+        Matching BoundingBox or None
+    """
+    if any(key in target_def for key in SPATIAL_KEYS):
+        return _find_spatial_element(target_def, bounding_boxes)
+
+    target_type = target_def.get("type", "any")
+    target_text = target_def.get("text", "")
+    match_type = target_def.get("text_match", "contains")
+    min_confidence = target_def.get("required_confidence", 0.0)
+    try:
+        search_region = parse_region(target_def.get("search_region"))
+    except ValueError as e:
+        logger.warning(f"Ignoring {str(e)}")
+        search_region = None
+
+    logger.debug(f"Searching for element: type='{target_type}', text='{target_text}', match_strategy='{match_type}'")
+
+    if match_type == "fuzzy" and target_text:
+        # Only the elements whose text survives the index's pruning can match, best first
+        threshold = target_def.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD)
+        candidates = get_fuzzy_index(bounding_boxes).find(target_text, threshold)
+        for index, score in candidates:
+            bbox = bounding_boxes[index]
+            if not box_in_region(bbox, search_region) or bbox.confidence < min_confidence:
+                continue
+            if target_type == "any" or bbox.element_type == target_type:
+                logger.debug(f"✅ Fuzzy match found: {bbox.element_type} '{bbox.element_text}' "
+                             f"(similarity {score:.2f}) at ({bbox.x}, {bbox.y})")
+                return bbox
+        logger.debug("❌ No matching element found")
+        return None
+
+    for bbox in bounding_boxes:
+        # Only consider elements inside the search region, if one is declared
+        if not box_in_region(bbox, search_region) or bbox.confidence < min_confidence:
+            continue
+
+        type_match = (target_type == "any" or bbox.element_type == target_type)
+        text_match = text_matches(bbox.element_text, target_text, match_type)
+
+        if type_match and target_text and bbox.element_text:
+            logger.debug(f"  Checking element '{bbox.element_text}': text_match={text_match} (strategy={match_type})")
+
+        if type_match and text_match:
+            element_text = bbox.element_text if bbox.element_text else "(no text)"
+            logger.debug(f"✅ Match found: {bbox.element_type} '{element_text}' at ({bbox.x}, {bbox.y})")
+            return bbox
+
+    logger.debug("❌ No matching element found")
+    return None
+
+def _element_matches(bbox: BoundingBox, target_def: Dict[str, Any]) -> bool:
+    """Check an element's type, text and confidence against a definition."""
+    target_type = target_def.get("type", "any")
+    if target_type not in ("any", "") and bbox.element_type != target_type:
+        return False
+    if bbox.confidence < target_def.get("required_confidence", 0.0):
+        return False
+    return text_matches(bbox.element_text, target_def.get("text", ""), target_def.get("text_match", "contains"),
+                        target_def.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD))
+
+def _find_spatial_element(target_def: Dict[str, Any], bounding_boxes: List[BoundingBox]) -> Optional[BoundingBox]:
+    """
+    Resolve a selector with spatial predicates through the frame's grid index.
+
+    within/search_region restrict candidates to a region; below/above/left_of/right_of
+    take a nested selector for an anchor element and order candidates by distance
+    from it; nearest_to orders by distance from a point; index picks the n-th
+    candidate (0-based, reading order when nothing else orders them).
+    """
+    index = get_spatial_index(bounding_boxes)
+    try:
+        regions = [parse_region(target_def.get(key)) for key in ("within", "search_region")]
+        point = parse_point(target_def.get("nearest_to"))
+    except ValueError as e:
+        logger.warning(f"Invalid spatial selector: {str(e)}")
+        return None
+    regions = [region for region in regions if region is not None]
+    position = int(target_def.get("index", 0))
+
+    candidates = None  # None means every element
+    ordered = False
+    for region in regions:
+        found = index.within(region)
+        if candidates is not None:
+            allowed = set(candidates)
+            found = [i for i in found if i in allowed]
+        candidates = found
+
+    for direction in DIRECTION_KEYS:
+        if direction not in target_def:
+            continue
+        anchor = find_matching_element(target_def[direction], bounding_boxes)
+        if anchor is None:
+            logger.debug(f"❌ Anchor for '{direction}' not found: {target_def[direction]}")
+            return None
+        found = index.in_direction(anchor, direction)
+        if candidates is not None:
+            allowed = set(candidates)
+            found = [i for i in found if i in allowed]
+        candidates, ordered = found, True
+
+    if point is not None:
+        if candidates is None:
+            # Walk outward from the point and stop as soon as enough matches are found
+            matched = 0
+            for i in index.iter_nearest(*point):
+                if _element_matches(bounding_boxes[i], target_def):
+                    if matched == position:
+                        return bounding_boxes[i]
+                    matched += 1
+            return None
+        candidates = sorted(candidates, key=lambda i: (math.hypot(index.centers[i][0] - point[0],
+                                                                  index.centers[i][1] - point[1]), i))
+        ordered = True
+
+    if candidates is None:
+        candidates = range(len(bounding_boxes))
+    matches = [i for i in candidates if _element_matches(bounding_boxes[i], target_def)]
+    if not ordered and "index" in target_def:
+        # Reading order: top to bottom, then left to right
+        matches.sort(key=lambda i: (bounding_boxes[i].y, bounding_boxes[i].x, i))
+
+    if position >= len(matches) or position < -len(matches):
+        logger.debug(f"❌ No matching element found ({len(matches)} candidates, index {position})")
+        return None
+    bbox = bounding_boxes[matches[position]]
+    logger.debug(f"✅ Spatial match found: {bbox.element_type} '{bbox.element_text}' at ({bbox.x}, {bbox.y})")
+    return bbox
+
+def count_satisfied(targets: List[Dict[str, Any]], bounding_boxes: List[BoundingBox]) -> int:
+    """
+    Count how many target definitions are matched by the detected elements.
+
+    Args:
+        targets: Element definitions
+        bounding_boxes: Detected UI elements
+
+    Returns:
+        Number of matched targets
+    """
+    return sum(1 for target in targets if find_matching_element(target, bounding_boxes) is not None)
+
+def targets_satisfied(targets: List[Dict[str, Any]], bounding_boxes: List[BoundingBox]) -> bool:
+    """
+    Check whether every target definition is matched by the detected elements.
+
+    Args:
+        targets: Element definitions
+        bounding_boxes: Detected UI elements
+
+    Returns:
+        True if all targets match
+    """
+    return all(find_matching_element(target, bounding_boxes) is not None for target in targets)
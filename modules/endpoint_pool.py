@@ -0,0 +1,373 @@
+"""
+Pool of interchangeable inference endpoints for the vision clients.
+Spreads requests over several Omniparser or LM Studio servers by least
+outstanding requests, keeps a latency EWMA per endpoint, retries failed
+requests on another endpoint with jittered backoff, and takes endpoints
+that keep failing out of rotation (circuit breaker) until a health probe
+or trial request succeeds again.
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = "closed"        # Healthy, in rotation
+OPEN = "open"            # Failing, skipped until the cooldown has passed
+HALF_OPEN = "half_open"  # Cooldown over, one trial request or probe decides
+
+# Responses that say "try another server" rather than "your request is wrong"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Of those, the ones where the server did not start on the request (safe to resend a POST)
+NOT_PROCESSED_STATUS = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+def parse_urls(urls: Union[str, List[str]]) -> List[str]:
+    """
+    Split a comma-separated URL setting into a list of base URLs.
+
+    Args:
+        urls: One URL, several separated by commas, or a list
+
+    Returns:
+        Base URLs without trailing slashes
+
+    Raises:
+        ValueError: If no URL is given
+    """
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    parsed = [url.strip().rstrip("/") for url in urls if url and url.strip()]
+    if not parsed:
+        raise ValueError("At least one endpoint URL is required")
+    return parsed
+
+def never_sent(error: Exception) -> bool:
+    """
+    Check whether a failed request never reached the server.
+
+    Args:
+        error: Exception raised by requests
+
+    Returns:
+        True for connection failures and connect timeouts, False if the request
+        may have been received (read timeouts, connections dropped mid-response)
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+class Endpoint:
+    """One inference server and what the pool knows about it."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        # Metrics
+        self.requests = 0
+        self.failures = 0
+
+class EndpointPool:
+    """Least-outstanding-requests load balancer with retries and circuit breaking."""
+
+    def __init__(self, urls: Union[str, List[str]], probe_path: str = "/v1/models",
+                 session: Optional[requests.Session] = None, retries: int = 2,
+                 failure_threshold: int = 3, cooldown: float = 15.0, backoff_base: float = 0.5,
+                 backoff_max: float = 4.0, ewma_alpha: float = 0.3, connect_timeout: float = 5.0,
+                 probe_interval: float = 10.0):
+        """
+        Initialize the pool.
+
+        Args:
+            urls: Endpoint base URLs (comma-separated string or list)
+            probe_path: Cheap GET path used as health check (/v1/models, /probe, ...)
+            session: HTTP session to send requests with (a new one by default)
+            retries: Extra attempts after a failed request
+            failure_threshold: Consecutive failures that open an endpoint's circuit
+            cooldown: Seconds an open circuit stays out of rotation
+            backoff_base: First retry delay in seconds (doubled per attempt, fully jittered)
+            backoff_max: Upper bound of the retry delay
+            ewma_alpha: Weight of the newest latency sample
+            connect_timeout: Seconds to wait for a connection, so a dead server fails fast
+            probe_interval: Seconds between background health probes of open circuits (0 disables)
+        """
+        self.endpoints = [Endpoint(url) for url in parse_urls(urls)]
+        self.probe_path = probe_path
+        self.session = session or requests.Session()
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ewma_alpha = ewma_alpha
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober = None
+        if probe_interval > 0 and len(self.endpoints) > 1:
+            self._prober = threading.Thread(target=self._probe_loop, args=(probe_interval,),
+                                            name="EndpointProber", daemon=True)
+            self._prober.start()
+
+    @property
+    def urls(self) -> List[str]:
+        """Base URLs of all endpoints."""
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def __str__(self) -> str:
+        return ", ".join(self.urls)
+
+    def request(self, method: str, path: str, url: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Send a request to the best available endpoint, retrying elsewhere on failure.
+
+        Connection errors, timeouts and 429/5xx responses count against the
+        endpoint. A non-idempotent request (a POST starting a generation) is
+        only sent again if it never reached a server or was refused with
+        429/503, so a timed-out generation is not queued twice; idempotent
+        requests are also retried on read timeouts and other 5xx. All attempts
+        share the read timeout as one deadline. Other responses are returned as
+        they are (check raise_for_status). A streamed response keeps its
+        endpoint busy until it is closed.
+
+        Args:
+            method: HTTP method
+            path: Path appended to the endpoint URL (e.g. /v1/chat/completions)
+            url: Pin the request to this endpoint instead of balancing
+            **kwargs: Passed to requests.Session.request (a scalar timeout is the
+                      read timeout and the deadline for all attempts)
+
+        Returns:
+            requests.Response
+
+        Raises:
+            RequestException: If every attempt failed or the request may have been processed
+        """
+        timeout = kwargs.pop("timeout", 60)
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout, read_timeout = min(self.connect_timeout, timeout or self.connect_timeout), timeout
+        deadline = time.time() + read_timeout if read_timeout else None
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_status = RETRYABLE_STATUS if idempotent else NOT_PROCESSED_STATUS
+        pinned = next((endpoint for endpoint in self.endpoints if endpoint.url == url.rstrip("/")), None) if url else None
+        if url and pinned is None:
+            raise ValueError(f"{url} is not in the endpoint pool ({self})")
+
+        tried = set()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if pinned is not None:
+                endpoint, trial = pinned, False
+            else:
+                endpoint, trial = self._acquire(tried)
+            if endpoint is None:
+                last_error = requests.ConnectionError(f"No inference endpoint available ({self})")
+            else:
+                if pinned is not None:
+                    with self._lock:
+                        endpoint.outstanding += 1
+                tried.add(endpoint.url)
+                start_time = time.time()
+                remaining = deadline - start_time if deadline else None
+                timeout = (min(connect_timeout, remaining), remaining) if remaining else (connect_timeout, read_timeout)
+                try:
+                    response = self.session.request(method, f"{endpoint.url}{path}", timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self._release(endpoint, ok=False, trial=trial)
+                    logger.warning(f"Request to {endpoint.url} failed: {str(e)}")
+                    if not idempotent and not never_sent(e):
+                        # The server may still be working on it - sending it again would run it twice
+                        raise
+                    last_error = e
+                else:
+                    out_of_time = deadline is not None and time.time() >= deadline
+                    if response.status_code not in retry_status or attempt == self.retries or out_of_time:
+                        ok = response.status_code not in RETRYABLE_STATUS
+                        if kwargs.get("stream"):
+                            self._release_on_close(response, endpoint, ok, time.time() - start_time, trial)
+                        else:
+                            self._release(endpoint, ok=ok, latency=time.time() - start_time, trial=trial)
+                        return response
+                    logger.warning(f"{endpoint.url} answered HTTP {response.status_code} - retrying")
+                    response.close()
+                    self._release(endpoint, ok=False, trial=trial)
+                    last_error = requests.HTTPError(f"HTTP {response.status_code} from {endpoint.url}",
+                                                    response=response)
+
+            if attempt == self.retries:
+                break
+            delay = 0.0
+            if pinned is not None or endpoint is None or self._all_tried(tried):
+                # Nowhere new to go - give the servers a moment (full jitter spreads out parallel runs)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                tried.clear()
+            if deadline is not None and time.time() + delay >= deadline:
+                break
+            time.sleep(delay)
+        raise last_error
+
+    def _acquire(self, tried: set) -> Tuple[Optional[Endpoint], bool]:
+        """
+        Pick and reserve the endpoint with the fewest requests in flight, preferring untried ones.
+
+        Returns:
+            Tuple of (endpoint or None, whether this request is the endpoint's half-open trial)
+        """
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+                    endpoint.state = HALF_OPEN
+                if endpoint.state == OPEN or (endpoint.state == HALF_OPEN and endpoint.trial_in_flight):
+                    continue
+                candidates.append(endpoint)
+            if not candidates:
+                # Every circuit is open: trying one anyway beats failing without asking anybody
+                candidates = [endpoint for endpoint in self.endpoints if not endpoint.trial_in_flight]
+                if not candidates:
+                    return None, False
+            untried = [endpoint for endpoint in candidates if endpoint.url not in tried]
+            endpoint = min(untried or candidates,
+                           key=lambda e: (e.outstanding, e.latency_ewma or 0.0, random.random()))
+            trial = endpoint.state == HALF_OPEN
+            if trial:
+                endpoint.trial_in_flight = True
+            endpoint.outstanding += 1
+            logger.debug(f"Routing request to {endpoint.url} ({endpoint.outstanding} in flight)")
+            return endpoint, trial
+
+    def _all_tried(self, tried: set) -> bool:
+        return all(endpoint.url in tried for endpoint in self.endpoints)
+
+    def _release(self, endpoint: Endpoint, ok: bool, latency: Optional[float] = None, trial: bool = False):
+        """Return a reserved endpoint and record the outcome of its request (trial: it was the half-open trial)."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if trial:
+                endpoint.trial_in_flight = False
+            endpoint.requests += 1
+            if ok:
+                if latency is not None:
+                    endpoint.latency_ewma = latency if endpoint.latency_ewma is None else (
+                        self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.latency_ewma)
+                self._mark_healthy(endpoint)
+            else:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.state == HALF_OPEN or endpoint.consecutive_failures >= self.failure_threshold:
+                    if endpoint.state != OPEN:
+                        logger.warning(f"Taking {endpoint.url} out of rotation for {self.cooldown:.0f}s "
+                                       f"after {endpoint.consecutive_failures} consecutive failures")
+                    endpoint.state = OPEN
+                    endpoint.opened_at = time.time()
+
+    def _release_on_close(self, response: requests.Response, endpoint: Endpoint, ok: bool, latency: float,
+                          trial: bool = False):
+        """Keep a streamed response's endpoint reserved until the stream is closed."""
+        close = response.close
+        released = []
+
+        def close_and_release():
+            close()
+            if not released:
+                released.append(True)
+                self._release(endpoint, ok=ok, latency=latency, trial=trial)
+
+        response.close = close_and_release
+
+    def _mark_healthy(self, endpoint: Endpoint):
+        """Close an endpoint's circuit (call with the lock held)."""
+        if endpoint.state != CLOSED:
+            logger.info(f"{endpoint.url} is back in rotation")
+        endpoint.state = CLOSED
+        endpoint.consecutive_failures = 0
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        """
+        Health-check one endpoint and update its circuit.
+
+        Args:
+            endpoint: Endpoint to probe
+
+        Returns:
+            True if it answered the probe
+        """
+        try:
+            response = self.session.get(f"{endpoint.url}{self.probe_path}", timeout=self.connect_timeout)
+            healthy = response.ok
+            response.close()
+        except requests.RequestException as e:
+            logger.debug(f"Probe of {endpoint.url} failed: {str(e)}")
+            healthy = False
+        with self._lock:
+            if healthy:
+                self._mark_healthy(endpoint)
+            elif endpoint.state != OPEN:
+                endpoint.state = OPEN
+                endpoint.opened_at = time.time()
+                logger.warning(f"{endpoint.url} failed its health probe - out of rotation")
+        return healthy
+
+    def probe_all(self) -> int:
+        """
+        Health-check every endpoint.
+
+        Returns:
+            Number of healthy endpoints
+
+        Raises:
+            ConnectionError: If none of them answered
+        """
+        healthy = sum(1 for endpoint in self.endpoints if self.probe(endpoint))
+        if not healthy:
+            raise requests.ConnectionError(f"No endpoint answered {self.probe_path} ({self})")
+        return healthy
+
+    def _probe_loop(self, interval: float):
+        """Background thread: probe open circuits whose cooldown has passed."""
+        while not self._stop.wait(interval):
+            now = time.time()
+            for endpoint in self.endpoints:
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+                    self.probe(endpoint)
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint state, request counts and latency."""
+        with self._lock:
+            return [{
+                "url": endpoint.url,
+                "state": endpoint.state,
+                "outstanding": endpoint.outstanding,
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+                "latency_ewma": endpoint.latency_ewma
+            } for endpoint in self.endpoints]
+
+    def log_stats(self):
+        """Log how the requests were spread over the endpoints."""
+        if len(self.endpoints) < 2:
+            return
+        for stats in self.get_stats():
+            latency = f"{stats['latency_ewma']:.2f}s" if stats["latency_ewma"] is not None else "n/a"
+            logger.info(f"Endpoint {stats['url']}: {stats['requests']} requests, {stats['failures']} failed, "
+                        f"latency EWMA {latency}, {stats['state']}")
+
+    def close(self):
+        """Stop health probing."""
+        self._stop.set()
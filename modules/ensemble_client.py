@@ -0,0 +1,137 @@
+"""
+Ensemble of vision clients queried concurrently on the same frame.
+Returns the first result that satisfies the current step's find criteria
+and drops the rest, so one slow backend does not set the step latency.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from modules.gemma_client import BoundingBox
+from modules.frame import Frame
+from modules.vision_client import VisionClient
+from modules.element_matcher import count_satisfied, targets_satisfied
+
+logger = logging.getLogger(__name__)
+
+class EnsembleVisionClient(VisionClient):
+    """Runs several vision clients in parallel and keeps the first acceptable result."""
+
+    # Lets the step runner know it can pass the elements it is looking for
+    accepts_targets = True
+
+    def __init__(self, clients: List[VisionClient], timeout: float = 90.0):
+        """
+        Initialize the ensemble.
+
+        Args:
+            clients: Vision clients to query (e.g. Omniparser and an LLM)
+            timeout: Maximum seconds to wait for all clients
+
+        Raises:
+            ValueError: If no clients are given
+        """
+        if not clients:
+            raise ValueError("EnsembleVisionClient needs at least one client")
+        self.clients = clients
+        self.timeout = timeout
+        self.wins: Dict[str, int] = {type(client).__name__: 0 for client in clients}
+        logger.info(f"EnsembleVisionClient initialized with {', '.join(self.wins)}")
+
+    def detect_ui_elements(self, image: Union[Frame, str], targets: List[Dict[str, Any]] = None,
+                           accept: Callable[[List[BoundingBox]], bool] = None) -> List[BoundingBox]:
+        """
+        Query every client concurrently and return the first acceptable result.
+
+        A result is acceptable if it matches all targets (or satisfies accept);
+        without either, the first non-empty result wins. If no result is
+        acceptable, the one matching the most targets is returned.
+
+        Args:
+            image: Frame or path of the screenshot image
+            targets: Element definitions the caller is looking for
+            accept: Custom predicate over the detected elements
+
+        Returns:
+            List of detected UI elements with bounding boxes
+
+        Raises:
+            RuntimeError: If every client failed
+        """
+        frame = Frame.coerce(image)
+        if accept is None:
+            if targets:
+                accept = lambda boxes: targets_satisfied(targets, boxes)
+            else:
+                accept = lambda boxes: len(boxes) > 0
+
+        start_time = time.time()
+        # Streaming members stop generating when this is set, so losers don't hold up the server
+        cancel = threading.Event()
+        futures = {}
+        for client in self.clients:
+            if getattr(client, "accepts_cancel", False):
+                futures[client.detect_ui_elements_async(frame, cancel=cancel)] = client
+            else:
+                futures[client.detect_ui_elements_async(frame)] = client
+        pending = set(futures)
+        results = []
+        errors = []
+
+        while pending:
+            remaining = self.timeout - (time.time() - start_time)
+            if remaining <= 0:
+                logger.warning(f"Ensemble timed out with {len(pending)} clients still running")
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = type(futures[future]).__name__
+                try:
+                    boxes = future.result()
+                except Exception as e:
+                    logger.warning(f"Ensemble member {name} failed: {str(e)}")
+                    errors.append(f"{name}: {str(e)}")
+                    continue
+
+                results.append((name, boxes))
+                if accept(boxes):
+                    self._cancel(pending, cancel)
+                    self.wins[name] += 1
+                    logger.info(f"Ensemble: {name} answered first with an acceptable result "
+                                f"({len(boxes)} elements, {time.time() - start_time:.2f}s)")
+                    return boxes
+
+        self._cancel(pending, cancel)
+        if not results:
+            raise RuntimeError(f"All ensemble members failed: {errors}")
+
+        # Nobody satisfied the criteria - return the closest result
+        name, boxes = max(results, key=lambda r: (count_satisfied(targets or [], r[1]), len(r[1])))
+        logger.info(f"Ensemble: no member satisfied the criteria, using {name} ({len(boxes)} elements)")
+        return boxes
+
+    def _cancel(self, futures, cancel: threading.Event):
+        """
+        Stop the members still running: queued ones are dropped, streaming
+        ones close their response at the next token (which stops generation);
+        non-streamed requests already in flight finish in the background.
+        """
+        cancel.set()
+        for future in futures:
+            future.cancel()
+
+    def warm_up(self):
+        """Warm up all members concurrently."""
+        for future in [client.warm_up_async() for client in self.clients]:
+            future.result()
+
+    def close(self):
+        """Log which members won and close all clients."""
+        logger.info(f"Ensemble wins: {self.wins}")
+        for client in self.clients:
+            if hasattr(client, 'close'):
+                client.close()
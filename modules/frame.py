@@ -0,0 +1,307 @@
+"""
+In-memory screenshot frame passed through the automation loop.
+Carries the raw image bytes from the SUT and decodes/encodes them lazily,
+so a screenshot is never re-read from disk or base64-encoded twice.
+"""
+
+import os
+import io
+import time
+import base64
+import logging
+import threading
+import dataclasses
+from typing import Any, Iterable, List, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class Frame:
+    """A screenshot held in memory, with lazily decoded and encoded forms."""
+
+    def __init__(self, data: bytes, path: str = None, mime_type: str = "image/png",
+                 scale: float = 1.0, native_size: Tuple[int, int] = None,
+                 offset: Tuple[int, int] = (0, 0)):
+        """
+        Initialize the frame.
+
+        Args:
+            data: Raw encoded image bytes as received from the SUT
+            path: Path the frame is (or will be) archived to, if any
+            mime_type: MIME type of the encoded bytes
+            scale: Image pixels per screen pixel (below 1.0 if the SUT downscaled the capture)
+            native_size: (width, height) of the captured area at screen resolution
+            offset: Screen position (x, y) of the frame's top-left corner (non-zero for region captures)
+        """
+        self.data = data
+        self.path = path
+        self.mime_type = mime_type
+        self.scale = scale if scale and scale > 0 else 1.0
+        self._native_size = native_size
+        self.offset_x, self.offset_y = offset
+        self.captured_at = time.time()
+
+        self._image = None
+        self._base64 = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, image_path: str) -> 'Frame':
+        """
+        Load a frame from an image file.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            Frame holding the file contents
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image file not found: {image_path}")
+
+        with open(image_path, "rb") as f:
+            data = f.read()
+
+        extension = os.path.splitext(image_path)[1].lower()
+        mime_type = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}.get(extension, "image/png")
+        return cls(data, path=image_path, mime_type=mime_type)
+
+    @classmethod
+    def coerce(cls, image: Union['Frame', str]) -> 'Frame':
+        """
+        Accept either a Frame or an image path and return a Frame.
+
+        Args:
+            image: Frame instance or path to an image file
+
+        Returns:
+            Frame instance
+        """
+        if isinstance(image, Frame):
+            return image
+        return cls.from_file(str(image))
+
+    @property
+    def image(self) -> Image.Image:
+        """Decoded PIL image (decoded on first access, then shared - copy before drawing on it)."""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = Image.open(io.BytesIO(self.data))
+                    image.load()
+                    self._image = image
+        return self._image
+
+    @property
+    def base64(self) -> str:
+        """Base64-encoded image bytes (encoded on first access)."""
+        if self._base64 is None:
+            with self._lock:
+                if self._base64 is None:
+                    self._base64 = base64.b64encode(self.data).decode("utf-8")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        """Image as a data URL for chat-completion style APIs."""
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Image size as (width, height)."""
+        return self.image.size
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def native_size(self) -> Tuple[int, int]:
+        """Size of the captured area at screen resolution as (width, height)."""
+        if self._native_size:
+            return self._native_size
+        return (round(self.width / self.scale), round(self.height / self.scale))
+
+    @property
+    def is_identity(self) -> bool:
+        """True if image coordinates are screen coordinates."""
+        return self.scale == 1.0 and not self.offset_x and not self.offset_y
+
+    def map_boxes_to_screen(self, boxes: List) -> List:
+        """
+        Map boxes from image coordinates to screen coordinates.
+
+        Args:
+            boxes: BoundingBox objects or a BoxSet in this frame's image coordinates
+
+        Returns:
+            New boxes in screen coordinates (a BoxSet stays a BoxSet)
+        """
+        if self.is_identity:
+            return boxes if hasattr(boxes, "transform") else list(boxes)
+        if hasattr(boxes, "transform"):
+            # BoxSet: transform the coordinate columns in one go
+            return boxes.transform(1.0 / self.scale, self.offset_x, self.offset_y)
+        return [self._transform_box(box, 1.0 / self.scale, self.offset_x, self.offset_y) for box in boxes]
+
+    def map_boxes_to_image(self, boxes: List) -> List:
+        """
+        Map boxes from screen coordinates to this frame's image coordinates.
+
+        Args:
+            boxes: BoundingBox objects or a BoxSet in screen coordinates
+
+        Returns:
+            New boxes in image coordinates (a BoxSet stays a BoxSet)
+        """
+        if self.is_identity:
+            return boxes if hasattr(boxes, "transform") else list(boxes)
+        if hasattr(boxes, "transform"):
+            return boxes.transform(self.scale, -self.offset_x * self.scale, -self.offset_y * self.scale)
+        return [self._transform_box(box, self.scale, -self.offset_x * self.scale, -self.offset_y * self.scale)
+                for box in boxes]
+
+    @staticmethod
+    def _transform_box(box, factor: float, shift_x: float = 0, shift_y: float = 0):
+        return dataclasses.replace(
+            box,
+            x=int(round(box.x * factor + shift_x)),
+            y=int(round(box.y * factor + shift_y)),
+            width=int(round(box.width * factor)),
+            height=int(round(box.height * factor))
+        )
+
+    @property
+    def age(self) -> float:
+        """Seconds since the frame was captured."""
+        return time.time() - self.captured_at
+
+    @property
+    def name(self) -> str:
+        """Readable name for log messages."""
+        return self.path or f"in-memory frame ({len(self.data)} bytes)"
+
+    def __str__(self) -> str:
+        return self.name
+
+def parse_region(value: Any) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Parse a search_region from config.
+
+    Accepts [x, y, width, height], "x,y,width,height" or
+    {x: .., y: .., width: .., height: ..} in screen pixels.
+
+    Args:
+        value: Region as written in YAML (None is allowed)
+
+    Returns:
+        (x, y, width, height) tuple, or None if no region is given
+
+    Raises:
+        ValueError: If the region is malformed
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, dict):
+        value = [value.get("x"), value.get("y"), value.get("width"), value.get("height")]
+    try:
+        x, y, width, height = (int(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid search_region: {value}")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid search_region size: {value}")
+    return (x, y, width, height)
+
+def parse_point(value: Any) -> Optional[Tuple[float, float]]:
+    """
+    Parse a screen point from config.
+
+    Accepts [x, y], "x,y" or {x: .., y: ..}.
+
+    Args:
+        value: Point as written in YAML (None is allowed)
+
+    Returns:
+        (x, y) tuple, or None if no point is given
+
+    Raises:
+        ValueError: If the point is malformed
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, dict):
+        value = [value.get("x"), value.get("y")]
+    try:
+        x, y = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid point: {value}")
+    return (x, y)
+
+def union_regions(regions: Iterable[Tuple[int, int, int, int]]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Get the smallest region covering all given regions.
+
+    Args:
+        regions: (x, y, width, height) tuples
+
+    Returns:
+        Covering region, or None if no regions were given
+    """
+    regions = list(regions)
+    if not regions:
+        return None
+    left = min(r[0] for r in regions)
+    top = min(r[1] for r in regions)
+    right = max(r[0] + r[2] for r in regions)
+    bottom = max(r[1] + r[3] for r in regions)
+    return (left, top, right - left, bottom - top)
+
+def region_contains(outer: Optional[Tuple[int, int, int, int]],
+                    inner: Optional[Tuple[int, int, int, int]]) -> bool:
+    """
+    Check whether one capture region fully covers another (None means full screen).
+
+    Args:
+        outer: (x, y, width, height) or None
+        inner: (x, y, width, height) or None
+
+    Returns:
+        True if everything inside inner is also inside outer
+    """
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and
+            inner[1] + inner[3] <= outer[1] + outer[3])
+
+def box_in_region(box, region: Optional[Tuple[int, int, int, int]]) -> bool:
+    """
+    Check whether a box's center lies inside a region (always True without a region).
+
+    Args:
+        box: BoundingBox in screen coordinates
+        region: (x, y, width, height) or None
+
+    Returns:
+        True if the box center is inside the region
+    """
+    if region is None:
+        return True
+    x, y, width, height = region
+    center_x = box.x + box.width / 2
+    center_y = box.y + box.height / 2
+    return x <= center_x <= x + width and y <= center_y <= y + height
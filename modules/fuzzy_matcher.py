@@ -0,0 +1,172 @@
+"""
+OCR-tolerant fuzzy text matching for the "fuzzy" text_match strategy.
+Texts are normalized for common OCR confusions (0/O, 1/l/I, 5/S) and compared
+by edit distance; a per-frame trigram index prunes candidates first so only a
+handful of elements need the full comparison.
+"""
+
+import re
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUZZY_THRESHOLD = 0.8
+
+# Characters OCR commonly confuses, folded to one representative on both sides
+_OCR_FOLD = str.maketrans({"0": "o", "1": "l", "i": "l", "|": "l", "!": "l", "5": "s"})
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for fuzzy comparison.
+
+    Args:
+        text: Raw element or config text
+
+    Returns:
+        Lower-cased text with OCR confusions folded and whitespace collapsed
+    """
+    return _WHITESPACE.sub(" ", text.lower().translate(_OCR_FOLD)).strip()
+
+def edit_distance(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """
+    Levenshtein distance between two strings.
+
+    Args:
+        a: First string
+        b: Second string
+        max_distance: Stop early once the distance is known to exceed this
+
+    Returns:
+        Edit distance (max_distance + 1 if the cutoff was exceeded)
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+def similarity(a: str, b: str) -> float:
+    """
+    Similarity of two texts after normalization (1.0 means identical).
+
+    Args:
+        a: First text
+        b: Second text
+
+    Returns:
+        1 - edit_distance / length of the longer text
+    """
+    a, b = normalize_text(a), normalize_text(b)
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    return 1.0 - edit_distance(a, b) / longest
+
+def _ngrams(text: str, n: int) -> List[str]:
+    padded = f"{' ' * (n - 1)}{text}{' ' * (n - 1)}"
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+class FuzzyIndex:
+    """Trigram index over the element texts of one frame."""
+
+    def __init__(self, texts: Sequence[str], n: int = 3):
+        """
+        Build the index.
+
+        Args:
+            texts: Element texts in detection order (empty strings are skipped)
+            n: Gram size
+        """
+        self.n = n
+        self.texts = [normalize_text(text) if text else "" for text in texts]
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for index, text in enumerate(self.texts):
+            if text:
+                for gram in set(_ngrams(text, n)):
+                    self._postings[gram].append(index)
+
+    def find(self, query: str, threshold: float = DEFAULT_FUZZY_THRESHOLD) -> List[Tuple[int, float]]:
+        """
+        Find element texts similar to a query.
+
+        Candidates are pruned by length and by the q-gram count filter
+        (each edit removes at most n of the query's distinct grams)
+        before the edit distance is computed.
+
+        Args:
+            query: Text to look for
+            threshold: Minimum similarity (0-1)
+
+        Returns:
+            (element index, similarity) pairs, best match first
+        """
+        query = normalize_text(query)
+        if not query:
+            return []
+
+        # Longest candidate that could still reach the threshold, and its distance budget
+        longest = int(len(query) / threshold) if threshold > 0 else max(map(len, self.texts), default=0)
+        max_distance = int((1.0 - threshold) * max(len(query), longest) + 1e-9)
+        grams = set(_ngrams(query, self.n))
+        min_shared = len(grams) - max_distance * self.n
+
+        if min_shared > 0:
+            shared: Dict[int, int] = defaultdict(int)
+            for gram in grams:
+                for index in self._postings.get(gram, ()):
+                    shared[index] += 1
+            candidates = [index for index, count in shared.items() if count >= min_shared]
+        else:
+            candidates = [index for index, text in enumerate(self.texts) if text]
+
+        results = []
+        for index in candidates:
+            text = self.texts[index]
+            length = max(len(query), len(text))
+            allowed = int((1.0 - threshold) * length + 1e-9)
+            if abs(len(query) - len(text)) > allowed:
+                continue
+            distance = edit_distance(query, text, allowed)
+            if distance <= allowed:
+                results.append((index, 1.0 - distance / length))
+
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results
+
+_last_index: Tuple[Optional[list], Optional[FuzzyIndex]] = (None, None)
+
+def get_fuzzy_index(bounding_boxes: list) -> FuzzyIndex:
+    """
+    Get the fuzzy index for a frame's detected elements, reusing the last one
+    built for the same list so several fuzzy rules share one index.
+
+    Args:
+        bounding_boxes: Detected UI elements
+
+    Returns:
+        FuzzyIndex over their texts
+    """
+    global _last_index
+    boxes, index = _last_index
+    if boxes is not bounding_boxes or len(index.texts) != len(bounding_boxes):
+        index = FuzzyIndex([bbox.element_text for bbox in bounding_boxes])
+        _last_index = (bounding_boxes, index)
+    return index
@@ -0,0 +1,200 @@
+"""
+Image preprocessing for vision-language model uploads.
+Shrinks screenshots to what each backend actually looks at (a maximum side or
+an image-token budget) and re-encodes them as JPEG or PNG depending on their
+content. The result is a Frame whose scale records the transform, so boxes
+the model returns map back to screen coordinates as usual.
+"""
+
+import io
+import math
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from modules.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+# What each backend does with an image anyway: Gemma 3's encoder works on a
+# fixed 896x896 input, Qwen2-VL turns every 28x28 pixel patch into one token
+BACKEND_PRESETS: Dict[str, Dict[str, Any]] = {
+    "gemma": {"max_side": 896, "fixed_tokens": 256},
+    "qwen": {"token_budget": 1280, "pixels_per_token": 28 * 28},
+}
+
+# More distinct colors than this in a thumbnail means photographic content (JPEG)
+PHOTO_COLOR_THRESHOLD = 1024
+
+class ImagePreprocessor:
+    """Resizes and re-encodes frames before they are sent to a vision model."""
+
+    def __init__(self, max_side: Optional[int] = None, token_budget: Optional[int] = None,
+                 pixels_per_token: int = 28 * 28, fixed_tokens: Optional[int] = None,
+                 image_format: str = "auto", jpeg_quality: int = 90):
+        """
+        Initialize the preprocessor.
+
+        Args:
+            max_side: Longest image side to send in pixels (None for no limit)
+            token_budget: Maximum image tokens to send (None for no limit)
+            pixels_per_token: Image pixels the backend encodes into one token
+            fixed_tokens: Tokens per image for backends with a fixed-size encoder
+            image_format: auto (by content), png or jpeg
+            jpeg_quality: JPEG quality (1-100)
+
+        Raises:
+            ValueError: If the format is not supported
+        """
+        if image_format not in ("auto", "png", "jpeg"):
+            raise ValueError(f"Unsupported upload format: {image_format}")
+        self.max_side = max_side or None
+        self.token_budget = token_budget or None
+        self.pixels_per_token = pixels_per_token
+        self.fixed_tokens = fixed_tokens
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_transform: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def for_backend(cls, backend: str, **overrides) -> 'ImagePreprocessor':
+        """
+        Create a preprocessor with a backend's defaults.
+
+        Args:
+            backend: Backend name (gemma, qwen, ...); unknown backends get no size limit
+            **overrides: Settings replacing the preset (None values are ignored)
+
+        Returns:
+            ImagePreprocessor
+        """
+        settings = dict(BACKEND_PRESETS.get(backend, {}))
+        settings.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**settings)
+
+    def scale_factor(self, width: int, height: int) -> float:
+        """
+        Resize factor for an image of the given size (never above 1.0).
+
+        Args:
+            width: Image width in pixels
+            height: Image height in pixels
+
+        Returns:
+            Factor to multiply both sides by
+        """
+        factor = 1.0
+        if self.max_side:
+            factor = min(factor, self.max_side / max(width, height))
+        if self.token_budget:
+            factor = min(factor, math.sqrt(self.token_budget * self.pixels_per_token / (width * height)))
+        return factor
+
+    def estimate_tokens(self, width: int, height: int) -> int:
+        """Image tokens the backend spends on an image of the given size."""
+        if self.fixed_tokens:
+            return self.fixed_tokens
+        side = math.sqrt(self.pixels_per_token)
+        return math.ceil(width / side) * math.ceil(height / side)
+
+    @staticmethod
+    def is_photographic(image: Image.Image) -> bool:
+        """
+        Guess whether an image compresses better as JPEG than as PNG.
+
+        Flat UI (menus, text on solid panels) has few distinct colors and stays
+        sharp and small as PNG; rendered 3D scenes have thousands and do not.
+
+        Args:
+            image: PIL image
+
+        Returns:
+            True for photographic content
+        """
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((256, 256))
+        return thumbnail.getcolors(maxcolors=PHOTO_COLOR_THRESHOLD) is None
+
+    def prepare(self, frame: Frame) -> Frame:
+        """
+        Produce the frame to upload.
+
+        Args:
+            frame: Captured frame
+
+        Returns:
+            The frame itself if nothing needs to change, otherwise a resized and/or
+            re-encoded Frame whose scale includes the resize
+        """
+        image = frame.image
+        width, height = image.size
+        factor = self.scale_factor(width, height)
+        new_size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        if new_size == (width, height):
+            factor = 1.0
+
+        resized = image.resize(new_size, Image.LANCZOS, reducing_gap=2.0) if factor < 1.0 else image
+        if self.image_format == "auto":
+            image_format = "jpeg" if self.is_photographic(resized) else "png"
+        else:
+            image_format = self.image_format
+        mime_type = f"image/{image_format}"
+
+        if factor == 1.0 and (frame.mime_type == mime_type or frame.mime_type in ("image/jpeg", "image/webp")):
+            # Already compact enough - re-encoding would only cost time
+            prepared = frame
+        else:
+            buffer = io.BytesIO()
+            if image_format == "jpeg":
+                resized.convert("RGB").save(buffer, format="JPEG", quality=self.jpeg_quality)
+            else:
+                resized.save(buffer, format="PNG", optimize=False)
+            prepared = Frame(buffer.getvalue(), path=frame.path, mime_type=mime_type,
+                             scale=frame.scale * new_size[0] / width, native_size=frame.native_size,
+                             offset=(frame.offset_x, frame.offset_y))
+            prepared.captured_at = frame.captured_at
+
+        transform = {
+            "original_size": (width, height),
+            "sent_size": prepared.size,
+            "factor": prepared.size[0] / width,
+            "format": prepared.mime_type,
+            "bytes_in": len(frame.data),
+            "bytes_out": len(prepared.data),
+            "estimated_tokens": self.estimate_tokens(*prepared.size)
+        }
+        with self._lock:
+            self.frames += 1
+            self.bytes_in += len(frame.data)
+            self.bytes_out += len(prepared.data)
+            self.last_transform = transform
+        logger.debug(f"Upload prepared: {width}x{height} -> {prepared.width}x{prepared.height} "
+                     f"{prepared.mime_type}, {len(frame.data)} -> {len(prepared.data)} bytes")
+        return prepared
+
+    def get_stats(self) -> Dict[str, float]:
+        """Frames prepared and bytes before and after preprocessing."""
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "avg_bytes_out": self.bytes_out / self.frames if self.frames else 0.0
+            }
+
+    def log_stats(self):
+        """Log upload size savings in a readable format."""
+        stats = self.get_stats()
+        if not stats["frames"]:
+            return
+        saved = 1 - stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 0.0
+        logger.info(f"Image uploads: {stats['frames']} frames, {stats['avg_bytes_out'] / 1024:.0f} KB average "
+                    f"({saved:.0%} smaller than captured)")
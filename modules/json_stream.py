@@ -0,0 +1,273 @@
+"""
+Incremental parsing of streamed LLM detections.
+Reads the server-sent events of a streaming /v1/chat/completions response and
+picks complete element objects out of the partial JSON as it arrives, so the
+caller can act on the first elements while the model is still generating.
+"""
+
+import re
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from modules.box_set import BoundingBox, BoxSet
+from modules.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+def iter_sse_content(response, usage: Optional[Dict[str, Any]] = None,
+                     timing: Optional[Dict[str, float]] = None) -> Iterator[str]:
+    """
+    Yield the content deltas of a streaming chat completion.
+
+    Args:
+        response: requests.Response opened with stream=True
+        usage: Filled with the token usage if the server reports it (stream_options.include_usage)
+        timing: Gets first_token, the time the first content arrived
+
+    Yields:
+        Text fragments in the order the model generated them
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            # Blank separators and SSE comments (keep-alives)
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping malformed stream chunk: {data[:100]}")
+            continue
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                if timing is not None and "first_token" not in timing:
+                    timing["first_token"] = time.time()
+                yield content
+
+# Characters that can change the scanner state; everything else is skipped in C
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_DECODER = json.JSONDecoder()
+# Trailing commas, the most common way LLM output is almost-JSON
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+class ElementStreamParser:
+    """
+    Single-pass, truncation-tolerant scanner for element arrays in LLM output.
+
+    Tracks string and nesting state one structural character at a time, so
+    each character is looked at once however long or broken the response is.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        # Open containers: [char, start of the object if it is an array item, last comma directly inside it]
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self.elements: List[Dict[str, Any]] = []
+
+    def feed(self, fragment: str) -> List[Dict[str, Any]]:
+        """
+        Add streamed text and return the element objects it completed.
+
+        An element is any object that is a direct item of an array, so both
+        {"elements": [...]} and a bare [...] response work, or a top-level
+        object with a box (one object per line); text around the JSON (such
+        as a ```json fence) is ignored.
+
+        Args:
+            fragment: Next piece of the response
+
+        Returns:
+            Newly completed elements (possibly empty)
+        """
+        self.text += fragment
+        completed = []
+        text = self.text
+        stack = self._stack
+        pos = self._pos
+        end = len(text)
+        while pos < end:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = end
+                    break
+                pos = match.start()
+                if text[pos] == "\\":
+                    pos += 2  # Skip the escaped character (possibly in the next fragment)
+                    continue
+                self._in_string = False
+                pos += 1
+                continue
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = end
+                break
+            pos = match.start()
+            char = text[pos]
+            if char == '"':
+                if stack:
+                    self._in_string = True
+            elif char == ",":
+                if stack and stack[-1][1] is not None:
+                    stack[-1][2] = pos
+            elif char in "{[":
+                if char == "{" and stack and stack[-1][0] == "[":
+                    # Decode a complete array item in one C call, scanning it only if it is cut off or malformed
+                    try:
+                        element, item_end = _DECODER.raw_decode(text, pos)
+                        completed.append(element)
+                        pos = item_end
+                        continue
+                    except json.JSONDecodeError:
+                        pass
+                is_item = not stack or stack[-1][0] == "["
+                stack.append([char, pos if char == "{" and is_item else None, None])
+            elif char in "}]" and stack:
+                opened, item_start, _ = stack.pop()
+                if char == "}" and opened == "{" and item_start is not None:
+                    element = self._parse_item(text[item_start:pos + 1], top_level=not stack)
+                    if element is not None:
+                        completed.append(element)
+            pos += 1
+        self._pos = pos
+        self.elements.extend(completed)
+        return completed
+
+    def partial_elements(self) -> List[Dict[str, Any]]:
+        """
+        Recover the fields of elements cut off by truncation.
+
+        An unfinished array item is closed after its last complete field, so an
+        element whose box was generated before the output stopped is kept.
+
+        Returns:
+            Repaired elements (marked with a lower default confidence)
+        """
+        partial = []
+        for depth, (_, item_start, last_comma) in enumerate(self._stack):
+            if item_start is None or last_comma is None:
+                continue
+            element = self._parse_item(self.text[item_start:last_comma] + "}", top_level=depth == 0)
+            if element is not None:
+                element.setdefault("confidence", 0.5)
+                partial.append(element)
+        return partial
+
+    @staticmethod
+    def _parse_item(item_text: str, top_level: bool = False) -> Optional[Dict[str, Any]]:
+        """Decode one element object, skipping anything that is not valid JSON (or a wrapper object)."""
+        try:
+            element = json.loads(item_text)
+        except json.JSONDecodeError:
+            try:
+                element = json.loads(_TRAILING_COMMA.sub(r"\1", item_text))
+            except json.JSONDecodeError:
+                logger.debug(f"Skipping unparsable element: {item_text[:100]}")
+                return None
+        if not isinstance(element, dict) or (top_level and "box" not in element):
+            return None
+        return element
+
+def extract_elements(text: str) -> List[Dict[str, Any]]:
+    """
+    Recover every element object from a possibly malformed or truncated response.
+
+    Args:
+        text: Complete (or cut off) model output
+
+    Returns:
+        Element dictionaries, including repaired truncated ones
+    """
+    # Well-formed JSON (possibly fenced) is decoded in one go
+    start = min((index for index in (text.find("{"), text.find("[")) if index >= 0), default=-1)
+    if start >= 0:
+        try:
+            result = json.loads(text[start:max(text.rfind("}"), text.rfind("]")) + 1])
+            if isinstance(result, dict):
+                result = result.get("elements") if "box" not in result else [result]
+            if isinstance(result, list):
+                return [element for element in result if isinstance(element, dict)]
+        except json.JSONDecodeError:
+            pass
+
+    parser = ElementStreamParser()
+    parser.feed(text)
+    return parser.elements + parser.partial_elements()
+
+def element_to_box(element: Dict[str, Any]) -> Optional[BoundingBox]:
+    """
+    Convert a detected element from the LLM response format to a BoundingBox.
+
+    Args:
+        element: {"box": {x, y, width, height}, "type": .., "text": .., "confidence": ..}
+
+    Returns:
+        BoundingBox, or None if the element has no usable box (missing, null
+        or non-numeric coordinates)
+    """
+    box = element.get("box")
+    if not isinstance(box, dict):
+        return None
+    try:
+        text = element.get("text")
+        confidence = element.get("confidence")
+        return BoundingBox(
+            x=int(float(box["x"])),
+            y=int(float(box["y"])),
+            width=int(float(box["width"])),
+            height=int(float(box["height"])),
+            confidence=0.8 if confidence is None else float(confidence),
+            element_type=str(element.get("type", "unknown")),
+            element_text="" if text is None else str(text)
+        )
+    except KeyError as e:
+        logger.warning(f"Missing key in element data: {e}, skipping this element")
+        return None
+    except (TypeError, ValueError, OverflowError) as e:
+        logger.warning(f"Invalid value in element data {box}: {str(e)}, skipping this element")
+        return None
+
+def read_streamed_boxes(response, frame: Frame, accept: Callable[[BoxSet], bool] = None,
+                        usage: Optional[Dict[str, Any]] = None,
+                        timing: Optional[Dict[str, float]] = None,
+                        cancel: Optional[threading.Event] = None) -> Tuple[BoxSet, str, bool]:
+    """
+    Collect detections from a streaming response, stopping once they are enough.
+
+    Args:
+        response: requests.Response opened with stream=True
+        frame: Frame the detections refer to (boxes are mapped to screen coordinates)
+        accept: Predicate over the elements so far; when it passes, reading stops
+        usage: Filled with the token usage if the server reports it
+        timing: Gets first_token, the time the first content arrived
+        cancel: When set, reading stops at the next fragment (the result is no longer wanted)
+
+    Returns:
+        (detections in screen coordinates, text received, whether accept or cancel stopped the stream)
+    """
+    parser = ElementStreamParser()
+    boxes = []
+    for fragment in iter_sse_content(response, usage, timing):
+        if cancel is not None and cancel.is_set():
+            return frame.map_boxes_to_screen(BoxSet.from_boxes(boxes)), parser.text, True
+        new_boxes = [box for box in map(element_to_box, parser.feed(fragment)) if box is not None]
+        if not new_boxes:
+            continue
+        boxes.extend(new_boxes)
+        if accept is not None:
+            mapped = frame.map_boxes_to_screen(BoxSet.from_boxes(boxes))
+            if accept(mapped):
+                return mapped, parser.text, True
+    # Generation ended (or hit max_tokens) - keep what can be salvaged from a cut-off element
+    boxes.extend(box for box in map(element_to_box, parser.partial_elements()) if box is not None)
+    return frame.map_boxes_to_screen(BoxSet.from_boxes(boxes)), parser.text, False
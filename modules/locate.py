@@ -0,0 +1,130 @@
+"""
+Targeted element lookup for the LLM vision clients.
+Instead of listing every UI element on screen, the model is asked for the box
+of the one element a selector describes, answering in a fixed schema that
+fits in a few dozen output tokens.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from modules.box_set import BoundingBox
+from modules.element_matcher import SPATIAL_KEYS
+from modules.json_stream import extract_elements
+
+logger = logging.getLogger(__name__)
+
+# Enough for {"found": true, "box": {...}, "text": "..."} with a short label
+LOCATE_MAX_TOKENS = 80
+
+LOCATE_SYSTEM_PROMPT = """You are a computer vision system that finds one UI element in a game screenshot.
+Return the box of the requested element as {x, y, width, height} with (0,0) at the top-left of the image.
+Be extremely precise: the coordinates must correspond to the EXACT pixels of the element.
+If the element is not visible, set found to false.
+
+Respond ONLY with JSON in this format:
+{"found": true, "box": {"x": 100, "y": 200, "width": 150, "height": 50}, "text": "Start Game"}"""
+
+# Structured output (OpenAI/LM Studio response_format) so the answer cannot drift from the schema
+LOCATE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "located_element",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "found": {"type": "boolean"},
+                "box": {
+                    "type": "object",
+                    "properties": {
+                        "x": {"type": "integer"},
+                        "y": {"type": "integer"},
+                        "width": {"type": "integer"},
+                        "height": {"type": "integer"}
+                    },
+                    "required": ["x", "y", "width", "height"],
+                    "additionalProperties": False
+                },
+                "text": {"type": "string"}
+            },
+            "required": ["found", "box", "text"],
+            "additionalProperties": False
+        }
+    }
+}
+
+MATCH_PHRASES = {
+    "exact": "is exactly",
+    "contains": "contains",
+    "startswith": "starts with",
+    "endswith": "ends with",
+    "fuzzy": "reads approximately"
+}
+
+def can_locate(target_def: Dict[str, Any]) -> bool:
+    """
+    Check whether a selector can be described to the model on its own.
+
+    Elements are located by their text; selectors positioned relative to other
+    elements (below, nearest_to, index, ...) need the full detection.
+
+    Args:
+        target_def: Element definition from the game config
+
+    Returns:
+        True if locate can be used for it
+    """
+    return (bool(target_def.get("text"))
+            and target_def.get("text_match", "contains") in MATCH_PHRASES
+            and not any(key in target_def for key in SPATIAL_KEYS))
+
+def build_locate_prompt(target_def: Dict[str, Any]) -> str:
+    """
+    Describe the element a selector matches.
+
+    Args:
+        target_def: Element definition from the game config
+
+    Returns:
+        User prompt asking for that element only
+    """
+    element_type = target_def.get("type", "any")
+    noun = "UI element" if element_type in ("any", "") else element_type
+    phrase = MATCH_PHRASES.get(target_def.get("text_match", "contains"), "contains")
+    return (f"Return only the box of the {noun} whose text {phrase} '{target_def.get('text', '')}'. "
+            f"Ignore every other element.")
+
+def parse_locate_response(text: str, target_def: Dict[str, Any]) -> Optional[BoundingBox]:
+    """
+    Read the located element from the model's answer.
+
+    Args:
+        text: Model output
+        target_def: Element definition that was asked for
+
+    Returns:
+        BoundingBox in image coordinates, or None if the element was not found
+    """
+    elements = extract_elements(text)
+    if not elements or not elements[0].get("found", True):
+        return None
+    element = elements[0]
+    box = element.get("box") or {}
+    try:
+        width, height = int(box["width"]), int(box["height"])
+        if width <= 0 or height <= 0:
+            return None
+        element_type = target_def.get("type", "any")
+        return BoundingBox(
+            x=int(box["x"]),
+            y=int(box["y"]),
+            width=width,
+            height=height,
+            confidence=float(element.get("confidence", 0.9)),
+            element_type="unknown" if element_type in ("any", "") else element_type,
+            element_text=element.get("text") or target_def.get("text", "")
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Invalid locate response {text[:200]}: {str(e)}")
+        return None
@@ -5,35 +5,86 @@ Handles all network operations between the development PC and the system under t
 
 import socket
 import json
+import time
 import logging
+import threading
 import requests
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple, List, Callable
+
+from modules.control_channel import ChannelSendError, ControlChannel
 
 logger = logging.getLogger(__name__)
 
 class NetworkManager:
     """Manages network communication with the SUT."""
     
-    def __init__(self, sut_ip: str, sut_port: int):
+    def __init__(self, sut_ip: str, sut_port: int, screenshot_format: str = "png",
+                 screenshot_quality: int = 85, screenshot_scale: float = 1.0,
+                 use_channel: bool = True, channel_port: Optional[int] = None, connect: bool = True):
         """
         Initialize the network manager.
         
         Args:
             sut_ip: IP address of the system under test
             sut_port: Port number for communication
+            screenshot_format: Screenshot transport format (png, jpeg or webp)
+            screenshot_quality: Quality for lossy formats (1-100)
+            screenshot_scale: Server-side downscale factor (0 < scale <= 1)
+            use_channel: Use the persistent control channel if the SUT offers one
+            channel_port: Control channel port (defaults to the port the SUT advertises)
+            connect: Check the SUT and open the channel now; if False this happens on first use
+        
+        Raises:
+            ConnectionError: If connect is True and the SUT is not reachable
         """
         self.sut_ip = sut_ip
         self.sut_port = sut_port
         self.base_url = f"http://{sut_ip}:{sut_port}"
         self.session = requests.Session()
+        self.screenshot_format = screenshot_format
+        self.screenshot_quality = screenshot_quality
+        self.screenshot_scale = screenshot_scale
+        self.capabilities: List[str] = []
+        self.channel: Optional[ControlChannel] = None
+        self._advertised_channel_port = None
+        self._use_channel = use_channel
+        self._channel_port = channel_port
+        self._connect_lock = threading.Lock()
+        self._connected = False
+        self._batch_state = threading.local()  # Per-thread queue of actions being coalesced
         logger.info(f"NetworkManager initialized with SUT at {self.base_url}")
         
-        # Verify connection
+        if connect:
+            self.connect()
+    
+    def connect(self):
+        """
+        Verify the SUT is reachable, read its capabilities and open the control channel.
+        
+        Raises:
+            ConnectionError: If the SUT is not reachable
+        """
+        with self._connect_lock:
+            if self._connected:
+                return
+            try:
+                self._check_connection()
+            except Exception as e:
+                logger.error(f"Failed to connect to SUT: {str(e)}")
+                raise
+            self._connected = True
+            if self._use_channel:
+                self._open_channel(self._channel_port)
+    
+    def _ensure_connected(self):
+        """Connect on first use when the manager was created with connect=False."""
+        if self._connected:
+            return
         try:
-            self._check_connection()
-        except Exception as e:
-            logger.error(f"Failed to connect to SUT: {str(e)}")
-            raise
+            self.connect()
+        except ConnectionError:
+            pass  # The request itself fails over HTTP and reports the error
     
     def _check_connection(self) -> bool:
         """
@@ -48,16 +99,98 @@ class NetworkManager:
         try:
             response = self.session.get(f"{self.base_url}/status", timeout=5)
             response.raise_for_status()
+            try:
+                status = response.json()
+                self.capabilities = status.get("capabilities", [])
+                self._advertised_channel_port = status.get("channel_port")
+            except ValueError:
+                self.capabilities = []
             logger.info("Successfully connected to SUT")
             return True
         except requests.RequestException as e:
             logger.error(f"Connection check failed: {str(e)}")
             raise ConnectionError(f"Cannot connect to SUT at {self.base_url}: {str(e)}")
     
+    def _open_channel(self, channel_port: Optional[int] = None):
+        """
+        Open the persistent control channel, staying on HTTP if it is unavailable.
+        
+        Args:
+            channel_port: Explicit port, or None to use the one advertised in /status
+        """
+        if channel_port is None:
+            if not self.supports("control_channel") or not self._advertised_channel_port:
+                logger.info("SUT does not offer a control channel, using HTTP")
+                return
+            channel_port = self._advertised_channel_port
+        
+        try:
+            self.channel = ControlChannel(self.sut_ip, int(channel_port))
+        except OSError as e:
+            logger.warning(f"Control channel unavailable on port {channel_port}, using HTTP: {str(e)}")
+            self.channel = None
+    
+    def _channel_request(self, op: str, params: Dict[str, Any], timeout: Optional[float] = None,
+                         repeatable: bool = True) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """
+        Send a request over the control channel.
+        
+        Args:
+            op: Channel operation name
+            params: Operation parameters
+            timeout: Seconds to wait for the response
+            repeatable: Whether running the request twice is harmless (reads are,
+                        clicks and key presses are not)
+        
+        Returns:
+            Tuple of (response dict, payload bytes), or None if the caller should
+            fall back to HTTP
+        
+        Raises:
+            RequestException: If a non-repeatable request was sent but its outcome
+                              is unknown, so sending it again over HTTP could repeat it
+        """
+        self._ensure_connected()
+        if self.channel is None or not self.channel.connected:
+            return None
+        try:
+            return self.channel.request(op, params, timeout)
+        except ChannelSendError as e:
+            logger.warning(f"Control channel {op} not sent, falling back to HTTP: {str(e)}")
+            return None
+        except (ConnectionError, TimeoutError) as e:
+            if repeatable:
+                logger.warning(f"Control channel {op} failed, falling back to HTTP: {str(e)}")
+                return None
+            # The SUT may already be running it - resending over HTTP could click or type twice
+            logger.error(f"Control channel {op} failed after it was sent, not resending: {str(e)}")
+            if isinstance(e, TimeoutError):
+                raise requests.Timeout(f"Control channel {op} timed out: {str(e)}")
+            raise requests.ConnectionError(f"Control channel {op} lost: {str(e)}")
+    
+    def add_event_listener(self, callback: Callable[[str, Dict[str, Any]], None]) -> bool:
+        """
+        Register a callback for events pushed by the SUT (e.g. game_launched).
+        
+        Args:
+            callback: Called as callback(event_name, data) on the channel's reader thread
+        
+        Returns:
+            True if registered, False if no control channel is open
+        """
+        self._ensure_connected()
+        if self.channel is None:
+            return False
+        self.channel.add_event_listener(callback)
+        return True
+    
     def send_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
         """
         Send an action command to the SUT.
         
+        Inside a batch() block the action is queued and sent together with
+        the rest of the batch when the block exits.
+        
         Args:
             action: Dictionary containing action details
                    Example: {"type": "click", "x": 100, "y": 200}
@@ -68,6 +201,16 @@ class NetworkManager:
         Raises:
             RequestException: If the request fails
         """
+        if self.in_batch:
+            self._batch_state.actions.append(dict(action))
+            return {"status": "queued", "action": action.get("type")}
+        
+        reply = self._channel_request("action", action, timeout=10, repeatable=False)
+        if reply is not None:
+            result = reply[0]
+            logger.debug(f"Action sent over channel: {action}, Response: {result}")
+            return result
+        
         try:
             response = self.session.post(
                 f"{self.base_url}/action",
@@ -82,6 +225,150 @@ class NetworkManager:
             logger.error(f"Failed to send action {action}: {str(e)}")
             raise
     
+    def send_actions(self, actions: List[Dict[str, Any]], stop_on_error: bool = True) -> Dict[str, Any]:
+        """
+        Execute an ordered list of actions in a single round-trip.
+        
+        Each action may carry a "delay_after" (seconds) that the SUT waits
+        before running the next one. Falls back to one request per action
+        if the SUT does not support batching.
+        
+        Args:
+            actions: Actions to execute in order
+            stop_on_error: Stop at the first failing action
+        
+        Returns:
+            Batch result with status, actions_completed and per-action results
+        
+        Raises:
+            RequestException: If the request fails
+        """
+        if not actions:
+            return {"status": "success", "actions_completed": 0, "results": []}
+        
+        if not self.supports("action_batch"):
+            return self._send_actions_sequentially(actions, stop_on_error)
+        
+        # Budget for the server-side delays and waits on top of the normal action timeout
+        server_time = sum(float(a.get("delay_after", 0)) + float(a.get("duration", 0)) for a in actions)
+        reply = self._channel_request("actions", {"actions": actions, "stop_on_error": stop_on_error},
+                                      timeout=10 + server_time, repeatable=False)
+        if reply is not None:
+            result = reply[0]
+            logger.debug(f"Batch of {len(actions)} actions sent over channel, completed: {result.get('actions_completed')}")
+            return result
+        
+        try:
+            response = self.session.post(
+                f"{self.base_url}/actions/batch",
+                json={"actions": actions, "stop_on_error": stop_on_error},
+                timeout=10 + server_time
+            )
+            # Failed batches come back as 500 with per-action results in the body
+            try:
+                result = response.json()
+            except ValueError:
+                response.raise_for_status()
+                raise
+            if "results" not in result:
+                response.raise_for_status()
+            logger.debug(f"Batch of {len(actions)} actions sent, completed: {result.get('actions_completed')}")
+            return result
+        except requests.RequestException as e:
+            logger.error(f"Failed to send batch of {len(actions)} actions: {str(e)}")
+            raise
+    
+    def _send_actions_sequentially(self, actions: List[Dict[str, Any]], stop_on_error: bool) -> Dict[str, Any]:
+        """Send a batch one action per request (SUT without /actions/batch)."""
+        results = []
+        for action in actions:
+            action = dict(action)
+            delay_after = action.pop("delay_after", 0)
+            try:
+                result = self.send_action(action)
+            except requests.RequestException as e:
+                result = {"status": "error", "error": str(e)}
+            results.append(result)
+            if result.get("status") != "success" and stop_on_error:
+                return {"status": "error", "actions_completed": len(results) - 1, "results": results}
+            if delay_after > 0:
+                time.sleep(delay_after)
+        
+        failed = any(r.get("status") != "success" for r in results)
+        return {"status": "error" if failed else "success", "actions_completed": len(results), "results": results}
+    
+    @property
+    def in_batch(self) -> bool:
+        """True while inside a batch() block on the calling thread."""
+        return getattr(self._batch_state, "depth", 0) > 0
+    
+    @contextmanager
+    def batch(self):
+        """
+        Coalesce the send_action/pause calls made inside the block into one
+        /actions/batch request, sent when the outermost block exits.
+        
+        Raises:
+            RuntimeError: If any action in the batch failed on the SUT
+        """
+        state = self._batch_state
+        if getattr(state, "depth", 0) == 0:
+            state.actions = []
+        state.depth = getattr(state, "depth", 0) + 1
+        
+        try:
+            yield self
+        except BaseException:
+            if state.depth == 1:
+                state.actions = []  # Don't send a half-built batch
+            raise
+        finally:
+            state.depth -= 1
+        
+        if state.depth == 0:
+            self._send_queued()
+    
+    def flush(self):
+        """
+        Send the actions queued so far in a batch() block now, so that work
+        which cannot run on the SUT (such as a conditional wait) happens after
+        them. The block keeps queueing afterwards.
+        
+        Raises:
+            RuntimeError: If any action in the batch failed on the SUT
+        """
+        if self.in_batch:
+            self._send_queued()
+    
+    def _send_queued(self):
+        """Send the calling thread's queued batch actions and raise if any failed."""
+        state = self._batch_state
+        actions, state.actions = state.actions, []
+        if not actions:
+            return
+        result = self.send_actions(actions)
+        if result.get("status") != "success":
+            completed = result.get("actions_completed", 0)
+            errors = [r.get("error") for r in result.get("results", []) if r.get("status") != "success"]
+            raise RuntimeError(f"Batch failed after {completed}/{len(actions)} actions: {errors[:1]}")
+    
+    def pause(self, seconds: float):
+        """
+        Pause between actions: added as delay_after to the previous queued
+        action inside a batch, otherwise a local sleep.
+        
+        Args:
+            seconds: Pause duration
+        """
+        if seconds <= 0:
+            return
+        actions = self._batch_state.actions if self.in_batch else None
+        if actions:
+            actions[-1]["delay_after"] = actions[-1].get("delay_after", 0) + seconds
+        else:
+            # Nothing queued yet, so sleeping here keeps the order
+            time.sleep(seconds)
+    
     def get_screenshot(self) -> bytes:
         """
         Request a screenshot from the SUT.
@@ -92,18 +379,162 @@ class NetworkManager:
         Raises:
             RequestException: If the request fails
         """
+        screenshot_data, _ = self.get_screenshot_with_metadata()
+        return screenshot_data
+    
+    def get_screenshot_with_metadata(self, region: Optional[Tuple[int, int, int, int]] = None) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Request a screenshot from the SUT in the configured transport format.
+        
+        Args:
+            region: Optional (x, y, width, height) region to capture
+        
+        Returns:
+            Tuple of (raw image bytes, metadata) where metadata holds
+            mime_type, scale and native_size (None if the SUT did not report it)
+        
+        Raises:
+            RequestException: If the request fails
+        """
+        params = {}
+        if self.screenshot_format != "png":
+            params["format"] = self.screenshot_format
+            params["quality"] = self.screenshot_quality
+        if self.screenshot_scale < 1.0:
+            params["scale"] = self.screenshot_scale
+        if region:
+            params["region"] = ",".join(str(int(v)) for v in region)
+        
+        reply = self._channel_request("screenshot", params, timeout=15)
+        if reply is not None and reply[0].get("status") == "success":
+            result, data = reply
+            metadata = {
+                "mime_type": result.get("mime_type", "image/png"),
+                "scale": float(result.get("scale", 1.0)),
+                "native_size": (result["native_width"], result["native_height"])
+                               if "native_width" in result else None
+            }
+            logger.debug(f"Screenshot retrieved over channel ({len(data)} bytes, "
+                         f"{metadata['mime_type']}, scale {metadata['scale']:.3f})")
+            return data, metadata
+        
         try:
             response = self.session.get(
                 f"{self.base_url}/screenshot",
+                params=params,
                 timeout=15
             )
             response.raise_for_status()
-            logger.debug("Screenshot retrieved successfully")
-            return response.content
+            
+            # Older SUT services ignore the parameters and send a full-size PNG without these headers
+            headers = response.headers
+            native_size = None
+            if "X-Native-Width" in headers and "X-Native-Height" in headers:
+                native_size = (int(headers["X-Native-Width"]), int(headers["X-Native-Height"]))
+            metadata = {
+                "mime_type": headers.get("Content-Type", "image/png").split(";")[0],
+                "scale": float(headers.get("X-Scale", 1.0)),
+                "native_size": native_size
+            }
+            
+            logger.debug(f"Screenshot retrieved successfully ({len(response.content)} bytes, "
+                         f"{metadata['mime_type']}, scale {metadata['scale']:.3f})")
+            return response.content, metadata
         except requests.RequestException as e:
             logger.error(f"Failed to get screenshot: {str(e)}")
             raise
     
+    def supports(self, capability: str) -> bool:
+        """
+        Check whether the SUT service advertises a capability in /status.
+        
+        Args:
+            capability: Capability name, e.g. "screen_change_detection"
+        
+        Returns:
+            True if the capability is supported
+        """
+        self._ensure_connected()
+        return capability in self.capabilities
+    
+    def get_screen_hash(self) -> Optional[str]:
+        """
+        Get a perceptual hash of the SUT's current screen.
+        
+        Returns:
+            Hex hash string, or None if the SUT does not support change detection
+        """
+        if not self.supports("screen_change_detection"):
+            return None
+        reply = self._channel_request("screen_hash", {}, timeout=5)
+        if reply is not None and reply[0].get("status") == "success":
+            return reply[0].get("hash")
+        try:
+            response = self.session.get(f"{self.base_url}/screenshot/hash", timeout=5)
+            response.raise_for_status()
+            return response.json().get("hash")
+        except requests.RequestException as e:
+            logger.warning(f"Failed to get screen hash: {str(e)}")
+            return None
+    
+    def get_pixels(self, points: List[Tuple[int, int]],
+                   regions: List[Tuple[int, int, int, int]]) -> Optional[Dict[str, Any]]:
+        """
+        Sample pixel colors on the SUT without transferring an image.
+        
+        Args:
+            points: (x, y) screen points
+            regions: (x, y, width, height) regions whose mean color is wanted
+        
+        Returns:
+            Dict with "points" and "regions" lists of [r, g, b] values, or None if
+            the SUT does not support pixel probes or the request failed
+        """
+        if not self.supports("pixel_probe"):
+            return None
+        params = {"points": [list(point) for point in points], "regions": [list(region) for region in regions]}
+        reply = self._channel_request("pixels", params, timeout=5)
+        if reply is not None and reply[0].get("status") == "success":
+            return reply[0]
+        try:
+            response = self.session.post(f"{self.base_url}/pixels", json=params, timeout=5)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            logger.warning(f"Failed to sample pixels: {str(e)}")
+            return None
+    
+    def wait_for_screen_change(self, reference_hash: Optional[str] = None, threshold: int = 4,
+                               timeout: float = 10.0, settle: float = 0.5) -> Optional[Dict[str, Any]]:
+        """
+        Block until the SUT's screen differs from a reference hash and has settled.
+        
+        Args:
+            reference_hash: Hash from get_screen_hash (None only waits for the screen to settle)
+            threshold: Hash bits that may differ before the screen counts as changed
+            timeout: Maximum seconds to wait
+            settle: Seconds the screen must stay unchanged
+        
+        Returns:
+            Result with changed, settled, hash and elapsed keys, or None if unsupported or failed
+        """
+        if not self.supports("screen_change_detection"):
+            return None
+        params = {"threshold": threshold, "timeout": timeout, "settle": settle}
+        if reference_hash:
+            params["reference"] = reference_hash
+        try:
+            response = self.session.get(
+                f"{self.base_url}/screenshot/changed",
+                params=params,
+                timeout=timeout + 10  # Long-poll: allow for the server-side wait
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            logger.warning(f"Screen change wait failed: {str(e)}")
+            return None
+    
     def launch_game(self, game_path: str) -> Dict[str, Any]:
         """
         Request the SUT to launch a game.
@@ -132,6 +563,9 @@ class NetworkManager:
             raise
     
     def close(self):
-        """Close the network session."""
+        """Close the control channel and the network session."""
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
         self.session.close()
         logger.info("Network session closed")
\ No newline at end of file
@@ -10,28 +10,37 @@ import logging
 import requests
 import json
 import re
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union
 from dataclasses import dataclass
 from io import BytesIO
 from PIL import Image
 
 from modules.gemma_client import BoundingBox  # Reuse the BoundingBox class
+from modules.box_set import BoxSet
+from modules.frame import Frame
+from modules.vision_client import VisionClient
+from modules.archive_writer import ArchiveWriter, get_archive_writer
+from modules.endpoint_pool import EndpointPool
 
 logger = logging.getLogger(__name__)
 
-class OmniparserClient:
+class OmniparserClient(VisionClient):
     """Client for the Omniparser API server with streamlined annotation handling."""
     
-    def __init__(self, api_url: str = "http://localhost:8000"):
+    def __init__(self, api_url: str = "http://localhost:8000", archive_writer: ArchiveWriter = None):
         """
         Initialize the Omniparser client.
         
         Args:
-            api_url: URL of the Omniparser API server
+            api_url: URL of the Omniparser API server; several comma-separated URLs
+                     are load-balanced as an EndpointPool
+            archive_writer: Background writer for annotations and JSON dumps (defaults to the shared one)
         """
         self.api_url = api_url
         self.session = requests.Session()
-        # Assuming 2560x1600 resolution - adjust as needed for your target resolution
+        self.pool = EndpointPool(api_url, probe_path="/probe", session=self.session)
+        self.archive_writer = archive_writer or get_archive_writer()
+        # Fallback resolution for normalized coordinates when no image size is known
         self.screen_width = 2560
         self.screen_height = 1600
         logger.info(f"OmniparserClient initialized with API URL: {api_url}")
@@ -46,35 +55,37 @@ class OmniparserClient:
     
     def _test_connection(self):
         """Test connection to the API."""
-        response = self.session.get(f"{self.api_url}/probe")
+        self.pool.probe_all()
+        response = self.pool.request("get", "/probe", timeout=10)
         response.raise_for_status()
         return response.json()
     
-    def _encode_image(self, image_path: str) -> str:
+    def _encode_image(self, image: Union[Frame, str]) -> str:
         """
-        Encode an image file to base64.
+        Encode an image to base64.
         
         Args:
-            image_path: Path to the image file
+            image: Frame or path to the image file
         
         Returns:
             Base64-encoded image string
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return Frame.coerce(image).base64
     
-    def _parse_omniparser_response(self, response_data: Dict) -> List[BoundingBox]:
+    def _parse_omniparser_response(self, response_data: Dict, image_size: Tuple[int, int] = None) -> BoxSet:
         """
         Parse the response from Omniparser into BoundingBox objects.
         COMPREHENSIVE filtering to capture ALL useful elements for gaming performance analysis.
         
         Args:
             response_data: Response JSON from Omniparser
+            image_size: (width, height) of the image that was parsed
             
         Returns:
-            List of BoundingBox objects
+            BoxSet of UI elements in image coordinates
         """
         bounding_boxes = []
+        image_width, image_height = image_size or (self.screen_width, self.screen_height)
         
         # Extract parsed content list from response
         parsed_content_list = response_data.get("parsed_content_list", [])
@@ -102,10 +113,10 @@ class OmniparserClient:
                     x1, y1, x2, y2 = bbox_coords
                     
                     # Convert normalized to absolute coordinates
-                    abs_x1 = int(x1 * self.screen_width)
-                    abs_y1 = int(y1 * self.screen_height)
-                    abs_x2 = int(x2 * self.screen_width)
-                    abs_y2 = int(y2 * self.screen_height)
+                    abs_x1 = int(x1 * image_width)
+                    abs_y1 = int(y1 * image_height)
+                    abs_x2 = int(x2 * image_width)
+                    abs_y2 = int(y2 * image_height)
                     
                     # Get element properties
                     is_interactive = element.get('interactivity', False)
@@ -177,7 +188,7 @@ class OmniparserClient:
         logger.info(f"  - Performance data elements: {performance_data_count}")
         logger.info(f"  - Total useful elements: {len(bounding_boxes)}")
         
-        return bounding_boxes
+        return BoxSet.from_boxes(bounding_boxes)
     
     def _format_bounding_boxes(self, bboxes: List[BoundingBox]) -> str:
         """
@@ -205,12 +216,12 @@ class OmniparserClient:
         
         return "\n".join(formatted)
     
-    def detect_ui_elements(self, image_path: str, annotation_path: str = None) -> List[BoundingBox]:
+    def detect_ui_elements(self, image: Union[Frame, str], annotation_path: str = None) -> List[BoundingBox]:
         """
         Send an image to Omniparser and get UI element detections with streamlined annotation handling.
         
         Args:
-            image_path: Path to the screenshot image
+            image: Frame or path of the screenshot image
             annotation_path: Optional path to save server annotation (NEW STREAMLINED APPROACH)
         
         Returns:
@@ -221,22 +232,18 @@ class OmniparserClient:
             ValueError: If the response cannot be parsed
         """
         try:
-            # Check if the image file exists
-            if not os.path.exists(image_path):
-                raise FileNotFoundError(f"Image file not found: {image_path}")
-            
-            # Encode the image
-            base64_image = self._encode_image(image_path)
+            # Use the in-memory frame (raises FileNotFoundError for a missing path)
+            frame = Frame.coerce(image)
             
             # Prepare the payload for Omniparser
             payload = {
-                "base64_image": base64_image
+                "base64_image": frame.base64
             }
             
             # Send the request to Omniparser API
-            logger.info(f"Sending request to {self.api_url}/parse/")
-            response = self.session.post(
-                f"{self.api_url}/parse/",
+            logger.info(f"Sending request to /parse/ at {self.pool}")
+            response = self.pool.request(
+                "post", "/parse/",
                 json=payload,
                 headers={"Content-Type": "application/json"},
                 timeout=60  # Longer timeout for image processing
@@ -251,34 +258,35 @@ class OmniparserClient:
                 logger.info(f"Omniparser processing time: {response_data['latency']:.2f} seconds")
             
             # Extract and convert bounding boxes
-            bounding_boxes = self._parse_omniparser_response(response_data)
+            bounding_boxes = self._parse_omniparser_response(response_data, frame.size)
+            
+            # Map back to screen coordinates if the SUT sent a downscaled frame
+            bounding_boxes = frame.map_boxes_to_screen(bounding_boxes)
             
             # STREAMLINED ANNOTATION HANDLING - Single source of truth
             if "som_image_base64" in response_data:
                 if annotation_path:
                     # Save server annotation to the specified path (NEW STREAMLINED APPROACH)
                     try:
-                        os.makedirs(os.path.dirname(annotation_path), exist_ok=True)
                         img_data = base64.b64decode(response_data["som_image_base64"])
-                        with open(annotation_path, "wb") as f:
-                            f.write(img_data)
-                        logger.info(f"Saved Omniparser server annotation to {annotation_path}")
+                        self.archive_writer.write_bytes(annotation_path, img_data)
+                        logger.info(f"Queued Omniparser server annotation for {annotation_path}")
                     except Exception as e:
                         logger.warning(f"Failed to save server annotation: {str(e)}")
-                else:
+                elif frame.path:
                     # Backward compatibility: save with old naming convention for non-SimpleAutomation usage
                     try:
-                        annotated_dir = os.path.dirname(image_path)
-                        fallback_path = os.path.join(annotated_dir, f"omniparser_{os.path.basename(image_path)}")
+                        annotated_dir = os.path.dirname(frame.path)
+                        fallback_path = os.path.join(annotated_dir, f"omniparser_{os.path.basename(frame.path)}")
                         img_data = base64.b64decode(response_data["som_image_base64"])
-                        with open(fallback_path, "wb") as f:
-                            f.write(img_data)
-                        logger.info(f"Saved Omniparser annotation to {fallback_path} (fallback mode)")
+                        self.archive_writer.write_bytes(fallback_path, img_data)
+                        logger.info(f"Queued Omniparser annotation for {fallback_path} (fallback mode)")
                     except Exception as e:
                         logger.warning(f"Failed to save fallback annotation: {str(e)}")
             
             # Save clean JSON response (without base64 data for debugging)
-            self._save_clean_json_response(response_data, image_path)
+            if frame.path:
+                self._save_clean_json_response(response_data, frame.path)
             
             # Log detected elements in compact format
             logger.info(f"Detected {len(bounding_boxes)} UI elements from Omniparser server")
@@ -301,9 +309,8 @@ class OmniparserClient:
             clean_response["som_image_base64_present"] = True
         
         json_path = os.path.splitext(image_path)[0] + ".json"
-        with open(json_path, "w", encoding="utf-8") as json_file:
-            json.dump(clean_response, json_file, indent=2)
-        logger.debug(f"Saved clean JSON response to {json_path}")
+        self.archive_writer.write_json(json_path, clean_response)
+        logger.debug(f"Queued clean JSON response for {json_path}")
     
     def _log_detected_elements(self, bounding_boxes: List[BoundingBox]):
         """Log detected elements in a compact format."""
@@ -318,5 +325,7 @@ class OmniparserClient:
     
     def close(self):
         """Close the session."""
+        self.pool.log_stats()
+        self.pool.close()
         self.session.close()
         logger.info("Omniparser client session closed")
\ No newline at end of file
@@ -0,0 +1,432 @@
+"""
+Common base for the LLM vision clients served through an OpenAI-compatible API.
+Handles upload preprocessing, streamed and non-streamed detection, targeted
+locate, prompt caching, warm-up and the endpoint pool; subclasses only supply
+their prompts and model id.
+"""
+
+import io
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import requests
+from PIL import Image
+
+from modules.frame import Frame
+from modules.box_set import BoundingBox, BoxSet
+from modules.vision_client import VisionClient
+from modules.element_matcher import targets_satisfied
+from modules.json_stream import element_to_box, extract_elements, read_streamed_boxes
+from modules.image_preprocessor import ImagePreprocessor
+from modules.endpoint_pool import EndpointPool
+from modules.locate import (LOCATE_MAX_TOKENS, LOCATE_RESPONSE_FORMAT, LOCATE_SYSTEM_PROMPT,
+                            build_locate_prompt, parse_locate_response)
+
+logger = logging.getLogger(__name__)
+
+class OpenAIVisionClient(VisionClient):
+    """Base class for vision-language models behind /v1/chat/completions (LM Studio, llama.cpp)."""
+
+    # Lets the runners pass the elements they are looking for, so streaming can stop early
+    accepts_targets = True
+    # Lets an ensemble stop a streamed generation whose result it no longer needs
+    accepts_cancel = True
+
+    # Set by each backend
+    backend = ""                # ImagePreprocessor preset
+    display_name = "LLM"        # Name used in log messages
+    model_id = ""               # Model requested from the server
+    system_prompt = ""
+    detection_prompt = "Analyze this game screenshot and identify all UI elements."
+    detection_max_tokens = 800
+
+    def __init__(self, api_url: str = "http://127.0.0.1:1234", stream: bool = True,
+                 preprocessor: Optional[ImagePreprocessor] = None, cache_prompt: bool = True,
+                 slot_id: Optional[int] = None):
+        """
+        Initialize the client and test the connection.
+
+        Args:
+            api_url: URL of the LM Studio API (default: http://127.0.0.1:1234); several
+                     comma-separated URLs are load-balanced as an EndpointPool
+            stream: Stream the response and parse elements as they arrive
+            preprocessor: Resizes/re-encodes frames before upload (default: the backend's preset)
+            cache_prompt: Ask the server to keep the shared prompt prefix cached (llama.cpp cache_prompt)
+            slot_id: Server slot to pin requests to, so the cached prefix is reused (llama.cpp id_slot)
+        """
+        self.api_url = api_url
+        self.stream = stream
+        self.locate_schema = True  # Cleared if the server rejects structured output
+        self.preprocessor = preprocessor or ImagePreprocessor.for_backend(self.backend)
+        self.cache_prompt = cache_prompt  # Cleared if the server rejects the cache options
+        self.slot_id = slot_id
+        self.ttfts: List[float] = []  # Time to first token per request
+        self.session = requests.Session()
+        self.pool = EndpointPool(api_url, probe_path="/v1/models", session=self.session)
+
+        logger.info(f"{type(self).__name__} initialized with API URL: {api_url}")
+
+        # Test connection to the API
+        try:
+            self._test_connection()
+            logger.info(f"Successfully connected to LM Studio API for {self.display_name}")
+        except Exception as e:
+            logger.error(f"Failed to connect to LM Studio API: {str(e)}")
+            logger.error(f"Please ensure LM Studio is running at {api_url}")
+
+    def _test_connection(self) -> Dict[str, Any]:
+        """Test connection to the API and return the served models."""
+        self.pool.probe_all()
+        response = self.pool.request("get", "/v1/models", timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def _format_bounding_boxes(self, bboxes: List[BoundingBox]) -> str:
+        """
+        Format bounding boxes into a readable string for logging.
+
+        Args:
+            bboxes: List of BoundingBox objects
+
+        Returns:
+            Formatted string representation
+        """
+        if not bboxes:
+            return "No UI elements detected"
+
+        formatted = []
+        for i, bbox in enumerate(bboxes):
+            element_text = bbox.element_text if bbox.element_text else "N/A"
+            # Truncate long text
+            if element_text and len(element_text) > 30:
+                element_text = element_text[:27] + "..."
+
+            formatted.append(
+                f"[{i+1}] {bbox.element_type} (conf: {bbox.confidence:.2f}) at ({bbox.x},{bbox.y},{bbox.width}x{bbox.height}): '{element_text}'"
+            )
+
+        return "\n".join(formatted)
+
+    def _log_boxes(self, frame: Frame, bounding_boxes: List[BoundingBox], suffix: str = ""):
+        """Log detected elements in a human-readable format."""
+        logger.info(f"Detected {len(bounding_boxes)} UI elements in {frame.name}{suffix}:")
+        for line in self._format_bounding_boxes(bounding_boxes).split('\n'):
+            logger.info(f"  {line}")
+
+    def _encode_image(self, image: Union[Frame, str]) -> str:
+        """
+        Encode an image to base64.
+
+        Args:
+            image: Frame or path to the image file
+
+        Returns:
+            Base64-encoded image string
+        """
+        return Frame.coerce(image).base64
+
+    def _extract_json_from_text(self, text: str) -> Dict:
+        """
+        Extract the detected elements from text that might contain additional content or be truncated.
+
+        Args:
+            text: Text that may contain JSON
+
+        Returns:
+            Dictionary with the recovered "elements" list
+        """
+        elements = extract_elements(text)
+        if not elements:
+            logger.warning(f"No UI elements recovered from response: {text[:200]}...")
+        return {"elements": elements}
+
+    def detect_ui_elements(self, image: Union[Frame, str], targets: List[Dict[str, Any]] = None,
+                           accept: Callable[[List[BoundingBox]], bool] = None,
+                           cancel: Optional[threading.Event] = None) -> List[BoundingBox]:
+        """
+        Send an image to the model and get UI element detections.
+
+        Args:
+            image: Frame or path of the screenshot image
+            targets: Element definitions the caller is looking for; when streaming,
+                     generation is cancelled as soon as all of them have been emitted
+            accept: Custom predicate over the elements so far, instead of targets
+            cancel: Once set, the result is no longer wanted; a streamed response is
+                    closed (stopping generation) and the elements so far are returned
+
+        Returns:
+            List of detected UI elements with bounding boxes
+
+        Raises:
+            RequestException: If the API request fails
+            ValueError: If the response cannot be parsed
+        """
+        if cancel is not None and cancel.is_set():
+            logger.info(f"{self.display_name} detection cancelled before it was sent")
+            return BoxSet()
+        try:
+            # Use the in-memory frame (raises FileNotFoundError for a missing path), sized for upload
+            frame = self.preprocessor.prepare(Frame.coerce(image))
+            payload = self._detection_payload(frame)
+
+            if self.stream:
+                if accept is None and targets:
+                    accept = lambda boxes: targets_satisfied(targets, boxes)
+                return self._detect_streaming(frame, payload, accept, cancel)
+
+            logger.info(f"Sending request to /v1/chat/completions at {self.pool}")
+            response = self._post_completion(payload)
+            response.raise_for_status()
+
+            response_data = response.json()
+            if not response_data.get("choices"):
+                logger.error("No choices in response")
+                return []
+            content = response_data["choices"][0]["message"]["content"]
+            logger.debug(f"Received response: {content[:200]}...")
+
+            # Log upload size, token usage and the server's prompt time
+            self._log_upload(frame, response_data.get("usage"), self._server_ttft(response_data))
+
+            elements = self._extract_json_from_text(content).get("elements", [])
+            logger.info(f"Successfully parsed {len(elements)} UI elements from response")
+            bounding_boxes = [box for box in map(element_to_box, elements) if box is not None]
+
+            # Map back to screen coordinates if the SUT sent a downscaled frame
+            bounding_boxes = frame.map_boxes_to_screen(BoxSet.from_boxes(bounding_boxes))
+            self._log_boxes(frame, bounding_boxes)
+            return bounding_boxes
+
+        except requests.RequestException as e:
+            logger.error(f"LM Studio API request failed: {str(e)}")
+            raise
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.error(f"Failed to parse LM Studio API response: {str(e)}")
+            raise ValueError(f"Invalid response from LM Studio API: {str(e)}")
+
+    def _detection_payload(self, frame: Frame, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build the chat completion payload for a full detection.
+
+        The system prompt and instruction come first and never change, so the
+        server can reuse their processed prefix across requests.
+
+        Args:
+            frame: Frame to analyse (as uploaded)
+            max_tokens: Generation limit (default: the backend's detection_max_tokens)
+
+        Returns:
+            Payload for /v1/chat/completions
+        """
+        return self._chat_payload(self.system_prompt, self.detection_prompt, frame,
+                                  max_tokens or self.detection_max_tokens)
+
+    def _chat_payload(self, system_prompt: str, prompt: str, frame: Frame, max_tokens: int) -> Dict[str, Any]:
+        """Chat completion payload with one image (OpenAI-compatible format)."""
+        return {
+            "model": self.model_id,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url",
+                     "image_url": {"url": frame.data_url}}
+                ]}
+            ],
+            "temperature": 0.01,  # Very low temperature for consistent results
+            "max_tokens": max_tokens
+        }
+
+    def _post_completion(self, payload: Dict[str, Any], stream: bool = False, url: Optional[str] = None):
+        """
+        POST a chat completion, with prompt-cache hints if enabled.
+
+        A 400 is only blamed on the llama.cpp cache options if the error names
+        them or the request succeeds without them; then the options stay off.
+        Any other 400 (an unsupported response_format, an oversized image, a
+        context overflow) is returned to the caller with caching left on.
+
+        Args:
+            payload: Chat completion payload
+            stream: Stream the response body
+            url: Send to this endpoint of the pool instead of the least busy one
+
+        Returns:
+            requests.Response (check raise_for_status)
+        """
+        if not self.cache_prompt:
+            return self._send_completion(payload, stream, url, cache_options=False)
+        response = self._send_completion(payload, stream, url, cache_options=True)
+        if response.status_code != 400:
+            return response
+
+        error = response.text
+        response.close()
+        retry = self._send_completion(payload, stream, url, cache_options=False)
+        if "cache_prompt" in error or "id_slot" in error or retry.status_code != 400:
+            logger.warning("Server rejected the prompt cache options - sending requests without them")
+            self.cache_prompt = False
+        return retry
+
+    def _send_completion(self, payload: Dict[str, Any], stream: bool, url: Optional[str], cache_options: bool):
+        """POST one chat completion, adding the cache_prompt/id_slot hints if asked to."""
+        request = dict(payload)
+        if cache_options:
+            request["cache_prompt"] = True
+            if self.slot_id is not None:
+                request["id_slot"] = self.slot_id
+        return self.pool.request(
+            "post", "/v1/chat/completions",
+            url=url,
+            json=request,
+            headers={"Content-Type": "application/json"},
+            timeout=60,  # Longer timeout for vision models
+            stream=stream
+        )
+
+    def warm_up(self):
+        """
+        Load the model and cache the shared prompt prefix before the first real detection.
+
+        Sends the detection prompt with a tiny image and a one-token limit to
+        every endpoint of the pool; run it during the game's startup wait (see
+        VisionClient.warm_up_async).
+        """
+        blank = io.BytesIO()
+        Image.new("RGB", (64, 64)).save(blank, format="PNG")
+        payload = self._detection_payload(Frame(blank.getvalue()), max_tokens=1)
+        for url in self.pool.urls:
+            start_time = time.time()
+            try:
+                response = self._post_completion(payload, url=url)
+                response.raise_for_status()
+                logger.info(f"{self.display_name} warm-up of {url} finished in {time.time() - start_time:.2f}s")
+            except requests.RequestException as e:
+                logger.warning(f"{self.display_name} warm-up of {url} failed: {str(e)}")
+
+    def locate(self, image: Union[Frame, str], target: Dict[str, Any]) -> BoxSet:
+        """
+        Ask the model for the box of one element instead of listing every element.
+
+        The prompt describes only the selector and the answer follows a fixed
+        schema, so a call generates a few dozen tokens instead of hundreds.
+
+        Args:
+            image: Frame or path of the screenshot image
+            target: Element definition (see locate.can_locate for supported selectors)
+
+        Returns:
+            BoxSet with the located element in screen coordinates (empty if not found)
+
+        Raises:
+            RequestException: If the API request fails
+        """
+        frame = self.preprocessor.prepare(Frame.coerce(image))
+        payload = self._chat_payload(LOCATE_SYSTEM_PROMPT, build_locate_prompt(target), frame, LOCATE_MAX_TOKENS)
+        if self.locate_schema:
+            payload["response_format"] = LOCATE_RESPONSE_FORMAT
+
+        start_time = time.time()
+        response = self._post_completion(payload)
+        if response.status_code == 400 and self.locate_schema:
+            logger.warning("Server rejected the locate schema - retrying without structured output")
+            response.close()
+            self.locate_schema = False
+            del payload["response_format"]
+            response = self._post_completion(payload)
+        response.raise_for_status()
+
+        response_data = response.json()
+        choices = response_data.get("choices") or [{}]
+        content = (choices[0].get("message") or {}).get("content") or ""
+        bbox = parse_locate_response(content, target)
+        self._log_upload(frame, response_data.get("usage"), self._server_ttft(response_data))
+
+        located = frame.map_boxes_to_screen(BoxSet.from_boxes([bbox] if bbox else []))
+        if located:
+            logger.info(f"Located '{target.get('text')}' at ({located[0].x},{located[0].y},"
+                        f"{located[0].width}x{located[0].height}) in {time.time() - start_time:.2f}s")
+        else:
+            logger.info(f"'{target.get('text')}' not found by locate ({time.time() - start_time:.2f}s)")
+        return located
+
+    def _detect_streaming(self, frame: Frame, payload: Dict[str, Any],
+                          accept: Callable[[List[BoundingBox]], bool] = None,
+                          cancel: Optional[threading.Event] = None) -> List[BoundingBox]:
+        """
+        Stream the completion and parse elements as they are generated.
+
+        Closing the connection once accept passes makes LM Studio stop generating,
+        so the sought element costs only the tokens up to it.
+
+        Args:
+            frame: Frame being analysed
+            payload: Chat completion payload
+            accept: Predicate over the elements so far (None reads the whole response)
+            cancel: Event that stops reading (and generation) when set
+
+        Returns:
+            List of detected UI elements with bounding boxes
+        """
+        start_time = time.time()
+        logger.info(f"Streaming request to /v1/chat/completions at {self.pool}")
+        with self._post_completion(dict(payload, stream=True, stream_options={"include_usage": True}),
+                                   stream=True) as response:
+            response.raise_for_status()
+            usage, timing = {}, {}
+            bounding_boxes, content, stopped_early = read_streamed_boxes(
+                response, frame, accept, usage, timing, cancel)
+        elapsed = time.time() - start_time
+        self._log_upload(frame, usage, timing["first_token"] - start_time if "first_token" in timing else None)
+
+        if cancel is not None and cancel.is_set():
+            logger.info(f"{self.display_name} detection no longer needed after {len(bounding_boxes)} streamed "
+                        f"elements ({elapsed:.2f}s) - cancelled generation")
+            return bounding_boxes
+        if stopped_early:
+            logger.info(f"Found the requested elements after {len(bounding_boxes)} streamed elements "
+                        f"({elapsed:.2f}s) - cancelled generation")
+        elif not bounding_boxes:
+            logger.warning(f"No UI elements recovered from response: {content[:200]}...")
+
+        self._log_boxes(frame, bounding_boxes, f" ({elapsed:.2f}s)")
+        return bounding_boxes
+
+    @staticmethod
+    def _server_ttft(response_data: Dict[str, Any]) -> Optional[float]:
+        """Prompt processing time reported by llama.cpp-based servers, in seconds (None if absent)."""
+        prompt_ms = (response_data.get("timings") or {}).get("prompt_ms")
+        return prompt_ms / 1000.0 if prompt_ms is not None else None
+
+    def _log_upload(self, frame: Frame, usage: Optional[Dict[str, Any]], ttft: Optional[float] = None):
+        """
+        Log what a request cost, for tuning the upload preprocessing and prompt caching.
+
+        Args:
+            frame: Frame as uploaded
+            usage: Token usage reported by the server (None or empty if unavailable)
+            ttft: Seconds until the first token, if known
+        """
+        usage = usage or {}
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if ttft is not None:
+            self.ttfts.append(ttft)
+        logger.info(f"Upload: {frame.width}x{frame.height} {frame.mime_type}, {len(frame.data) / 1024:.0f} KB, "
+                    f"prompt tokens {usage.get('prompt_tokens', 'n/a')}"
+                    f"{f' ({cached_tokens} cached)' if cached_tokens is not None else ''}, "
+                    f"completion tokens {usage.get('completion_tokens', 'n/a')}, "
+                    f"TTFT {f'{ttft:.2f}s' if ttft is not None else 'n/a'}")
+
+    def close(self):
+        """Close the session."""
+        self.preprocessor.log_stats()
+        if self.ttfts:
+            logger.info(f"Time to first token: {self.ttfts[0]:.2f}s on the first request, "
+                        f"{sum(self.ttfts) / len(self.ttfts):.2f}s average over {len(self.ttfts)} requests")
+        self.pool.log_stats()
+        self.pool.close()
+        self.session.close()
+        logger.info(f"{self.display_name} client session closed")
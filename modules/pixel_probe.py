@@ -0,0 +1,217 @@
+"""
+Pixel-probe state predicates.
+Evaluates pixel_checks (color or luma at points, or the mean of small regions)
+from a handful of sampled values, so loading and running phases can be
+recognised at 10+ Hz without capturing a full frame or calling a vision model.
+"""
+
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import ImageStat
+
+from modules.frame import Frame, parse_point, parse_region, union_regions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIXEL_TOLERANCE = 16
+
+# Sampled colors keyed by probe: ("point", x, y) or ("region", x, y, width, height)
+PixelSamples = Dict[Tuple, Tuple[float, float, float]]
+
+def luma(color: Sequence[float]) -> float:
+    """Perceived brightness (ITU-R BT.601) of an RGB color."""
+    return 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
+
+@dataclass
+class PixelCheck:
+    """One compiled pixel_checks entry."""
+    probe: Tuple
+    color: Optional[Tuple[float, float, float]] = None
+    luma: Optional[float] = None
+    luma_min: Optional[float] = None
+    luma_max: Optional[float] = None
+    tolerance: float = DEFAULT_PIXEL_TOLERANCE
+    negate: bool = False
+
+    def accepts(self, color: Sequence[float]) -> bool:
+        """Check a sampled RGB color against this check."""
+        passed = True
+        if self.color is not None:
+            passed = all(abs(sampled - expected) <= self.tolerance
+                         for sampled, expected in zip(color, self.color))
+        brightness = luma(color)
+        if passed and self.luma is not None:
+            passed = abs(brightness - self.luma) <= self.tolerance
+        if passed and self.luma_min is not None:
+            passed = brightness >= self.luma_min
+        if passed and self.luma_max is not None:
+            passed = brightness <= self.luma_max
+        return passed != self.negate
+
+def parse_pixel_check(check_def: Dict[str, Any]) -> PixelCheck:
+    """
+    Compile a pixel_checks entry from config.
+
+    Accepts a point or region, plus color: [r, g, b] and/or luma (a value, or
+    {min: .., max: ..}), with an optional tolerance and negate flag.
+
+    Args:
+        check_def: Check as written in YAML
+
+    Returns:
+        PixelCheck
+
+    Raises:
+        ValueError: If the check is malformed
+    """
+    if "region" in check_def:
+        probe = ("region",) + parse_region(check_def["region"])
+    elif "point" in check_def:
+        x, y = parse_point(check_def["point"])
+        probe = ("point", int(x), int(y))
+    else:
+        raise ValueError(f"Pixel check needs a point or region: {check_def}")
+
+    check = PixelCheck(probe=probe, tolerance=float(check_def.get("tolerance", DEFAULT_PIXEL_TOLERANCE)),
+                       negate=bool(check_def.get("negate", False)))
+    if "color" in check_def:
+        try:
+            check.color = tuple(float(v) for v in check_def["color"])[:3]
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid pixel check color: {check_def['color']}")
+        if len(check.color) != 3:
+            raise ValueError(f"Pixel check color needs r, g, b: {check_def['color']}")
+    luma_def = check_def.get("luma")
+    if isinstance(luma_def, dict):
+        check.luma_min = luma_def.get("min")
+        check.luma_max = luma_def.get("max")
+    elif luma_def is not None:
+        check.luma = float(luma_def)
+    if check.color is None and check.luma is None and check.luma_min is None and check.luma_max is None:
+        raise ValueError(f"Pixel check needs a color or luma condition: {check_def}")
+    return check
+
+def parse_pixel_checks(check_defs: List[Dict[str, Any]]) -> List[PixelCheck]:
+    """Compile a state's pixel_checks list."""
+    return [parse_pixel_check(check_def) for check_def in check_defs or []]
+
+def checks_pass(checks: List[PixelCheck], samples: Optional[PixelSamples]) -> bool:
+    """
+    Evaluate pixel checks against sampled colors.
+
+    Args:
+        checks: Compiled checks (all must pass)
+        samples: Sampled colors (None when sampling failed)
+
+    Returns:
+        True if every check passes; False if any fails or was not sampled
+    """
+    if not checks:
+        return True
+    if samples is None:
+        return False
+    for check in checks:
+        color = samples.get(check.probe)
+        if color is None or not check.accepts(color):
+            return False
+    return True
+
+def sample_frame(frame: Frame, probes: Sequence[Tuple]) -> PixelSamples:
+    """
+    Sample probes from a captured frame (screen coordinates are mapped to the image).
+
+    Args:
+        frame: Frame covering the probes
+        probes: Probe keys from PixelCheck.probe
+
+    Returns:
+        Sampled colors for the probes inside the frame
+    """
+    image = frame.image
+    samples = {}
+    for probe in probes:
+        x, y = probe[1], probe[2]
+        width, height = (probe[3], probe[4]) if probe[0] == "region" else (1, 1)
+        left = int((x - frame.offset_x) * frame.scale)
+        top = int((y - frame.offset_y) * frame.scale)
+        right = max(left + 1, int((x + width - frame.offset_x) * frame.scale))
+        bottom = max(top + 1, int((y + height - frame.offset_y) * frame.scale))
+        if left < 0 or top < 0 or right > frame.width or bottom > frame.height:
+            continue
+        mean = ImageStat.Stat(image.crop((left, top, right, bottom)).convert("RGB")).mean
+        samples[probe] = tuple(mean[:3])
+    return samples
+
+class PixelProbe:
+    """Samples pixel probes from the SUT."""
+
+    def __init__(self, network_manager, screenshot_mgr=None):
+        """
+        Initialize the probe.
+
+        Args:
+            network_manager: NetworkManager for the SUT's /pixels endpoint
+            screenshot_mgr: ScreenshotManager used for a small region capture when
+                            the SUT has no pixel endpoint
+        """
+        self.network = network_manager
+        self.screenshot_mgr = screenshot_mgr
+
+    def sample(self, checks: List[PixelCheck]) -> Optional[PixelSamples]:
+        """
+        Sample every probe the checks need in one request.
+
+        Args:
+            checks: Compiled checks
+
+        Returns:
+            Sampled colors, or None if they could not be fetched
+        """
+        probes = list(dict.fromkeys(check.probe for check in checks))
+        if not probes:
+            return {}
+        points = [probe[1:] for probe in probes if probe[0] == "point"]
+        regions = [probe[1:] for probe in probes if probe[0] == "region"]
+
+        result = self.network.get_pixels(points, regions)
+        if result is not None and result.get("status") == "success":
+            samples = {}
+            for point, color in zip(points, result.get("points", [])):
+                samples[("point",) + tuple(point)] = tuple(color)
+            for region, color in zip(regions, result.get("regions", [])):
+                samples[("region",) + tuple(region)] = tuple(color)
+            return samples
+
+        if self.screenshot_mgr is None:
+            return None
+        # Older SUT: capture just the area around the probes and sample it here
+        area = union_regions((probe[1], probe[2], 1, 1) if probe[0] == "point" else probe[1:] for probe in probes)
+        try:
+            frame = self.screenshot_mgr.capture_region(None, *area)
+        except Exception as e:
+            logger.warning(f"Pixel probe capture failed: {str(e)}")
+            return None
+        return sample_frame(frame, probes)
+
+    def wait_for(self, checks: List[PixelCheck], timeout: float, interval: float = 0.1) -> bool:
+        """
+        Poll until the checks pass.
+
+        Args:
+            checks: Compiled checks
+            timeout: Maximum seconds to wait
+            interval: Seconds between samples
+
+        Returns:
+            True if the checks passed before the timeout
+        """
+        deadline = time.time() + timeout
+        while True:
+            if checks_pass(checks, self.sample(checks)):
+                return True
+            if time.time() + interval > deadline:
+                return False
+            time.sleep(interval)
@@ -0,0 +1,283 @@
+"""
+Persistent screen-fingerprint index for zero-inference state recognition.
+Benchmark runs walk the same menus every time, so screens confirmed in earlier
+runs (FSM state matches, successful steps) are stored per game with their
+detections; a new frame close enough to a confirmed screen reuses them
+without calling the vision model.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from modules.box_set import BoundingBox, BoxSet
+from modules.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Set bits per byte value, for vectorized Hamming distances
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+def compute_fingerprint(image: Image.Image, hash_size: int = 16) -> np.ndarray:
+    """
+    Compute a gradient fingerprint of an image.
+
+    Horizontal and vertical difference hashes of a small grayscale thumbnail:
+    each bit records whether a pixel is brighter than its right (or lower)
+    neighbour, which survives compression, scaling and small brightness shifts.
+
+    Args:
+        image: PIL image
+        hash_size: Bits per row/column of each hash
+
+    Returns:
+        Packed bits (2 * hash_size^2 bits) as a uint8 array
+    """
+    gray = image.convert("L")
+    horizontal = np.asarray(gray.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    vertical = np.asarray(gray.resize((hash_size, hash_size + 1), Image.BILINEAR), dtype=np.int16)
+    bits = np.concatenate([(horizontal[:, :-1] > horizontal[:, 1:]).ravel(),
+                           (vertical[:-1, :] > vertical[1:, :]).ravel()])
+    return np.packbits(bits)
+
+@dataclass
+class IndexMatch:
+    """A confident match against a confirmed screen."""
+    label: str
+    bounding_boxes: BoxSet
+    distance: int
+    confirmations: int
+
+class ScreenIndex:
+    """Per-game nearest-neighbour index of confirmed screens."""
+
+    def __init__(self, path: str, max_distance: int = 24, margin: int = 8, min_confirmations: int = 2,
+                 max_entries: int = 2000, hash_size: int = 16):
+        """
+        Initialize the index, loading it from disk if it exists.
+
+        Args:
+            path: JSON file the index is persisted to
+            max_distance: Maximum Hamming distance (of 2 * hash_size^2 bits) for a match
+            margin: A screen labelled differently must be at least this much farther away
+            min_confirmations: Times a screen must have been confirmed before it is trusted
+            max_entries: Least recently seen entries are dropped beyond this
+            hash_size: Fingerprint hash size
+        """
+        self.path = path
+        self.max_distance = max_distance
+        self.margin = margin
+        self.min_confirmations = min_confirmations
+        self.max_entries = max_entries
+        self.hash_size = hash_size
+        self._lock = threading.Lock()
+
+        self._fingerprints = np.zeros((0, hash_size * hash_size // 4), dtype=np.uint8)
+        self._entries: List[Dict[str, Any]] = []  # label, context, boxes, confirmations, last_seen
+        self._dirty = False
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+
+        self.load()
+
+    @classmethod
+    def for_game(cls, game_name: str, index_dir: str = "screen_index", **kwargs) -> 'ScreenIndex':
+        """
+        Open the index of a game.
+
+        Args:
+            game_name: Game name from the config metadata
+            index_dir: Directory holding one index file per game
+            **kwargs: Passed to ScreenIndex
+
+        Returns:
+            ScreenIndex for the game
+        """
+        slug = re.sub(r"[^a-z0-9]+", "_", game_name.lower()).strip("_") or "game"
+        return cls(os.path.join(index_dir, f"{slug}.json"), **kwargs)
+
+    @staticmethod
+    def frame_context(frame: Frame) -> Tuple:
+        """Capture geometry a stored detection is valid for (boxes are in screen coordinates)."""
+        return (frame.offset_x, frame.offset_y, round(frame.scale, 4), tuple(frame.size))
+
+    def lookup(self, frame: Frame) -> Optional[IndexMatch]:
+        """
+        Find a confidently matching confirmed screen.
+
+        Args:
+            frame: Newly captured frame
+
+        Returns:
+            IndexMatch, or None if the screen is novel or ambiguous
+        """
+        try:
+            fingerprint = compute_fingerprint(frame.image, self.hash_size)
+        except Exception as e:
+            logger.warning(f"Could not fingerprint {frame.name}: {str(e)}")
+            return None
+        context = self.frame_context(frame)
+
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            distances = _POPCOUNT[np.bitwise_xor(self._fingerprints, fingerprint)].sum(axis=1)
+            usable = np.array([entry["context"] == context for entry in self._entries])
+            if not usable.any():
+                self.misses += 1
+                return None
+            distances = np.where(usable, distances, np.iinfo(np.int32).max)
+            best = int(np.argmin(distances))
+            best_distance = int(distances[best])
+            entry = self._entries[best]
+
+            if best_distance > self.max_distance or entry["confirmations"] < self.min_confirmations:
+                self.misses += 1
+                return None
+
+            # A nearby screen with a different label means the fingerprint can't tell them apart
+            for index in np.flatnonzero(distances <= best_distance + self.margin):
+                if self._entries[index]["label"] != entry["label"]:
+                    logger.debug(f"Screen index match for '{entry['label']}' is ambiguous with "
+                                 f"'{self._entries[index]['label']}'")
+                    self.misses += 1
+                    return None
+
+            entry["last_seen"] = time.time()
+            self.hits += 1
+            return IndexMatch(entry["label"], entry["boxes"], best_distance, entry["confirmations"])
+
+    def add(self, frame: Frame, label: str, bounding_boxes: List[BoundingBox]):
+        """
+        Record a confirmed screen (or confirm a known one again).
+
+        Args:
+            frame: Frame the confirmation was made on
+            label: FSM state or step it was confirmed as
+            bounding_boxes: Detections from the vision model for the frame
+        """
+        try:
+            fingerprint = compute_fingerprint(frame.image, self.hash_size)
+        except Exception as e:
+            logger.warning(f"Could not fingerprint {frame.name}: {str(e)}")
+            return
+        context = self.frame_context(frame)
+        boxes = BoxSet.from_boxes(bounding_boxes)
+
+        with self._lock:
+            if any(entry["boxes"] is boxes for entry in self._entries):
+                # Detections replayed from the index confirm nothing new
+                return
+            if self._entries:
+                distances = _POPCOUNT[np.bitwise_xor(self._fingerprints, fingerprint)].sum(axis=1)
+                for index in np.argsort(distances, kind="stable"):
+                    if distances[index] > self.max_distance // 2:
+                        break
+                    entry = self._entries[index]
+                    if entry["label"] == label and entry["context"] == context:
+                        # Same screen again: count the confirmation and keep the latest detections
+                        entry["confirmations"] += 1
+                        entry["boxes"] = boxes
+                        entry["last_seen"] = time.time()
+                        self._dirty = True
+                        return
+
+            self._entries.append({"label": label, "context": context, "boxes": boxes,
+                                  "confirmations": 1, "last_seen": time.time()})
+            self._fingerprints = np.vstack([self._fingerprints, fingerprint[None, :]])
+            self.added += 1
+            self._dirty = True
+
+            if len(self._entries) > self.max_entries:
+                keep = np.argsort([-entry["last_seen"] for entry in self._entries], kind="stable")[:self.max_entries]
+                keep.sort()
+                self._entries = [self._entries[index] for index in keep]
+                self._fingerprints = self._fingerprints[keep]
+
+    def load(self):
+        """Load the index from disk (a missing or unreadable file starts an empty index)."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION or data.get("hash_size") != self.hash_size:
+                logger.warning(f"Ignoring screen index {self.path} written with different settings")
+                return
+            fingerprints = []
+            entries = []
+            for item in data.get("entries", []):
+                fingerprints.append(np.frombuffer(bytes.fromhex(item["fingerprint"]), dtype=np.uint8))
+                columns = list(zip(*item["boxes"])) if item["boxes"] else [()] * 7
+                entries.append({
+                    "label": item["label"],
+                    "context": (item["context"][0], item["context"][1], item["context"][2],
+                                tuple(item["context"][3])),
+                    "boxes": BoxSet(*columns),
+                    "confirmations": item["confirmations"],
+                    "last_seen": item["last_seen"]
+                })
+            with self._lock:
+                self._entries = entries
+                if fingerprints:
+                    self._fingerprints = np.vstack(fingerprints)
+            logger.info(f"Loaded screen index {self.path} ({len(entries)} screens)")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not load screen index {self.path}: {str(e)}")
+
+    def save(self):
+        """Write the index to disk if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = []
+            for fingerprint, entry in zip(self._fingerprints, self._entries):
+                boxes = entry["boxes"]
+                entries.append({
+                    "fingerprint": fingerprint.tobytes().hex(),
+                    "label": entry["label"],
+                    "context": list(entry["context"]),
+                    "boxes": [[box.x, box.y, box.width, box.height, box.confidence, box.element_type,
+                               box.element_text] for box in boxes],
+                    "confirmations": entry["confirmations"],
+                    "last_seen": entry["last_seen"]
+                })
+            data = {"version": INDEX_VERSION, "hash_size": self.hash_size, "entries": entries}
+            self._dirty = False
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+            logger.info(f"Saved screen index {self.path} ({len(entries)} screens)")
+        except OSError as e:
+            logger.error(f"Failed to save screen index {self.path}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, int]:
+        """Lookup hits/misses, screens added and index size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "added": self.added, "entries": len(self._entries)}
+
+    def log_stats(self):
+        """Log index counters in a readable format."""
+        stats = self.get_stats()
+        logger.info(f"Screen index: {stats['hits']} hits / {stats['misses']} misses, "
+                    f"{stats['added']} new screens ({stats['entries']} total)")
@@ -3,73 +3,174 @@ Screenshot management module for capturing and saving screenshots from the SUT.
 """
 
 import os
+import time
 import logging
-from typing import Optional
+from typing import Optional, Tuple
 from pathlib import Path
 
 from modules.network import NetworkManager
+from modules.frame import Frame
+from modules.archive_writer import ArchiveWriter, get_archive_writer
 
 logger = logging.getLogger(__name__)
 
 class ScreenshotManager:
     """Manages screenshot operations."""
     
-    def __init__(self, network_manager: NetworkManager):
+    def __init__(self, network_manager: NetworkManager, save_to_disk: bool = True,
+                 archive_writer: ArchiveWriter = None):
         """
         Initialize the screenshot manager.
         
         Args:
             network_manager: NetworkManager instance for communication with SUT
+            save_to_disk: Archive captured frames to disk in the background
+            archive_writer: Background writer to use (defaults to the shared one)
         """
         self.network_manager = network_manager
-        logger.info("ScreenshotManager initialized")
+        self.save_to_disk = save_to_disk
+        
+        # Frames are written by a background thread so the automation loop never waits on disk
+        self.archive_writer = archive_writer or get_archive_writer()
+        
+        logger.info(f"ScreenshotManager initialized (save_to_disk: {save_to_disk})")
     
-    def capture(self, output_path: str) -> bool:
+    def capture(self, output_path: str = None) -> Frame:
         """
-        Capture a screenshot from the SUT and save it to the specified path.
+        Capture a screenshot from the SUT into memory.
         
         Args:
-            output_path: Path where the screenshot should be saved
+            output_path: Path where the screenshot should be archived (optional).
+                         The file is written asynchronously; use the returned Frame
+                         rather than reading the file back.
         
         Returns:
-            True if the screenshot was successfully captured and saved
+            Frame holding the screenshot
         
         Raises:
-            IOError: If there's an error saving the screenshot
+            IOError: If there's an error capturing the screenshot
         """
         try:
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            # Get screenshot from the SUT (possibly compressed/downscaled, see NetworkManager)
+            screenshot_data, metadata = self.network_manager.get_screenshot_with_metadata()
+            if output_path:
+                output_path = self._archive_path(output_path, metadata["mime_type"])
+            frame = Frame(screenshot_data, path=output_path, mime_type=metadata["mime_type"],
+                          scale=metadata["scale"], native_size=metadata["native_size"])
             
-            # Get screenshot from the SUT
-            screenshot_data = self.network_manager.get_screenshot()
+            if output_path and self.save_to_disk:
+                self.archive_writer.write_bytes(output_path, screenshot_data)
             
-            # Save the screenshot
-            with open(output_path, 'wb') as f:
-                f.write(screenshot_data)
-            
-            logger.info(f"Screenshot saved to {output_path}")
-            return True
+            logger.info(f"Screenshot captured ({len(screenshot_data)} bytes)")
+            return frame
             
         except Exception as e:
-            logger.error(f"Failed to capture or save screenshot: {str(e)}")
+            logger.error(f"Failed to capture screenshot: {str(e)}")
             raise IOError(f"Screenshot capture failed: {str(e)}")
     
-    def capture_region(self, output_path: str, x: int, y: int, width: int, height: int) -> bool:
+    def get_screen_hash(self) -> Optional[str]:
+        """
+        Get a reference hash of the current screen for wait_for_settle.
+        
+        Returns:
+            Hex hash string, or None if the SUT does not support change detection
+        """
+        return self.network_manager.get_screen_hash()
+    
+    def wait_for_settle(self, max_wait: float, reference_hash: Optional[str] = None,
+                        threshold: int = 4, settle_time: float = 0.5) -> bool:
+        """
+        Wait until the screen has changed from the reference and stopped changing,
+        or at most max_wait seconds. Falls back to a plain sleep if the SUT
+        does not support change detection.
+        
+        Args:
+            max_wait: Upper bound in seconds (typically the configured expected_delay)
+            reference_hash: Screen hash taken before the action
+            threshold: Hash bits that may differ before the screen counts as changed
+            settle_time: Seconds the screen must stay unchanged
+        
+        Returns:
+            True if the screen settled before max_wait
+        """
+        if max_wait <= 0:
+            return True
+        
+        start_time = time.time()
+        result = self.network_manager.wait_for_screen_change(reference_hash, threshold, max_wait, settle_time)
+        if result is None:
+            remaining = max_wait - (time.time() - start_time)
+            if remaining > 0:
+                time.sleep(remaining)
+            return False
+        
+        if result.get("settled"):
+            logger.info(f"Screen settled after {result.get('elapsed', 0):.2f}s (limit {max_wait}s)")
+            return True
+        
+        logger.info(f"Screen did not settle within {max_wait}s (changed: {result.get('changed')})")
+        return False
+    
+    def _archive_path(self, output_path: str, mime_type: str) -> str:
+        """Give the archived file an extension that matches the transport format."""
+        extension = {"image/jpeg": ".jpg", "image/webp": ".webp"}.get(mime_type)
+        if extension:
+            return os.path.splitext(output_path)[0] + extension
+        return output_path
+    
+    def flush(self, timeout: float = None) -> bool:
+        """Block until all queued screenshots have been written."""
+        return self.archive_writer.flush(timeout)
+    
+    def close(self):
+        """Write any pending screenshots and log archive metrics."""
+        self.archive_writer.close()
+    
+    def capture_region(self, output_path: Optional[str], x: int, y: int, width: int, height: int) -> Frame:
         """
-        Capture a specific region of the screen from the SUT.
-        This is a placeholder for a potential future feature that would require SUT-side implementation.
+        Capture a specific region of the screen from the SUT into memory.
+        Boxes detected on the returned frame are mapped back to screen coordinates
+        by the vision clients using the frame's offset.
         
         Args:
-            output_path: Path where the screenshot should be saved
+            output_path: Path where the crop should be archived (optional)
             x, y: Top-left coordinates of the region
             width, height: Dimensions of the region
         
         Returns:
-            True if the region was successfully captured and saved
+            Frame holding the region
         
         Raises:
-            NotImplementedError: This feature is not yet implemented
+            IOError: If there's an error capturing the region
+        """
+        try:
+            screenshot_data, metadata = self.network_manager.get_screenshot_with_metadata(region=(x, y, width, height))
+            if output_path:
+                output_path = self._archive_path(output_path, metadata["mime_type"])
+            frame = Frame(screenshot_data, path=output_path, mime_type=metadata["mime_type"],
+                          scale=metadata["scale"], native_size=(width, height), offset=(x, y))
+            
+            if output_path and self.save_to_disk:
+                self.archive_writer.write_bytes(output_path, screenshot_data)
+            
+            logger.info(f"Region screenshot captured ({x},{y} {width}x{height}, {len(screenshot_data)} bytes)")
+            return frame
+            
+        except Exception as e:
+            logger.error(f"Failed to capture screen region: {str(e)}")
+            raise IOError(f"Region capture failed: {str(e)}")
+    
+    def capture_for(self, output_path: Optional[str], region: Optional[Tuple[int, int, int, int]] = None) -> Frame:
+        """
+        Capture a region if one is given, otherwise the full screen.
+        
+        Args:
+            output_path: Path where the screenshot should be archived (optional)
+            region: Optional (x, y, width, height) region
+        
+        Returns:
+            Frame holding the screenshot
         """
-        # This would require additional API support on the SUT side
-        raise NotImplementedError("Region capture is not yet implemented")
\ No newline at end of file
+        if region:
+            return self.capture_region(output_path, *region)
+        return self.capture(output_path)
@@ -7,9 +7,16 @@ import os
 import time
 import logging
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Union
 
 from modules.gemma_client import BoundingBox
+from modules.frame import parse_region, union_regions, region_contains
+from modules.element_matcher import find_matching_element, targets_satisfied
+from modules.detection_cache import hamming_distance
+from modules.template_matcher import TemplateMatcher
+from modules.screen_index import ScreenIndex
+from modules.locate import can_locate
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +52,37 @@ class SimpleAutomation:
         self.enhanced_features = self.config.get("enhanced_features", {})
         self.monitor_process = self.enhanced_features.get("monitor_process_cpu", False)
         
+        # Wait for the screen to settle (SUT-side change detection) instead of sleeping expected_delay
+        self.wait_for_settle = self.enhanced_features.get("wait_for_screen_settle", False)
+        self.settle_time = self.enhanced_features.get("screen_settle_time", 0.5)
+        self.settle_threshold = self.enhanced_features.get("screen_change_threshold", 4)
+        
+        # Reuse the verification detection as the next step's input instead of capturing the same screen again
+        self.reuse_verify_detection = self.enhanced_features.get("reuse_verify_detection", True)
+        self.verify_reuse_max_age = self.enhanced_features.get("verify_reuse_max_age", 3.0)
+        self._carryover = None  # (frame, bounding_boxes, capture region) from the last successful verification
+        
+        # Capture and detect the verify screen on a worker while expected_delay elapses
+        self.speculative_verify = self.enhanced_features.get("speculative_verify", False)
+        self.speculative_verify_at = self.enhanced_features.get("speculative_verify_at", 0.5)
+        self._speculation_executor = None
+        
+        # Match elements that declare a template: image locally before asking the vision model
+        self.use_templates = self.enhanced_features.get("template_matching", True)
+        template_dir = self.enhanced_features.get("template_dir", "templates")
+        if not os.path.isabs(template_dir):
+            template_dir = os.path.join(os.path.dirname(os.path.abspath(config_path)), template_dir)
+        self.template_matcher = TemplateMatcher(template_dir, self.enhanced_features.get("template_work_width", 640))
+        
+        # Recognise screens verified in earlier runs without calling the vision model
+        self.screen_index = None
+        if self.enhanced_features.get("screen_index", False):
+            self.screen_index = ScreenIndex.for_game(self.game_name,
+                                                     self.enhanced_features.get("screen_index_dir", "screen_index"))
+        
+        # Ask an LLM client for the one element a step needs instead of every element on screen
+        self.use_locate = self.enhanced_features.get("locate_mode", True)
+        
         # Optional step handlers
         self.optional_steps = self.config.get("optional_steps", {})
         
@@ -52,6 +90,29 @@ class SimpleAutomation:
         if self.process_id:
             logger.info(f"Process ID tracking enabled: {self.process_id}")
 
+    def _get_capture_region(self, element_defs: List[Dict[str, Any]]):
+        """
+        Get the screen region to capture for a set of element definitions.
+        
+        Returns the union of their search_region values, or None (full screen)
+        if any element has no region or a region is malformed.
+        """
+        if not element_defs:
+            return None
+        
+        regions = []
+        for element_def in element_defs:
+            try:
+                region = parse_region(element_def.get("search_region"))
+            except ValueError as e:
+                logger.warning(f"{str(e)} - capturing full screen")
+                return None
+            if region is None:
+                return None
+            regions.append(region)
+        
+        return union_regions(regions)
+
     def _execute_fallback(self):
         """Execute fallback action when step fails."""
         fallback = self.config.get("fallbacks", {}).get("general", {})
@@ -69,6 +130,19 @@ class SimpleAutomation:
             
     def run(self):
         """Run the enhanced step-by-step automation with optional step handling."""
+        try:
+            return self._run_steps()
+        finally:
+            if self._speculation_executor is not None:
+                # Drop a queued speculation and let a running one finish before the caller closes the network
+                self._speculation_executor.shutdown(wait=True, cancel_futures=True)
+                self._speculation_executor = None
+            if self.screen_index:
+                self.screen_index.save()
+                self.screen_index.log_stats()
+    
+    def _run_steps(self):
+        """Execute the configured steps in order."""
         # Get steps from configuration
         steps = self.config.get("steps", {})
         
@@ -103,37 +177,46 @@ class SimpleAutomation:
                 logger.info("Stop event detected, ending automation")
                 break
             
-            # Handle optional steps (popups, interruptions)
-            if self._handle_optional_steps():
-                logger.info("Optional step handled, continuing with current step")
-                continue
-            
-            # Capture screenshot
-            screenshot_path = f"{self.run_dir}/screenshots/screenshot_{current_step}.png"
-            try:
-                self.screenshot_mgr.capture(screenshot_path)
-            except Exception as e:
-                logger.error(f"Failed to capture screenshot: {str(e)}")
-                retries += 1
-                if retries >= max_retries:
-                    return False
-                continue
+            # The capture has to cover optional-step triggers too, since popups are checked on the same frame
+            capture_region = self._get_capture_region(([step["find"]] if "find" in step else []) +
+                                                      self._optional_triggers())
+            carried = self._take_carryover(step, capture_region)
+            if carried:
+                frame, bounding_boxes = carried
+            else:
+                # Capture screenshot (only the search region if the target declares one)
+                screenshot_path = f"{self.run_dir}/screenshots/screenshot_{current_step}.png"
+                try:
+                    frame = self.screenshot_mgr.capture_for(screenshot_path, capture_region)
+                except Exception as e:
+                    logger.error(f"Failed to capture screenshot: {str(e)}")
+                    retries += 1
+                    if retries >= max_retries:
+                        return False
+                    continue
+                
+                # Detect UI elements
+                try:
+                    bounding_boxes = self._detect(frame, [step["find"]] if "find" in step else [], step.get("vision_tiers"),
+                                                  full_detection=self._optional_steps_armed(current_step))
+                except Exception as e:
+                    logger.error(f"Failed to detect UI elements: {str(e)}")
+                    retries += 1
+                    if retries >= max_retries:
+                        return False
+                    continue
             
-            # Detect UI elements
-            try:
-                bounding_boxes = self.vision_model.detect_ui_elements(screenshot_path)
-            except Exception as e:
-                logger.error(f"Failed to detect UI elements: {str(e)}")
-                retries += 1
-                if retries >= max_retries:
-                    return False
+            # Handle optional steps (popups, interruptions) found in this detection
+            if self._handle_optional_steps(bounding_boxes):
+                logger.info("Optional step handled, continuing with current step")
+                self._carryover = None  # The screen changed
                 continue
             
             # Annotate screenshot if annotator available
             if self.annotator:
                 try:
                     annotated_path = f"{self.run_dir}/annotated/annotated_{current_step}.png"
-                    self.annotator.draw_bounding_boxes(screenshot_path, bounding_boxes, annotated_path)
+                    self.annotator.draw_bounding_boxes(frame, bounding_boxes, annotated_path)
                 except Exception as e:
                     logger.warning(f"Failed to create annotated screenshot: {str(e)}")
             
@@ -176,6 +259,10 @@ class SimpleAutomation:
                 logger.info("=========================================================")
 
         
+        # Remember the screen before acting so we can wait for it to change and settle
+        wait_for_settle = step.get("wait_for_settle", self.wait_for_settle)
+        reference_hash = self.screenshot_mgr.get_screen_hash() if wait_for_settle else None
+        
         # 2. EXECUTE ACTION
         if "action" in step:
             success = self._execute_modular_action(step["action"], target_element, step_num)
@@ -187,13 +274,21 @@ class SimpleAutomation:
         
         # Wait for expected delay
         expected_delay = step.get("expected_delay", 1)
+        speculation = None
         if expected_delay > 0:
-            logger.info(f"Waiting {expected_delay} seconds after action...")
-            time.sleep(expected_delay)
+            if wait_for_settle:
+                logger.info(f"Waiting up to {expected_delay} seconds for the screen to settle...")
+                self.screenshot_mgr.wait_for_settle(expected_delay, reference_hash,
+                                                    self.settle_threshold, self.settle_time)
+            else:
+                if self.speculative_verify and "verify_success" in step:
+                    speculation = self._start_speculative_verify(step, step_num, expected_delay * self.speculative_verify_at)
+                logger.info(f"Waiting {expected_delay} seconds after action...")
+                time.sleep(expected_delay)
         
         # 3. VERIFY SUCCESS (if specified)
         if "verify_success" in step:
-            return self._verify_step_success(step, step_num)
+            return self._verify_step_success(step, step_num, speculation)
         
         return True
     
@@ -205,7 +300,10 @@ class SimpleAutomation:
             if action_config == "wait":
                 duration = 10  # Default wait
                 logger.info(f"Waiting for {duration} seconds")
-                self._interruptible_wait(duration)
+                if self.network.in_batch:
+                    self.network.pause(duration)
+                else:
+                    self._interruptible_wait(duration)
                 return True
             else:
                 logger.error(f"Unknown simple action: {action_config}")
@@ -366,35 +464,25 @@ class SimpleAutomation:
             logger.error("No text specified for text input")
             return False
         
-        # Clear existing text if specified
         clear_first = action_config.get("clear_first", False)
-        if clear_first:
-            try:
-                # Ctrl+A to select all, then type
-                self.network.send_action({"type": "hotkey", "keys": ["ctrl", "a"]})
-                time.sleep(0.1)
-            except Exception as e:
-                logger.warning(f"Failed to clear existing text: {str(e)}")
-        
-        # Type character by character with optional delay
         char_delay = action_config.get("char_delay", 0.05)
+        special_keys = {' ': "space", '\n': "Return", '\t': "Tab"}
+        
+        if self.stop_event and self.stop_event.is_set():
+            return True
         
         try:
-            for char in text:
-                if self.stop_event and self.stop_event.is_set():
-                    break
-                    
-                if char == ' ':
-                    self.network.send_action({"type": "key", "key": "space"})
-                elif char == '\n':
-                    self.network.send_action({"type": "key", "key": "Return"})
-                elif char == '\t':
-                    self.network.send_action({"type": "key", "key": "Tab"})
-                else:
-                    self.network.send_action({"type": "key", "key": char})
+            # All keystrokes go to the SUT in one batch; delays are applied server-side
+            with self.network.batch():
+                # Clear existing text if specified (Ctrl+A to select all, then type)
+                if clear_first:
+                    self.network.send_action({"type": "hotkey", "keys": ["ctrl", "a"]})
+                    self.network.pause(0.1)
                 
-                if char_delay > 0:
-                    time.sleep(char_delay)
+                # Type character by character with optional delay
+                for char in text:
+                    self.network.send_action({"type": "key", "key": special_keys.get(char, char)})
+                    self.network.pause(char_delay)
             
             logger.info(f"Typed text: '{text[:50]}{'...' if len(text) > 50 else ''}'")
             return True
@@ -531,7 +619,14 @@ class SimpleAutomation:
         duration = action_config.get("duration", 1)
         condition = action_config.get("condition")
         
-        if condition:
+        if self.network.in_batch and not condition:
+            # Inside a batched sequence the wait has to happen on the SUT, in order
+            logger.info(f"Queueing wait of {duration} seconds")
+            self.network.pause(duration)
+        elif condition:
+            if self.network.in_batch:
+                # A conditional wait runs here, so send what the sequence queued before it first
+                self.network.flush()
             # Conditional wait (wait until condition is met)
             max_wait = action_config.get("max_wait", 30)
             check_interval = action_config.get("check_interval", 1)
@@ -569,33 +664,60 @@ class SimpleAutomation:
         actions = action_config.get("actions", [])
         delay_between = action_config.get("delay_between", 0.5)
         
-        for i, action in enumerate(actions):
-            logger.info(f"Executing sequence action {i+1}/{len(actions)}")
-            success = self._execute_modular_action(action, target_element, 0)
-            if not success:
-                logger.error(f"Sequence failed at action {i+1}")
-                return False
-            
-            if delay_between > 0 and i < len(actions) - 1:
-                time.sleep(delay_between)
+        try:
+            # Coalesce the whole sequence into one round-trip to the SUT
+            with self.network.batch():
+                for i, action in enumerate(actions):
+                    logger.info(f"Queueing sequence action {i+1}/{len(actions)}")
+                    success = self._execute_modular_action(action, target_element, 0)
+                    if not success:
+                        logger.error(f"Sequence failed at action {i+1}")
+                        raise RuntimeError(f"Sequence action {i+1} could not be queued")
+                    
+                    if i < len(actions) - 1:
+                        self.network.pause(delay_between)
+        except Exception as e:
+            logger.error(f"Sequence failed: {str(e)}")
+            return False
         
         logger.info(f"Completed sequence of {len(actions)} actions")
         return True
     
-    def _handle_optional_steps(self) -> bool:
-        """Handle optional steps (popups, interruptions)."""
+    def _optional_triggers(self) -> List[Dict[str, Any]]:
+        """Trigger definitions of all optional steps."""
+        return [step_config.get("trigger", {}) for step_config in self.optional_steps.values()]
+    
+    def _optional_steps_armed(self, step_num: int) -> bool:
+        """
+        Check whether an optional step expects its popup on this step.
+        
+        An optional step lists the step numbers it may interrupt under steps:.
+        Optional steps without steps: are only checked against whatever the
+        step's detection returned - if a popup hides the step's target, the
+        target is not found and that detection is complete anyway.
+        """
+        for step_config in self.optional_steps.values():
+            if str(step_num) in [str(step) for step in step_config.get("steps", [])]:
+                return True
+        return False
+    
+    def _handle_optional_steps(self, bounding_boxes: List[BoundingBox]) -> bool:
+        """
+        Handle optional steps (popups, interruptions) using the step's own detection.
+        
+        Args:
+            bounding_boxes: UI elements detected for the current step
+        
+        Returns:
+            True if an optional step ran and the current step should be re-entered
+        """
         if not self.optional_steps:
             return False
         
         try:
-            # Capture current screenshot for optional step checking
-            optional_screenshot = f"{self.run_dir}/screenshots/optional_check.png"
-            self.screenshot_mgr.capture(optional_screenshot)
-            optional_boxes = self.vision_model.detect_ui_elements(optional_screenshot)
-            
             # Check each optional step
             for step_name, step_config in self.optional_steps.items():
-                if self._check_optional_step_condition(step_config, optional_boxes):
+                if self._check_optional_step_condition(step_config, bounding_boxes):
                     logger.info(f"Optional step triggered: {step_name}")
                     success = self._execute_modular_action(step_config["action"], None, 0)
                     if success:
@@ -626,61 +748,142 @@ class SimpleAutomation:
     
     def _find_matching_element(self, target_def, bounding_boxes):
         """Find a UI element matching the target definition with enhanced logging."""
-        target_type = target_def.get("type", "any")
-        target_text = target_def.get("text", "")
-        match_type = target_def.get("text_match", "contains")
+        return find_matching_element(target_def, bounding_boxes)
+    
+    def _detect(self, frame, targets: List[Dict[str, Any]], tiers: Optional[List[str]] = None,
+                full_detection: bool = False) -> List[BoundingBox]:
+        """
+        Run detection, telling an ensemble or cascade model which elements the step needs
+        (and which cascade tiers the step allows, from its vision_tiers).
+        
+        When every target declares a template: image and all of them are found
+        locally (and there are no optional steps, which need the full element
+        list), or the screen matches one verified in an earlier run, the frame
+        is never sent to the vision model. A single text target (and no optional
+        step triggers to look for) is located directly by LLM clients that
+        support it, falling back to full detection if it is not found.
+        
+        With full_detection (an optional step expects a popup here), the screen
+        index is not used and the vision model lists every element instead of
+        stopping once the targets are found.
+        """
+        if (targets and self.use_templates and not self.optional_steps
+                and all("template" in target for target in targets)):
+            bounding_boxes = self.template_matcher.match_targets(frame, targets)
+            if bounding_boxes is not None and targets_satisfied(targets, bounding_boxes):
+                logger.info(f"Resolved {len(targets)} element(s) by template matching, skipping vision model")
+                return bounding_boxes
+        if self.screen_index and not full_detection:
+            # A replay is of an earlier frame, so it cannot show a popup this step expects
+            match = self.screen_index.lookup(frame)
+            if match and targets_satisfied(targets, match.bounding_boxes):
+                logger.info(f"Recognised screen from {match.label} (distance {match.distance}), skipping vision model")
+                return match.bounding_boxes
+        if (self.use_locate and len(targets) == 1 and not self.optional_steps and can_locate(targets[0])
+                and hasattr(self.vision_model, "locate")):
+            located = self.vision_model.locate(frame, targets[0])
+            if targets_satisfied(targets, located):
+                return located
+            logger.info("Targeted locate found no match, falling back to full detection")
+        kwargs = {}
+        if targets and not full_detection and getattr(self.vision_model, "accepts_targets", False):
+            kwargs["targets"] = targets
+        if tiers and getattr(self.vision_model, "accepts_tiers", False):
+            kwargs["tiers"] = tiers
+        return self.vision_model.detect_ui_elements(frame, **kwargs)
+    
+    def _take_carryover(self, step: Dict[str, Any], capture_region):
+        """
+        Return the last verification's (frame, bounding_boxes) if it can stand in for a new capture.
+        
+        The detection is reused only if it is recent, covers the step's capture
+        region and already contains the step's target.
+        """
+        carryover, self._carryover = self._carryover, None
+        if not carryover or not self.reuse_verify_detection:
+            return None
+        
+        frame, bounding_boxes, region = carryover
+        if frame.age > self.verify_reuse_max_age:
+            logger.debug(f"Verification detection is {frame.age:.1f}s old - capturing a new screenshot")
+            return None
+        if not region_contains(region, capture_region):
+            return None
+        if "find" in step and not self._find_matching_element(step["find"], bounding_boxes):
+            return None
+        
+        logger.info(f"Reusing verification detection from {frame.age:.1f}s ago ({len(bounding_boxes)} elements)")
+        return frame, bounding_boxes
+    
+    def _start_speculative_verify(self, step: Dict[str, Any], step_num: int, lead: float):
+        """
+        Capture and detect the verify screen on a worker partway through expected_delay.
+        
+        Returns:
+            Future resolving to (frame, bounding_boxes, screen hash at capture), or None
+            if the SUT cannot report screen hashes to validate the result
+        """
+        if self.screenshot_mgr.get_screen_hash() is None:
+            logger.debug("SUT has no screen change detection - speculative verification disabled")
+            self.speculative_verify = False
+            return None
+        
+        if self._speculation_executor is None:
+            self._speculation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SpeculativeVerify")
         
-        logger.debug(f"Searching for element: type='{target_type}', text='{target_text}', match_strategy='{match_type}'")
+        verify_path = f"{self.run_dir}/screenshots/verify_{step_num}.png"
+        verify_region = self._get_capture_region(step["verify_success"])
         
-        for bbox in bounding_boxes:
-            # Check element type
-            type_match = (target_type == "any" or bbox.element_type == target_type)
-            
-            # Check text content
-            text_match = False
-            if bbox.element_text and target_text:
-                bbox_text_lower = bbox.element_text.lower()
-                target_text_lower = target_text.lower()
-                
-                if match_type == "exact":
-                    text_match = target_text_lower == bbox_text_lower
-                elif match_type == "contains":
-                    text_match = target_text_lower in bbox_text_lower
-                elif match_type == "startswith":
-                    text_match = bbox_text_lower.startswith(target_text_lower)
-                elif match_type == "endswith":
-                    text_match = bbox_text_lower.endswith(target_text_lower)
-                
-                # Debug logging for text matching attempts
-                if type_match:
-                    logger.debug(f"  Checking element '{bbox.element_text}': text_match={text_match} (strategy={match_type})")
-                    
-            elif not target_text:
-                text_match = True
-            
-            if type_match and text_match:
-                element_text = bbox.element_text if bbox.element_text else "(no text)"
-                logger.debug(f"✅ Match found: {bbox.element_type} '{element_text}' at ({bbox.x}, {bbox.y})")
-                return bbox
+        def speculate():
+            time.sleep(lead)
+            screen_hash = self.screenshot_mgr.get_screen_hash()
+            frame = self.screenshot_mgr.capture_for(verify_path, verify_region)
+            return frame, self._detect(frame, step["verify_success"], step.get("vision_tiers")), screen_hash
         
-        logger.debug("❌ No matching element found")
-        return None
-            
-
+        return self._speculation_executor.submit(speculate)
+    
+    def _take_speculation(self, speculation):
+        """
+        Return (frame, bounding_boxes) from a speculative verification if the
+        screen has not changed since it was captured, otherwise None.
+        """
+        if speculation is None:
+            return None
+        try:
+            frame, bounding_boxes, screen_hash = speculation.result()
+        except Exception as e:
+            logger.warning(f"Speculative verification failed: {str(e)}")
+            return None
+        
+        current_hash = self.screenshot_mgr.get_screen_hash()
+        if screen_hash is None or current_hash is None:
+            return None
+        distance = hamming_distance(int(screen_hash, 16), int(current_hash, 16))
+        if distance > self.settle_threshold:
+            logger.info(f"Screen changed after the speculative capture (distance {distance}) - capturing again")
+            return None
+        
+        logger.info(f"Using speculative verification captured {frame.age:.1f}s ago")
+        return frame, bounding_boxes
     
-    def _verify_step_success(self, step: Dict[str, Any], step_num: int) -> bool:
+    def _verify_step_success(self, step: Dict[str, Any], step_num: int, speculation=None) -> bool:
         """Verify step success with enhanced checking."""
         logger.info("Verifying step success...")
         
         verify_path = f"{self.run_dir}/screenshots/verify_{step_num}.png"
+        verify_region = self._get_capture_region(step["verify_success"])
         try:
-            self.screenshot_mgr.capture(verify_path)
-            verify_boxes = self.vision_model.detect_ui_elements(verify_path)
+            speculative = self._take_speculation(speculation)
+            if speculative:
+                verify_frame, verify_boxes = speculative
+            else:
+                verify_frame = self.screenshot_mgr.capture_for(verify_path, verify_region)
+                verify_boxes = self._detect(verify_frame, step["verify_success"], step.get("vision_tiers"))
             
             if self.annotator:
                 try:
                     annotated_verify_path = f"{self.run_dir}/annotated/verify_{step_num}.png"
-                    self.annotator.draw_bounding_boxes(verify_path, verify_boxes, annotated_verify_path)
+                    self.annotator.draw_bounding_boxes(verify_frame, verify_boxes, annotated_verify_path)
                 except Exception as e:
                     logger.warning(f"Failed to create verification annotation: {str(e)}")
             
@@ -690,6 +893,11 @@ class SimpleAutomation:
                     success = False
                     logger.warning(f"Verification failed: {verify_element.get('text', 'Unknown element')} not found")
             
+            if success:
+                # The next step usually starts on this same screen
+                self._carryover = (verify_frame, verify_boxes, verify_region)
+                if self.screen_index:
+                    self.screen_index.add(verify_frame, f"step {step_num} verified", verify_boxes)
             return success
             
         except Exception as e:
@@ -0,0 +1,176 @@
+"""
+Per-frame spatial index over detected UI elements.
+Buckets element centers into a uniform grid so region, direction and
+nearest-neighbour queries only look at nearby cells instead of every box.
+"""
+
+import heapq
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class GridIndex:
+    """Uniform grid of element centers for one frame's detections."""
+
+    def __init__(self, boxes: Sequence, cell_size: int = 128):
+        """
+        Build the index.
+
+        Args:
+            boxes: BoundingBox objects or a BoxSet
+            cell_size: Grid cell size in pixels
+        """
+        self.cell_size = cell_size
+        self.count = len(boxes)
+        if hasattr(boxes, "centers"):
+            # BoxSet: take the centers from its coordinate arrays
+            self.centers = [tuple(center) for center in boxes.centers.tolist()]
+        else:
+            self.centers = [(box.x + box.width / 2, box.y + box.height / 2) for box in boxes]
+
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for index, (center_x, center_y) in enumerate(self.centers):
+            self._cells[self._cell(center_x, center_y)].append(index)
+
+        if self._cells:
+            columns = [cell[0] for cell in self._cells]
+            rows = [cell[1] for cell in self._cells]
+            self._bounds = (min(columns), min(rows), max(columns), max(rows))
+        else:
+            self._bounds = (0, 0, -1, -1)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def query_region(self, left: float, top: float, right: float, bottom: float) -> List[int]:
+        """
+        Find elements whose center lies inside a rectangle (edges inclusive).
+
+        Args:
+            left, top, right, bottom: Rectangle in screen pixels (may be infinite)
+
+        Returns:
+            Element indices in detection order
+        """
+        min_column, min_row, max_column, max_row = self._bounds
+        first_column, first_row = self._cell(max(left, min_column * self.cell_size),
+                                             max(top, min_row * self.cell_size))
+        last_column, last_row = self._cell(min(right, (max_column + 1) * self.cell_size),
+                                           min(bottom, (max_row + 1) * self.cell_size))
+
+        found = []
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for index in self._cells.get((column, row), ()):
+                    center_x, center_y = self.centers[index]
+                    if left <= center_x <= right and top <= center_y <= bottom:
+                        found.append(index)
+        found.sort()
+        return found
+
+    def within(self, region: Tuple[int, int, int, int]) -> List[int]:
+        """Elements whose center lies in (x, y, width, height)."""
+        x, y, width, height = region
+        return self.query_region(x, y, x + width, y + height)
+
+    def in_direction(self, anchor, direction: str) -> List[int]:
+        """
+        Find elements beyond an anchor element's edge, closest first.
+
+        Args:
+            anchor: BoundingBox the other elements are compared to
+            direction: below, above, left_of or right_of
+
+        Returns:
+            Element indices ordered by distance from the anchor's center
+
+        Raises:
+            ValueError: If the direction is unknown
+        """
+        inf = math.inf
+        if direction == "below":
+            bounds = (-inf, anchor.y + anchor.height, inf, inf)
+        elif direction == "above":
+            bounds = (-inf, -inf, inf, anchor.y)
+        elif direction == "left_of":
+            bounds = (-inf, -inf, anchor.x, inf)
+        elif direction == "right_of":
+            bounds = (anchor.x + anchor.width, -inf, inf, inf)
+        else:
+            raise ValueError(f"Unknown spatial direction: {direction}")
+
+        anchor_x = anchor.x + anchor.width / 2
+        anchor_y = anchor.y + anchor.height / 2
+        found = self.query_region(*bounds)
+        found.sort(key=lambda index: (math.hypot(self.centers[index][0] - anchor_x,
+                                                 self.centers[index][1] - anchor_y), index))
+        return found
+
+    def iter_nearest(self, x: float, y: float) -> Iterator[int]:
+        """
+        Yield element indices in order of center distance from a point.
+
+        Searches outward ring by ring, so taking the first few results only
+        touches the cells around the point.
+
+        Args:
+            x: Screen x coordinate
+            y: Screen y coordinate
+
+        Yields:
+            Element indices, nearest first
+        """
+        if not self.count:
+            return
+        origin_column, origin_row = self._cell(x, y)
+        min_column, min_row, max_column, max_row = self._bounds
+        max_ring = max(abs(origin_column - min_column), abs(origin_column - max_column),
+                       abs(origin_row - min_row), abs(origin_row - max_row))
+
+        heap = []
+        for ring in range(max_ring + 1):
+            for column, row in self._ring_cells(origin_column, origin_row, ring):
+                for index in self._cells.get((column, row), ()):
+                    center_x, center_y = self.centers[index]
+                    heapq.heappush(heap, (math.hypot(center_x - x, center_y - y), index))
+            # Anything not seen yet is at least this far away
+            safe_distance = ring * self.cell_size
+            while heap and heap[0][0] <= safe_distance:
+                yield heapq.heappop(heap)[1]
+        while heap:
+            yield heapq.heappop(heap)[1]
+
+    @staticmethod
+    def _ring_cells(column: int, row: int, ring: int) -> Iterator[Tuple[int, int]]:
+        if ring == 0:
+            yield (column, row)
+            return
+        for offset in range(-ring, ring + 1):
+            yield (column + offset, row - ring)
+            yield (column + offset, row + ring)
+        for offset in range(-ring + 1, ring):
+            yield (column - ring, row + offset)
+            yield (column + ring, row + offset)
+
+_last_index: Tuple[Optional[Sequence], Optional[GridIndex]] = (None, None)
+
+def get_spatial_index(bounding_boxes: Sequence) -> GridIndex:
+    """
+    Get the spatial index for a frame's detected elements, reusing the last
+    one built for the same list so nested selectors share one index.
+
+    Args:
+        bounding_boxes: Detected UI elements
+
+    Returns:
+        GridIndex over their centers
+    """
+    global _last_index
+    boxes, index = _last_index
+    if boxes is not bounding_boxes or index.count != len(bounding_boxes):
+        index = GridIndex(bounding_boxes)
+        _last_index = (bounding_boxes, index)
+    return index
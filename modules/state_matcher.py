@@ -0,0 +1,284 @@
+"""
+Compiled multi-pattern matcher for FSM state definitions.
+Builds one Aho-Corasick automaton over the lower-cased texts of every
+required/excluded element in the config, so a frame is scored against all
+states in a single pass over the detected elements.
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from modules.gemma_client import BoundingBox
+from modules.frame import parse_region, box_in_region
+from modules.fuzzy_matcher import DEFAULT_FUZZY_THRESHOLD, get_fuzzy_index
+from modules.element_matcher import SPATIAL_KEYS, find_matching_element
+
+logger = logging.getLogger(__name__)
+
+class AhoCorasick:
+    """Aho-Corasick automaton reporting every occurrence of a set of patterns in a text."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._patterns: List[List[Tuple[int, Any]]] = [[]]  # Patterns ending at each node
+        self._output: List[List[Tuple[int, Any]]] = [[]]  # Including those reachable by failure links
+        self._built = True
+
+    def add(self, pattern: str, value: Any):
+        """
+        Add a pattern.
+
+        Args:
+            pattern: Non-empty string to search for
+            value: Reported with every occurrence of the pattern
+        """
+        node = 0
+        for char in pattern:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._patterns.append([])
+                self._goto[node][char] = child
+            node = child
+        self._patterns[node].append((len(pattern), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links (called automatically before the first search)."""
+        self._output = [list(patterns) for patterns in self._patterns]
+        queue = deque(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def search(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Find all pattern occurrences in a text.
+
+        Args:
+            text: Text to scan
+
+        Yields:
+            (start, end, value) for every occurrence, end exclusive
+        """
+        if not self._built:
+            self.build()
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, value in self._output[node]:
+                yield index + 1 - length, index + 1, value
+
+@dataclass
+class _Rule:
+    """One required or excluded element of a state, compiled."""
+    state: str
+    excluded: bool
+    element_type: str
+    text: str
+    match_type: str
+    min_confidence: float
+    region: Optional[Tuple[int, int, int, int]]
+    definition: Dict[str, Any]
+    fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD
+
+    def accepts(self, bbox: BoundingBox) -> bool:
+        """Check the non-text conditions (type, confidence, region)."""
+        if self.element_type not in ("any", "") and bbox.element_type != self.element_type:
+            return False
+        if bbox.confidence < self.min_confidence:
+            return False
+        return box_in_region(bbox, self.region)
+
+@dataclass
+class StateMatch:
+    """Result of scoring one state against a frame."""
+    state: str
+    matched: bool
+    required: List[Optional[BoundingBox]] = field(default_factory=list)
+    excluded: List[BoundingBox] = field(default_factory=list)
+
+    @property
+    def score(self) -> float:
+        """Fraction of required elements found (0 if an excluded element is present)."""
+        if self.excluded:
+            return 0.0
+        if not self.required:
+            return 1.0
+        return sum(1 for bbox in self.required if bbox is not None) / len(self.required)
+
+    @property
+    def element(self) -> Optional[BoundingBox]:
+        """The last matched required element (mirrors the old per-state matcher)."""
+        for bbox in reversed(self.required):
+            if bbox is not None:
+                return bbox
+        return None
+
+class StateMatcher:
+    """Scores every FSM state against a frame's detected elements in one pass."""
+
+    def __init__(self, states: Dict[str, Dict[str, Any]]):
+        """
+        Compile the state definitions.
+
+        Args:
+            states: The config's states section
+        """
+        self.rules: List[_Rule] = []
+        self._state_rules: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._textless: List[int] = []
+        self._fuzzy: List[int] = []  # Matched through the per-frame fuzzy index instead of the automaton
+        self._spatial: List[int] = []  # Rules with spatial predicates, resolved through the selector matcher
+        self._automaton = AhoCorasick()
+        rules_by_text: Dict[str, List[int]] = {}
+
+        for state_name, state_def in states.items():
+            state_def = state_def or {}
+            required_ids, excluded_ids = [], []
+            for excluded, element_defs, ids in ((False, state_def.get("required_elements", []), required_ids),
+                                                (True, state_def.get("exclude_elements", []), excluded_ids)):
+                for element_def in element_defs:
+                    rule = self._compile_rule(state_name, excluded, element_def)
+                    rule_id = len(self.rules)
+                    self.rules.append(rule)
+                    ids.append(rule_id)
+                    if any(key in element_def for key in SPATIAL_KEYS):
+                        self._spatial.append(rule_id)
+                    elif rule.text and rule.match_type == "fuzzy":
+                        self._fuzzy.append(rule_id)
+                    elif rule.text:
+                        rules_by_text.setdefault(rule.text, []).append(rule_id)
+                    else:
+                        self._textless.append(rule_id)
+            self._state_rules[state_name] = (required_ids, excluded_ids)
+
+        for text, rule_ids in rules_by_text.items():
+            self._automaton.add(text, rule_ids)
+        self._automaton.build()
+
+        logger.info(f"StateMatcher compiled {len(self.rules)} rules ({len(rules_by_text)} distinct texts) "
+                    f"for {len(states)} states")
+
+    def _compile_rule(self, state_name: str, excluded: bool, element_def: Dict[str, Any]) -> _Rule:
+        try:
+            region = parse_region(element_def.get("search_region"))
+        except ValueError as e:
+            logger.warning(f"Ignoring {str(e)}")
+            region = None
+        return _Rule(
+            state=state_name,
+            excluded=excluded,
+            element_type=element_def.get("type", "any") or "",
+            text=(element_def.get("text", "") or "").lower(),
+            match_type=element_def.get("text_match", "exact"),
+            # Excluded elements block a state at any confidence
+            min_confidence=0.0 if excluded else element_def.get("required_confidence", 0.6),
+            region=region,
+            definition=element_def,
+            fuzzy_threshold=element_def.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD)
+        )
+
+    def _match_rules(self, bounding_boxes: List[BoundingBox]) -> List[Optional[BoundingBox]]:
+        """Find the first element (in detection order) satisfying each rule."""
+        matches: List[Optional[BoundingBox]] = [None] * len(self.rules)
+        remaining = len(self.rules)
+
+        for bbox in bounding_boxes:
+            if not remaining:
+                break
+
+            for rule_id in self._textless:
+                if matches[rule_id] is None and self.rules[rule_id].accepts(bbox):
+                    matches[rule_id] = bbox
+                    remaining -= 1
+
+            if not bbox.element_text:
+                continue
+            text = bbox.element_text.lower()
+            for start, end, rule_ids in self._automaton.search(text):
+                whole_prefix = start == 0
+                whole_suffix = end == len(text)
+                for rule_id in rule_ids:
+                    if matches[rule_id] is not None:
+                        continue
+                    rule = self.rules[rule_id]
+                    match_type = rule.match_type
+                    if match_type == "exact":
+                        text_match = whole_prefix and whole_suffix
+                    elif match_type == "contains":
+                        text_match = True
+                    elif match_type == "startswith":
+                        text_match = whole_prefix
+                    elif match_type == "endswith":
+                        text_match = whole_suffix
+                    else:
+                        text_match = False
+                    if text_match and rule.accepts(bbox):
+                        matches[rule_id] = bbox
+                        remaining -= 1
+
+        if self._fuzzy and bounding_boxes:
+            index = get_fuzzy_index(bounding_boxes)
+            for rule_id in self._fuzzy:
+                rule = self.rules[rule_id]
+                for element_index, _ in index.find(rule.text, rule.fuzzy_threshold):
+                    if rule.accepts(bounding_boxes[element_index]):
+                        matches[rule_id] = bounding_boxes[element_index]
+                        break
+
+        for rule_id in self._spatial:
+            rule = self.rules[rule_id]
+            selector = dict(rule.definition, text_match=rule.match_type, required_confidence=rule.min_confidence)
+            matches[rule_id] = find_matching_element(selector, bounding_boxes)
+        return matches
+
+    def match(self, bounding_boxes: List[BoundingBox]) -> Dict[str, StateMatch]:
+        """
+        Score every state against a frame.
+
+        A state matches when all its required elements are present and none
+        of its excluded elements are.
+
+        Args:
+            bounding_boxes: Detected UI elements
+
+        Returns:
+            Dictionary mapping state name to StateMatch
+        """
+        matches = self._match_rules(bounding_boxes)
+        results = {}
+        for state_name, (required_ids, excluded_ids) in self._state_rules.items():
+            required = [matches[rule_id] for rule_id in required_ids]
+            excluded = [matches[rule_id] for rule_id in excluded_ids if matches[rule_id] is not None]
+            matched = not excluded and all(bbox is not None for bbox in required)
+            results[state_name] = StateMatch(state_name, matched, required, excluded)
+        return results
+
+    def matching_states(self, bounding_boxes: List[BoundingBox]) -> List[StateMatch]:
+        """
+        Get all states matching a frame.
+
+        Args:
+            bounding_boxes: Detected UI elements
+
+        Returns:
+            StateMatch objects for the matching states, in config order
+        """
+        return [result for result in self.match(bounding_boxes).values() if result.matched]
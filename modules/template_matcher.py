@@ -0,0 +1,286 @@
+"""
+Local template-matching detector for visually fixed UI assets.
+Finds reference crops (e.g. the CS2 PLAY icon) in a frame with multi-scale
+normalized cross-correlation in NumPy, so steps targeting them can skip the
+remote vision model entirely.
+
+Reference crops are cut at screen resolution from earlier runs' screenshots:
+    python -m modules.template_matcher <screenshot.png> <x,y,width,height> <template.png>
+"""
+
+import os
+import sys
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from modules.box_set import BoundingBox, BoxSet
+from modules.frame import Frame, parse_region
+from modules.vision_client import VisionClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_THRESHOLD = 0.85
+
+def normalized_cross_correlation(image: np.ndarray, template: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Zero-mean normalized cross-correlation of a template over an image.
+
+    The correlation is computed with FFTs and the per-window statistics
+    with integral images, so the cost does not grow with the template size.
+
+    Args:
+        image: 2-D grayscale array
+        template: 2-D grayscale array no larger than the image
+
+    Returns:
+        Score map of shape (ih - th + 1, iw - tw + 1) with values in [-1, 1],
+        or None if the template does not fit or is flat
+    """
+    image_height, image_width = image.shape
+    template_height, template_width = template.shape
+    if template_height > image_height or template_width > image_width:
+        return None
+
+    template = template - template.mean()
+    template_norm = np.sqrt((template ** 2).sum())
+    if template_norm < 1e-6:
+        return None
+
+    # Correlation as convolution with the flipped template (zero-mean template, so the
+    # image's local mean drops out of the numerator)
+    shape = (image_height + template_height - 1, image_width + template_width - 1)
+    spectrum = np.fft.rfft2(image, shape) * np.fft.rfft2(template[::-1, ::-1], shape)
+    correlation = np.fft.irfft2(spectrum, shape)[template_height - 1:image_height, template_width - 1:image_width]
+
+    # Window sums from integral images
+    area = template_height * template_width
+    integral = np.pad(image, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    integral_sq = np.pad(image ** 2, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+
+    def window_sum(table):
+        return (table[template_height:, template_width:] - table[:-template_height, template_width:]
+                - table[template_height:, :-template_width] + table[:-template_height, :-template_width])
+
+    window_total = window_sum(integral)
+    variance = np.maximum(window_sum(integral_sq) - window_total ** 2 / area, 0.0)
+    denominator = np.sqrt(variance) * template_norm
+    return np.divide(correlation, denominator, out=np.zeros_like(correlation), where=denominator > 1e-6)
+
+class TemplateMatcher:
+    """Matches reference crops against frames on the ARL."""
+
+    def __init__(self, template_dir: str = None, work_width: int = 640,
+                 scales: Tuple[float, ...] = (0.85, 0.92, 1.0, 1.08, 1.18)):
+        """
+        Initialize the template matcher.
+
+        Args:
+            template_dir: Directory relative template paths are resolved against
+            work_width: Frames are downscaled to at most this width before matching
+            scales: Template scales tried around the expected size (UI scaling differences)
+        """
+        self.template_dir = template_dir
+        self.work_width = work_width
+        self.scales = scales
+        self._templates: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def _resolve(self, template_path: str) -> str:
+        if self.template_dir and not os.path.isabs(template_path):
+            return os.path.join(self.template_dir, template_path)
+        return template_path
+
+    def _load_template(self, template_path: str) -> np.ndarray:
+        """Load a template as a grayscale array (cached)."""
+        path = self._resolve(template_path)
+        with self._lock:
+            template = self._templates.get(path)
+            if template is None:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Template not found: {path}")
+                template = np.asarray(Image.open(path).convert("L"), dtype=np.float64)
+                self._templates[path] = template
+            return template
+
+    def match(self, frame: Union[Frame, str], template_path: str,
+              region: Optional[Tuple[int, int, int, int]] = None,
+              threshold: float = DEFAULT_TEMPLATE_THRESHOLD) -> Optional[Tuple[BoundingBox, float]]:
+        """
+        Find a template in a frame.
+
+        Args:
+            frame: Frame or image path
+            template_path: Reference crop captured at screen resolution
+            region: Optional (x, y, width, height) screen region to search
+            threshold: Minimum normalized cross-correlation score
+
+        Returns:
+            (BoundingBox in screen coordinates, score) or None if not found
+        """
+        frame = Frame.coerce(frame)
+        template = self._load_template(template_path)
+
+        # Search area in image coordinates
+        left, top, right, bottom = 0, 0, frame.width, frame.height
+        if region is not None:
+            x, y, width, height = region
+            left = max(0, int((x - frame.offset_x) * frame.scale))
+            top = max(0, int((y - frame.offset_y) * frame.scale))
+            right = min(frame.width, int((x + width - frame.offset_x) * frame.scale) + 1)
+            bottom = min(frame.height, int((y + height - frame.offset_y) * frame.scale) + 1)
+            if right <= left or bottom <= top:
+                return None
+
+        factor = min(1.0, self.work_width / max(1, right - left))
+        search = frame.image.crop((left, top, right, bottom)).convert("L")
+        if factor < 1.0:
+            search = search.resize((max(1, round(search.width * factor)), max(1, round(search.height * factor))),
+                                   Image.BILINEAR)
+        search = np.asarray(search, dtype=np.float64)
+
+        best = None
+        for scale in self.scales:
+            # Template pixels are screen pixels; bring them to the work image's resolution
+            size_factor = frame.scale * factor * scale
+            width = round(template.shape[1] * size_factor)
+            height = round(template.shape[0] * size_factor)
+            if width < 6 or height < 6:
+                continue
+            resized = np.asarray(Image.fromarray(template.astype(np.uint8)).resize((width, height), Image.BILINEAR),
+                                 dtype=np.float64)
+            scores = normalized_cross_correlation(search, resized)
+            if scores is None:
+                continue
+            row, column = np.unravel_index(np.argmax(scores), scores.shape)
+            score = float(scores[row, column])
+            if best is None or score > best[0]:
+                best = (score, column, row, width, height)
+
+        if best is None or best[0] < threshold:
+            self.misses += 1
+            logger.debug(f"Template {template_path} not found (best score {best[0] if best else 0:.2f})")
+            return None
+
+        score, column, row, width, height = best
+        box = BoundingBox(
+            x=int(round(left + column / factor)),
+            y=int(round(top + row / factor)),
+            width=int(round(width / factor)),
+            height=int(round(height / factor)),
+            confidence=score,
+            element_type="icon",
+            element_text=""
+        )
+        self.hits += 1
+        return frame.map_boxes_to_screen([box])[0], score
+
+    def match_targets(self, frame: Union[Frame, str], targets: List[Dict[str, Any]],
+                      require_all: bool = True) -> Optional[BoxSet]:
+        """
+        Resolve targets through their templates.
+
+        Args:
+            frame: Frame or image path
+            targets: Element definitions declaring template: (others are skipped)
+            require_all: Give up as soon as one template is not found
+
+        Returns:
+            BoxSet with one element per found target (typed and labelled as the target so
+            the normal selector matching accepts it), or None if require_all and a template is missing
+        """
+        boxes = []
+        for target in targets:
+            if "template" not in target:
+                if require_all:
+                    return None
+                continue
+            try:
+                region = parse_region(target.get("search_region") or target.get("within"))
+            except ValueError:
+                region = None
+            try:
+                result = self.match(frame, target["template"], region,
+                                    target.get("template_threshold", DEFAULT_TEMPLATE_THRESHOLD))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Template matching failed for {target.get('template')}: {str(e)}")
+                result = None
+            if result is None:
+                if require_all:
+                    return None
+                continue
+            box, score = result
+            target_type = target.get("type", "any")
+            box.element_type = target_type if target_type not in ("any", "") else "icon"
+            box.element_text = target.get("text", "")
+            logger.info(f"Template {target['template']} matched at ({box.x}, {box.y}) with score {score:.2f}")
+            boxes.append(box)
+        return BoxSet.from_boxes(boxes)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Template hits and misses."""
+        return {"hits": self.hits, "misses": self.misses}
+
+class TemplateVisionClient(VisionClient):
+    """Template matching behind the vision client interface (the local tier of a cascade)."""
+
+    accepts_targets = True
+
+    def __init__(self, matcher: TemplateMatcher):
+        """
+        Initialize the client.
+
+        Args:
+            matcher: TemplateMatcher holding the reference crops
+        """
+        self.matcher = matcher
+
+    def detect_ui_elements(self, image: Union[Frame, str], targets: List[Dict[str, Any]] = None) -> BoxSet:
+        """
+        Find the targets that declare a template: image.
+
+        Args:
+            image: Frame or path of the screenshot image
+            targets: Element definitions the caller is looking for
+
+        Returns:
+            BoxSet of the targets found (empty without template targets)
+        """
+        return self.matcher.match_targets(image, targets or [], require_all=False)
+
+    def close(self):
+        """Log template hits and misses."""
+        stats = self.matcher.get_stats()
+        logger.info(f"Template matching: {stats['hits']} hits / {stats['misses']} misses")
+
+def save_template(image_path: str, region: Tuple[int, int, int, int], output_path: str):
+    """
+    Cut a reference crop out of a full-resolution screenshot.
+
+    Args:
+        image_path: Screenshot from an earlier run (screen resolution)
+        region: (x, y, width, height) of the asset
+        output_path: Where to write the template PNG
+    """
+    x, y, width, height = region
+    with Image.open(image_path) as image:
+        crop = image.crop((x, y, x + width, y + height))
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        crop.save(output_path)
+    logger.info(f"Saved template {output_path} ({width}x{height}) from {image_path}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 4:
+        print("Usage: python -m modules.template_matcher <screenshot.png> <x,y,width,height> <template.png>")
+        sys.exit(1)
+    save_template(sys.argv[1], parse_region(sys.argv[2]), sys.argv[3])
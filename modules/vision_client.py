@@ -0,0 +1,75 @@
+"""
+Common base for the vision clients.
+Adds a thread-pool backed detect_ui_elements_async so several backends
+can run on the same frame at once.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Union
+
+from modules.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_inference_executor() -> ThreadPoolExecutor:
+    """Get the thread pool shared by all asynchronous detection calls."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="VisionInference")
+        return _executor
+
+class VisionClient:
+    """Base class for clients that detect UI elements in a screenshot."""
+
+    def detect_ui_elements(self, image: Union[Frame, str], *args, **kwargs) -> List:
+        """
+        Detect UI elements in an image (implemented by each client).
+
+        Args:
+            image: Frame or path of the screenshot image
+
+        Returns:
+            List of detected UI elements with bounding boxes
+        """
+        raise NotImplementedError
+
+    def detect_ui_elements_async(self, image: Union[Frame, str], *args, **kwargs) -> Future:
+        """
+        Run detect_ui_elements on the shared inference thread pool.
+
+        An HTTP request that is already in flight cannot be interrupted;
+        cancelling the returned future only drops its result.
+
+        Args:
+            image: Frame or path of the screenshot image
+            *args, **kwargs: Passed through to detect_ui_elements
+
+        Returns:
+            Future resolving to the list of detected UI elements
+        """
+        # Read a path on the caller's thread so a missing file fails immediately
+        frame = Frame.coerce(image)
+        return get_inference_executor().submit(self.detect_ui_elements, frame, *args, **kwargs)
+
+    def warm_up(self):
+        """Load the model and prime server-side caches before the first real request (no-op by default)."""
+        pass
+
+    def warm_up_async(self) -> Future:
+        """
+        Run warm_up on the shared inference thread pool (e.g. while the game starts).
+
+        Returns:
+            Future resolving when the warm-up has finished
+        """
+        return get_inference_executor().submit(self.warm_up)
+
+    def close(self):
+        """Release client resources."""
+        pass
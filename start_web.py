@@ -383,6 +383,9 @@ def run_simple_automation(config_parser, config, settings):
             logger.info(f"Launching game from: {settings['game_path']}")
             game_launcher.launch(settings['game_path'])
             
+            # Load the vision model while the game starts instead of on the first detection
+            vision_model.warm_up_async()
+            
             # Wait for startup
             startup_wait = config_parser.get_game_metadata().get("startup_wait", 30)
             logger.info(f"Waiting {startup_wait} seconds for game to initialize...")
@@ -412,6 +415,7 @@ def run_simple_automation(config_parser, config, settings):
         success = simple_auto.run()
         
         # Cleanup
+        screenshot_mgr.close()
         network.close()
         if hasattr(vision_model, 'close'):
             vision_model.close()
@@ -426,6 +430,7 @@ def run_state_machine_automation(config_parser, config, settings):
     """Run state machine automation process"""
     try:
         from modules.decision_engine import DecisionEngine
+        from modules.pixel_probe import PixelProbe
         from modules.network import NetworkManager
         from modules.screenshot import ScreenshotManager
         from modules.gemma_client import GemmaClient
@@ -459,6 +464,8 @@ def run_state_machine_automation(config_parser, config, settings):
         
         annotator = Annotator()
         decision_engine = DecisionEngine(config)
+        pixel_probe = PixelProbe(network, screenshot_mgr)
+        pixel_checks = decision_engine.get_pixel_checks()
         game_launcher = GameLauncher(network)
         
         # Launch game if path provided
@@ -466,6 +473,9 @@ def run_state_machine_automation(config_parser, config, settings):
             logger.info(f"Launching game from: {settings['game_path']}")
             game_launcher.launch(settings['game_path'])
             
+            # Load the vision model while the game starts instead of on the first detection
+            vision_model.warm_up_async()
+            
             # Wait for startup
             startup_wait = config_parser.get_game_metadata().get("startup_wait", 30)
             logger.info(f"Waiting {startup_wait} seconds for game to initialize...")
@@ -496,19 +506,22 @@ def run_state_machine_automation(config_parser, config, settings):
             
             # Capture screenshot
             screenshot_path = f"{run_dir}/screenshots/screenshot_{iteration}.png"
-            screenshot_mgr.capture(screenshot_path)
+            frame = screenshot_mgr.capture_for(screenshot_path, decision_engine.get_capture_region(current_state))
             
             # Process with vision model
-            bounding_boxes = vision_model.detect_ui_elements(screenshot_path)
+            bounding_boxes = vision_model.detect_ui_elements(frame)
             logger.info(f"Detected {len(bounding_boxes)} UI elements")
             
             # Annotate screenshot
             annotated_path = f"{run_dir}/annotated/annotated_{iteration}.png"
-            annotator.draw_bounding_boxes(screenshot_path, bounding_boxes, annotated_path)
+            annotator.draw_bounding_boxes(frame, bounding_boxes, annotated_path)
+            
+            # Sample the pixels behind the states' pixel_checks
+            pixel_samples = pixel_probe.sample(pixel_checks) if pixel_checks else None
             
             # Determine next action
             previous_state = current_state
-            next_action, new_state = decision_engine.determine_next_action(current_state, bounding_boxes)
+            next_action, new_state = decision_engine.determine_next_action(current_state, bounding_boxes, pixel_samples)
             
             # Execute action
             if next_action and not (automation_state['stop_event'] and automation_state['stop_event'].is_set()):
@@ -526,6 +539,7 @@ def run_state_machine_automation(config_parser, config, settings):
             time.sleep(1)  # Brief pause between iterations
         
         # Cleanup
+        screenshot_mgr.close()
         network.close()
         if hasattr(vision_model, 'close'):
             vision_model.close()
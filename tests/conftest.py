@@ -0,0 +1,25 @@
+"""
+Shared test setup: the modules/ directory is imported as in main.py,
+relative to the repository root.
+"""
+
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.frame import Frame
+
+def make_frame(width: int = 64, height: int = 64, color=(0, 0, 0)) -> Frame:
+    """Build an in-memory PNG frame of a single colour."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return Frame(buffer.getvalue())
+
+@pytest.fixture
+def frame() -> Frame:
+    return make_frame()
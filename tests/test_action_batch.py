@@ -0,0 +1,105 @@
+"""Tests for batched actions: client-side coalescing and the SUT's batch runner."""
+
+import pytest
+import yaml
+
+import modules.network as network_module
+from modules.network import NetworkManager
+from modules.simple_automation import SimpleAutomation
+
+@pytest.fixture
+def network(monkeypatch):
+    manager = NetworkManager("127.0.0.1", 8080, use_channel=False, connect=False)
+    manager.sent = []
+
+    def send_actions(actions, stop_on_error=True):
+        manager.sent.append([dict(action) for action in actions])
+        return {"status": "success", "actions_completed": len(actions), "results": []}
+
+    monkeypatch.setattr(manager, "send_actions", send_actions)
+    return manager
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record time.sleep calls instead of sleeping."""
+    calls = []
+    monkeypatch.setattr(network_module.time, "sleep", calls.append)
+    return calls
+
+def test_batch_coalesces_actions_and_pauses(network, sleeps):
+    with network.batch():
+        network.send_action({"type": "click", "x": 1, "y": 2})
+        network.pause(0.5)
+        network.send_action({"type": "key", "key": "enter"})
+        network.pause(2)
+    assert network.sent == [[{"type": "click", "x": 1, "y": 2, "delay_after": 0.5},
+                             {"type": "key", "key": "enter", "delay_after": 2}]]
+    assert sleeps == []
+
+def test_nested_batches_send_once(network):
+    with network.batch():
+        network.send_action({"type": "key", "key": "a"})
+        with network.batch():
+            network.send_action({"type": "key", "key": "b"})
+        assert network.sent == []
+    assert len(network.sent) == 1 and len(network.sent[0]) == 2
+
+def test_pause_before_any_action_sleeps_locally(network, sleeps):
+    with network.batch():
+        network.pause(1.5)
+        network.send_action({"type": "key", "key": "a"})
+    assert sleeps == [1.5]
+    assert network.sent == [[{"type": "key", "key": "a"}]]
+
+def test_flush_sends_queued_actions(network):
+    with network.batch():
+        network.send_action({"type": "key", "key": "a"})
+        network.flush()
+        assert network.sent == [[{"type": "key", "key": "a"}]]
+        network.send_action({"type": "key", "key": "b"})
+    assert network.sent == [[{"type": "key", "key": "a"}], [{"type": "key", "key": "b"}]]
+
+def test_failed_batch_raises(network, monkeypatch):
+    monkeypatch.setattr(network, "send_actions", lambda actions, stop_on_error=True: {
+        "status": "error", "actions_completed": 0, "results": [{"status": "error", "error": "boom"}]})
+    with pytest.raises(RuntimeError, match="boom"):
+        with network.batch():
+            network.send_action({"type": "key", "key": "a"})
+
+def test_sequential_fallback_honours_trailing_delay(sleeps, monkeypatch):
+    manager = NetworkManager("127.0.0.1", 8080, use_channel=False, connect=False)
+    monkeypatch.setattr(manager, "send_action", lambda action: {"status": "success"})
+    result = manager._send_actions_sequentially([{"type": "key", "delay_after": 1},
+                                                 {"type": "key", "delay_after": 3}], True)
+    assert result["actions_completed"] == 2
+    assert sleeps == [1, 3]
+
+def test_conditional_wait_in_sequence_runs_locally(network, sleeps, tmp_path, monkeypatch):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump({"metadata": {"game_name": "Test"},
+                                           "steps": {1: {"description": "Wait", "action": "wait"}}}))
+    automation = SimpleAutomation(str(config_path), network, None, None, run_dir=str(tmp_path))
+    waits = []
+    monkeypatch.setattr(automation, "_interruptible_wait", waits.append)
+
+    sequence = {"type": "sequence", "delay_between": 0, "actions": [
+        {"type": "key", "key": "enter"},
+        {"type": "wait", "condition": "loaded", "max_wait": 30},
+        {"type": "wait", "duration": 2}]}
+    assert automation._execute_modular_action(sequence, None, 1)
+
+    # The key press is sent before the conditional wait, which is not turned into a SUT-side sleep
+    assert [action["type"] for action in network.sent[0]] == ["key"]
+    assert all(action.get("delay_after", 0) < 30 for batch in network.sent for action in batch)
+    assert waits == [30]
+    assert sleeps == [2]  # Nothing queued after the flush, so the plain wait runs here too
+
+def test_sut_batch_honours_trailing_delay(monkeypatch):
+    # The SUT service needs Windows-only modules
+    sut = pytest.importorskip("gemma_sut_service")
+    sleeps = []
+    monkeypatch.setattr(sut, "perform_action_internal", lambda action: {"status": "success"})
+    monkeypatch.setattr(sut.time, "sleep", sleeps.append)
+    result = sut.run_action_batch([{"type": "key", "delay_after": 0.5}, {"type": "key", "delay_after": 2}])
+    assert result["actions_completed"] == 2
+    assert sleeps == [0.5, 2.0]
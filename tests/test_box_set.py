@@ -0,0 +1,99 @@
+"""Tests for the columnar BoxSet container."""
+
+import random
+
+import numpy as np
+import pytest
+
+from modules.box_set import BoundingBox, BoxSet
+from modules.frame import box_in_region
+
+BOXES = [
+    BoundingBox(0, 0, 100, 50, 0.9, "button", "Play"),
+    BoundingBox(200, 0, 100, 50, 0.5, "label", "Settings"),
+    BoundingBox(10, 10, 20, 10, 0.7, "button", "X"),
+    BoundingBox(400, 300, 60, 60, 0.8, "icon", ""),
+]
+
+def random_boxes(rng, count):
+    return [BoundingBox(rng.randint(0, 1800), rng.randint(0, 1000), rng.randint(1, 200), rng.randint(1, 80),
+                        round(rng.random(), 2), rng.choice(["button", "label", "icon"]),
+                        rng.choice(["Play", "Quit", "", "Options"])) for _ in range(count)]
+
+def test_round_trip_preserves_order_and_fields():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert len(boxes) == len(BOXES)
+    assert list(boxes) == BOXES
+    assert boxes.element_types == [box.element_type for box in BOXES]
+
+def test_from_boxes_returns_a_boxset_unchanged():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert BoxSet.from_boxes(boxes) is boxes
+
+def test_indexing():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert boxes[-1] == BOXES[-1]
+    assert boxes[0] is boxes[0]  # Materialised once
+    assert list(boxes[1:3]) == BOXES[1:3]
+    assert isinstance(boxes[1:3], BoxSet)
+
+def test_empty():
+    boxes = BoxSet()
+    assert len(boxes) == 0
+    assert list(boxes.filter(element_type="button")) == []
+    assert len(boxes.nearest(0, 0)) == 0
+
+def test_columns_must_have_same_length():
+    with pytest.raises(ValueError):
+        BoxSet([1, 2], [1], [1], [1], [1.0], ["button"], ["a"])
+
+def test_filter():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert [box.element_text for box in boxes.filter(element_type="button")] == ["Play", "X"]
+    assert [box.element_text for box in boxes.filter(min_confidence=0.75)] == ["Play", ""]
+    assert len(boxes.filter(element_type="slider")) == 0
+    assert len(boxes.filter(element_type="any")) == len(BOXES)
+
+def test_region_queries_agree_with_box_in_region():
+    rng = random.Random(7)
+    boxes = BoxSet.from_boxes(random_boxes(rng, 200))
+    for _ in range(20):
+        region = (rng.randint(0, 1500), rng.randint(0, 800), rng.randint(50, 500), rng.randint(50, 400))
+        assert list(boxes.in_region(region)) == [box for box in boxes if box_in_region(box, region)]
+
+def test_containing_point_smallest_first():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert [box.element_text for box in boxes.containing_point(15, 15)] == ["X", "Play"]
+    assert len(boxes.containing_point(1000, 1000)) == 0
+
+def test_nearest():
+    boxes = BoxSet.from_boxes(BOXES)
+    assert boxes.nearest(430, 330)[0].element_type == "icon"
+    assert len(boxes.nearest(0, 0, k=2)) == 2
+
+def test_iou_matrix():
+    boxes = BoxSet.from_boxes([BoundingBox(0, 0, 10, 10, 1.0, "a"), BoundingBox(5, 0, 10, 10, 1.0, "a"),
+                               BoundingBox(50, 50, 10, 10, 1.0, "a")])
+    iou = boxes.iou_matrix()
+    assert np.allclose(np.diag(iou), 1.0)
+    assert iou[0, 1] == pytest.approx(50 / 150)
+    assert iou[0, 2] == 0.0
+    assert np.allclose(iou, iou.T)
+
+def test_deduplicate_keeps_most_confident_of_same_text():
+    boxes = BoxSet.from_boxes([BoundingBox(0, 0, 100, 50, 0.6, "button", "Play"),
+                               BoundingBox(2, 1, 100, 50, 0.9, "button", "PLAY"),
+                               BoundingBox(1, 0, 100, 50, 0.8, "label", "Other")])
+    assert [(box.element_text, box.confidence) for box in boxes.deduplicate()] == [("PLAY", 0.9), ("Other", 0.8)]
+
+def test_transform():
+    boxes = BoxSet.from_boxes(BOXES[:1]).transform(2.0, 100, 50)
+    assert boxes[0] == BoundingBox(100, 50, 200, 100, 0.9, "button", "Play")
+
+def test_subsets_do_not_change_the_original():
+    boxes = BoxSet.from_boxes(BOXES)
+    first = boxes[0]
+    boxes.transform(3.0)
+    boxes.filter(element_type="icon")
+    assert boxes[0] is first
+    assert list(boxes) == BOXES
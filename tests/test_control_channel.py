@@ -0,0 +1,123 @@
+"""Tests for the control channel framing, pipelining and failure handling."""
+
+import json
+import socket
+import threading
+
+import pytest
+
+from modules.control_channel import CHANNEL_HEADER, ChannelSendError, ControlChannel
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("closed")
+        data += chunk
+    return data
+
+def send_frame(conn: socket.socket, message: dict, payload: bytes = b""):
+    body = json.dumps(message).encode("utf-8")
+    conn.sendall(CHANNEL_HEADER.pack(len(body), len(payload)) + body + payload)
+
+class FakeSUT:
+    """Accepts one channel connection and hands requests to a handler."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.conn = None
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        self.conn, _ = self.server.accept()
+        try:
+            while True:
+                json_length, payload_length = CHANNEL_HEADER.unpack(recv_exact(self.conn, CHANNEL_HEADER.size))
+                request = json.loads(recv_exact(self.conn, json_length))
+                assert payload_length == 0
+                self.requests.append(request)
+                self.handler(self, request)
+        except (ConnectionError, OSError):
+            pass
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+        self.server.close()
+
+@pytest.fixture
+def make_channel():
+    opened = []
+
+    def make(handler):
+        sut = FakeSUT(handler)
+        channel = ControlChannel("127.0.0.1", sut.port, request_timeout=2.0)
+        opened.append((sut, channel))
+        return sut, channel
+
+    yield make
+    for sut, channel in opened:
+        channel.close()
+        sut.close()
+
+def echo(sut, request):
+    send_frame(sut.conn, {"id": request["id"], "status": "success", "op": request["op"]},
+               request["params"].get("payload", "").encode())
+
+def test_request_round_trip(make_channel):
+    sut, channel = make_channel(echo)
+    response, payload = channel.request("screenshot", {"payload": "PNGDATA"})
+    assert response == {"id": 1, "status": "success", "op": "screenshot"}
+    assert payload == b"PNGDATA"
+    assert sut.requests == [{"id": 1, "op": "screenshot", "params": {"payload": "PNGDATA"}}]
+
+def test_pipelined_responses_out_of_order(make_channel):
+    held = []
+
+    def reply_in_reverse(sut, request):
+        held.append(request)
+        if len(held) == 3:
+            for pending in reversed(held):
+                send_frame(sut.conn, {"id": pending["id"], "value": pending["params"]["n"]})
+
+    _, channel = make_channel(reply_in_reverse)
+    futures = [channel.request_async("action", {"n": n}) for n in range(3)]
+    assert [future.result(2)[0]["value"] for future in futures] == [0, 1, 2]
+
+def test_events_reach_listeners(make_channel):
+    received = threading.Event()
+    events = []
+
+    def push_event(sut, request):
+        send_frame(sut.conn, {"event": "screen_changed", "data": {"hash": "ab"}})
+        echo(sut, request)
+
+    _, channel = make_channel(push_event)
+    channel.add_event_listener(lambda event, data: (events.append((event, data)), received.set()))
+    channel.request("ping")
+    assert received.wait(2)
+    assert events == [("screen_changed", {"hash": "ab"})]
+
+def test_timeout_forgets_request(make_channel):
+    _, channel = make_channel(lambda sut, request: None)
+    with pytest.raises(TimeoutError):
+        channel.request("action", {}, timeout=0.2)
+    assert channel._pending == {}
+
+def test_disconnect_fails_in_flight_requests(make_channel):
+    sut, channel = make_channel(lambda sut, request: sut.conn.close())
+    with pytest.raises(ConnectionError) as error:
+        channel.request("action", {})
+    # The request was written, so it must not look like a safe-to-resend send failure
+    assert not isinstance(error.value, ChannelSendError)
+
+def test_send_when_disconnected_raises_send_error(make_channel):
+    _, channel = make_channel(echo)
+    channel.close()
+    with pytest.raises(ChannelSendError):
+        channel.request_async("action", {})
@@ -0,0 +1,96 @@
+"""Tests for the perceptual-hash detection cache."""
+
+from modules.box_set import BoundingBox, BoxSet
+from modules.detection_cache import CachedVisionClient, DetectionCache, compute_dhash, hamming_distance
+
+from conftest import make_frame
+
+PLAY = BoundingBox(10, 20, 100, 40, 0.9, "button", "Play")
+
+class CountingClient:
+    """Vision client stub that counts its calls."""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.calls = 0
+
+    def detect_ui_elements(self, image, **kwargs):
+        self.calls += 1
+        return self.boxes
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b1011) == 0
+    assert hamming_distance(0b1011, 0b0010) == 2
+
+def test_dhash_ignores_tiny_changes():
+    frame = make_frame(color=(40, 40, 40))
+    other = make_frame(color=(41, 41, 41))
+    assert hamming_distance(compute_dhash(frame.image), compute_dhash(other.image)) == 0
+
+def test_lookup_within_distance():
+    cache = DetectionCache(max_distance=2)
+    cache.store(0b0000, [PLAY])
+    assert list(cache.lookup(0b0011)) == [PLAY]
+    assert cache.lookup(0b0111) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_lookup_respects_context():
+    cache = DetectionCache()
+    cache.store(42, [PLAY], context=(0, 0, 1.0))
+    assert cache.lookup(42, context=(100, 0, 1.0)) is None
+    assert cache.lookup(42, context=(0, 0, 1.0)) is not None
+
+def test_store_keeps_boxset():
+    cache = DetectionCache()
+    cache.store(1, [PLAY])
+    assert isinstance(cache.lookup(1), BoxSet)
+
+def test_lru_evicts_least_recently_used():
+    cache = DetectionCache(max_entries=2, max_distance=0)
+    cache.store(1, [PLAY])
+    cache.store(2, [PLAY])
+    cache.lookup(1)  # 1 is now the most recently used
+    cache.store(4, [PLAY])
+    assert cache.evictions == 1
+    assert cache.lookup(2) is None
+    assert cache.lookup(1) is not None
+    assert cache.lookup(4) is not None
+
+def test_stats():
+    cache = DetectionCache(max_distance=0)
+    cache.store(1, [PLAY], inference_seconds=2.0)
+    cache.lookup(1)
+    cache.lookup(1)
+    cache.lookup(2)
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert abs(stats["hit_rate"] - 2 / 3) < 1e-9
+    assert stats["avg_inference_seconds"] == 2.0
+    assert stats["estimated_seconds_saved"] == 4.0
+
+def test_uncounted_lookup():
+    cache = DetectionCache(max_distance=0)
+    cache.store(1, [PLAY])
+    assert cache.lookup(1, count=False) is not None
+    assert cache.lookup(2, count=False) is None
+    assert (cache.hits, cache.misses) == (0, 0)
+
+def test_cached_client_reuses_unchanged_screen(frame):
+    client = CountingClient([PLAY])
+    cached = CachedVisionClient(client)
+    cached.detect_ui_elements(frame)
+    assert list(cached.detect_ui_elements(frame)) == [PLAY]
+    assert client.calls == 1
+    assert (cached.cache.hits, cached.cache.misses) == (1, 1)
+
+def test_rejected_hit_counts_as_miss(frame):
+    client = CountingClient([PLAY])
+    cached = CachedVisionClient(client)
+    cached.detect_ui_elements(frame)
+    cached.detect_ui_elements(frame, targets=[{"type": "button", "text": "Quit", "text_match": "exact"}])
+    assert client.calls == 2
+    stats = cached.cache.get_stats()
+    assert stats["hits"] == 0
+    assert stats["misses"] == 2
+    assert stats["estimated_seconds_saved"] == 0.0
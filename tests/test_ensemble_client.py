@@ -0,0 +1,142 @@
+"""Tests for the ensemble and for cancelling the members it no longer needs."""
+
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from modules.box_set import BoundingBox
+from modules.ensemble_client import EnsembleVisionClient
+from modules.gemma_client import GemmaClient
+from modules.json_stream import read_streamed_boxes
+from modules.vision_client import VisionClient
+
+PLAY_TARGET = [{"type": "button", "text": "Play", "text_match": "exact"}]
+
+def element_chunk(index: int) -> str:
+    element = json.dumps({"box": {"x": index, "y": 1, "width": 2, "height": 3}, "type": "button",
+                          "text": f"Item {index}"})
+    content = ('{"elements": [' if index == 0 else ", ") + element
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}}]})
+
+class FakeStream:
+    """Minimal streamed response: iter_lines over prepared SSE lines, counting what was read."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.read = 0
+
+    def iter_lines(self, decode_unicode=True):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+class FastMember(VisionClient):
+    def detect_ui_elements(self, image, **kwargs):
+        return [BoundingBox(5, 5, 50, 20, 0.9, "button", "Play")]
+
+class CancellableMember(VisionClient):
+    """Generates until cancelled, like a streaming LLM client."""
+    accepts_cancel = True
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def detect_ui_elements(self, image, cancel=None, **kwargs):
+        if cancel.wait(5):
+            self.cancelled.set()
+        return []
+
+def test_cancel_stops_reading_the_stream(frame):
+    cancel = threading.Event()
+    response = FakeStream([element_chunk(index) for index in range(50)])
+
+    def accept(boxes):
+        if len(boxes) >= 3:
+            cancel.set()  # Another member won in the meantime
+        return False
+
+    boxes, _, stopped = read_streamed_boxes(response, frame, accept, cancel=cancel)
+    assert stopped
+    assert len(boxes) == 3
+    assert response.read == 4
+
+def test_first_acceptable_member_wins(frame):
+    member = CancellableMember()
+    ensemble = EnsembleVisionClient([member, FastMember()])
+    boxes = ensemble.detect_ui_elements(frame, targets=PLAY_TARGET)
+    assert boxes[0].element_text == "Play"
+    assert ensemble.wins["FastMember"] == 1
+
+def test_losing_members_are_cancelled(frame):
+    member = CancellableMember()
+    EnsembleVisionClient([member, FastMember()]).detect_ui_elements(frame, targets=PLAY_TARGET)
+    assert member.cancelled.wait(2)
+
+def test_all_members_failing_raises(frame):
+    class Broken(VisionClient):
+        def detect_ui_elements(self, image, **kwargs):
+            raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="All ensemble members failed"):
+        EnsembleVisionClient([Broken()]).detect_ui_elements(frame)
+
+@pytest.fixture
+def lm_studio():
+    """Local server streaming a long detection; records how many chunks it sent before the client hung up."""
+    state = {"chunks": 0, "done": threading.Event()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = json.dumps({"data": [{"id": GemmaClient.model_id}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for index in range(300):
+                    self.wfile.write((element_chunk(index) + "\n\n").encode())
+                    self.wfile.flush()
+                    state["chunks"] += 1
+                    time.sleep(0.01)
+            except OSError:
+                pass
+            finally:
+                state["done"].set()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+
+def test_losing_llm_stops_generating(frame, lm_studio):
+    class SlowMember(FastMember):
+        def detect_ui_elements(self, image, **kwargs):
+            time.sleep(0.3)
+            return super().detect_ui_elements(image)
+
+    gemma = GemmaClient(lm_studio["url"], cache_prompt=False)
+    EnsembleVisionClient([gemma, SlowMember()]).detect_ui_elements(frame, targets=PLAY_TARGET)
+    assert lm_studio["done"].wait(5)
+    assert lm_studio["chunks"] < 300
+
+def test_cancelled_llm_detection_is_not_sent(frame, lm_studio):
+    gemma = GemmaClient(lm_studio["url"], cache_prompt=False)
+    cancel = threading.Event()
+    cancel.set()
+    assert len(gemma.detect_ui_elements(frame, cancel=cancel)) == 0
+    assert lm_studio["chunks"] == 0
@@ -0,0 +1,107 @@
+"""Tests for the incremental element scanner and the conversion of elements to boxes."""
+
+import json
+import random
+
+import pytest
+
+from modules.json_stream import ElementStreamParser, element_to_box, extract_elements, read_streamed_boxes
+
+ELEMENTS = [
+    {"box": {"x": 10, "y": 20, "width": 100, "height": 40}, "type": "button", "text": "Play", "confidence": 0.9},
+    {"box": {"x": 200, "y": 20, "width": 80, "height": 30}, "type": "label", "text": "Video {Advanced}"},
+    {"box": {"x": 5, "y": 5, "width": 10, "height": 10}, "type": "text", "text": "Say \"hi\", [Esc]"},
+    {"box": {"x": 0, "y": 900, "width": 1920, "height": 60}, "type": "panel", "text": "",
+     "attributes": {"style": {"color": "white"}}},
+]
+
+def response_text(elements=ELEMENTS, wrapper="{}"):
+    body = json.dumps({"elements": elements})
+    return {"{}": body, "fence": "```json\n" + body + "\n```",
+            "chatty": "Here are the elements {as requested}:\n" + body + "\nDone."}[wrapper]
+
+def feed_in_chunks(text, rng):
+    parser = ElementStreamParser()
+    elements = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        elements.extend(parser.feed(text[position:position + size]))
+        position += size
+    return parser, elements
+
+@pytest.mark.parametrize("wrapper", ["{}", "fence", "chatty"])
+def test_chunked_feed_matches_whole_response(wrapper):
+    text = response_text(wrapper=wrapper)
+    for seed in range(50):
+        _, elements = feed_in_chunks(text, random.Random(seed))
+        assert elements == ELEMENTS
+
+def test_element_is_returned_once_complete():
+    text = response_text()
+    end_of_first = text.index("}", text.index('"confidence"')) + 1
+    parser = ElementStreamParser()
+    assert parser.feed(text[:end_of_first - 1]) == []
+    assert parser.feed(text[end_of_first - 1:end_of_first]) == [ELEMENTS[0]]
+
+def test_trailing_commas_are_tolerated():
+    text = '{"elements": [{"box": {"x": 1, "y": 2, "width": 3, "height": 4,}, "text": "A",}, ]}'
+    for seed in range(20):
+        _, elements = feed_in_chunks(text, random.Random(seed))
+        assert elements == [{"box": {"x": 1, "y": 2, "width": 3, "height": 4}, "text": "A"}]
+
+def test_truncated_element_keeps_complete_fields():
+    text = response_text()
+    cut = text.index('"text": "Video')
+    parser, elements = feed_in_chunks(text[:cut], random.Random(1))
+    assert elements == ELEMENTS[:1]
+    assert parser.partial_elements() == [{"box": ELEMENTS[1]["box"], "type": "label", "confidence": 0.5}]
+
+def test_extract_elements_formats():
+    assert extract_elements(response_text(wrapper="fence")) == ELEMENTS
+    assert extract_elements(json.dumps(ELEMENTS)) == ELEMENTS
+    assert extract_elements(json.dumps(ELEMENTS[0])) == [ELEMENTS[0]]
+    assert extract_elements("No elements here.") == []
+    truncated = response_text()[:-30]
+    assert [element["box"] for element in extract_elements(truncated)] == [e["box"] for e in ELEMENTS]
+
+def test_element_to_box():
+    box = element_to_box(ELEMENTS[0])
+    assert (box.x, box.y, box.width, box.height) == (10, 20, 100, 40)
+    assert (box.element_type, box.element_text, box.confidence) == ("button", "Play", 0.9)
+    assert element_to_box({"text": "no box"}) is None
+    assert element_to_box({"box": [1, 2, 3, 4]}) is None
+
+@pytest.mark.parametrize("field, value", [("x", None), ("x", "12px"), ("y", []), ("width", float("inf"))])
+def test_element_to_box_skips_invalid_coordinates(field, value):
+    element = {"box": dict(ELEMENTS[0]["box"], **{field: value}), "type": "button"}
+    assert element_to_box(element) is None
+
+def test_element_to_box_coerces_numeric_strings():
+    box = element_to_box({"box": {"x": "12.7", "y": 3.2, "width": "40", "height": 10}, "text": 5,
+                          "confidence": None})
+    assert (box.x, box.y, box.width, box.height) == (12, 3, 40, 10)
+    assert (box.element_text, box.confidence, box.element_type) == ("5", 0.8, "unknown")
+
+class FakeStream:
+    """Streamed response delivering a text as SSE content deltas."""
+
+    def __init__(self, text, chunk_size=7):
+        self.lines = ["data: " + json.dumps({"choices": [{"delta": {"content": text[i:i + chunk_size]}}]})
+                      for i in range(0, len(text), chunk_size)] + ["data: [DONE]"]
+
+    def iter_lines(self, decode_unicode=True):
+        return iter(self.lines)
+
+def test_stream_with_invalid_element_keeps_going(frame):
+    elements = [{"box": {"x": 1, "y": None, "width": 2, "height": 3}, "text": "Broken"}] + ELEMENTS
+    seen = []
+
+    def accept(boxes):
+        seen.append(len(boxes))
+        return any(box.element_text == "Play" for box in boxes)
+
+    boxes, _, stopped = read_streamed_boxes(FakeStream(response_text(elements)), frame, accept)
+    assert stopped
+    assert [box.element_text for box in boxes] == ["Play"]
+    assert seen == [1]
@@ -0,0 +1,99 @@
+"""Tests for the step runner's detection shortcuts and cleanup."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from modules.box_set import BoundingBox
+from modules.simple_automation import SimpleAutomation
+
+PLAY = {"type": "button", "text": "Play", "text_match": "exact"}
+UAC = {"description": "UAC prompt", "trigger": {"type": "button", "text": "Yes", "text_match": "exact"},
+       "action": {"type": "click", "button": "left"}}
+
+class RecordingVision:
+    """Vision model stub that records the keyword arguments of each detection."""
+    accepts_targets = True
+
+    def __init__(self, boxes=()):
+        self.boxes = list(boxes)
+        self.calls = []
+
+    def detect_ui_elements(self, image, **kwargs):
+        self.calls.append(kwargs)
+        return self.boxes
+
+def make_automation(tmp_path, vision_model=None, **config):
+    """Build a SimpleAutomation from a config dict (one wait step unless steps are given)."""
+    config.setdefault("metadata", {"game_name": "Test"})
+    config.setdefault("steps", {1: {"description": "Wait", "action": "wait"}})
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config))
+    return SimpleAutomation(str(config_path), None, None, vision_model, run_dir=str(tmp_path))
+
+def test_run_shuts_down_speculation_executor(tmp_path, monkeypatch):
+    automation = make_automation(tmp_path)
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    running = executor.submit(release.wait, 0.2)
+    queued = executor.submit(lambda: None)
+    automation._speculation_executor = executor
+
+    def fail():
+        raise RuntimeError("step failed")
+
+    monkeypatch.setattr(automation, "_run_steps", fail)
+    with pytest.raises(RuntimeError):
+        automation.run()
+    assert automation._speculation_executor is None
+    assert queued.cancelled()
+    assert running.done()
+
+def test_detection_accepts_on_step_targets_only(tmp_path, frame):
+    vision = RecordingVision()
+    automation = make_automation(tmp_path, vision, optional_steps={"uac_prompt": UAC})
+    automation._detect(frame, [PLAY])
+    assert vision.calls == [{"targets": [PLAY]}]
+
+def test_armed_optional_step_gets_full_detection(tmp_path, frame):
+    vision = RecordingVision()
+    automation = make_automation(tmp_path, vision, optional_steps={"uac_prompt": dict(UAC, steps=[2])})
+    assert not automation._optional_steps_armed(1)
+    assert automation._optional_steps_armed(2)
+    automation._detect(frame, [PLAY], full_detection=True)
+    assert vision.calls == [{}]
+
+class StoredScreen:
+    """Screen index stub that always recognises the frame."""
+
+    def __init__(self, bounding_boxes):
+        self.match = SimpleNamespace(label="main_menu", distance=3, bounding_boxes=bounding_boxes)
+
+    def lookup(self, frame):
+        return self.match
+
+PLAY_BOX = BoundingBox(100, 100, 80, 30, 0.9, "button", "Play")
+
+def test_replay_needs_only_step_targets(tmp_path, frame):
+    vision = RecordingVision()
+    automation = make_automation(tmp_path, vision, optional_steps={"uac_prompt": UAC})
+    automation.screen_index = StoredScreen([PLAY_BOX])
+    assert automation._detect(frame, [PLAY]) == [PLAY_BOX]
+    assert vision.calls == []
+
+def test_replay_without_target_runs_detection(tmp_path, frame):
+    vision = RecordingVision()
+    automation = make_automation(tmp_path, vision)
+    automation.screen_index = StoredScreen([BoundingBox(0, 0, 80, 30, 0.9, "button", "Quit")])
+    automation._detect(frame, [PLAY])
+    assert len(vision.calls) == 1
+
+def test_no_replay_when_optional_step_is_armed(tmp_path, frame):
+    vision = RecordingVision([PLAY_BOX])
+    automation = make_automation(tmp_path, vision, optional_steps={"uac_prompt": dict(UAC, steps=[1])})
+    automation.screen_index = StoredScreen([PLAY_BOX])
+    automation._detect(frame, [PLAY], full_detection=automation._optional_steps_armed(1))
+    assert vision.calls == [{}]
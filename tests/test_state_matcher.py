@@ -0,0 +1,118 @@
+"""Tests for the compiled FSM state matcher, checked against the per-state matcher it replaced."""
+
+import random
+
+import pytest
+
+from modules.box_set import BoundingBox
+from modules.frame import box_in_region, parse_region
+from modules.state_matcher import AhoCorasick, StateMatcher
+
+TEXTS = ["Play", "Play Game", "Game", "Settings", "Set", "ay G", "Quit", "Loading", "OK", ""]
+TYPES = ["button", "label", "text", "any", ""]
+MATCH_TYPES = ["exact", "contains", "startswith", "endswith"]
+REGIONS = [None, [0, 0, 960, 540], [960, 0, 960, 1080], [0, 540, 1920, 540]]
+
+def old_text_match(element_def, bbox):
+    wanted = element_def.get("text", "")
+    if bbox.element_text and wanted:
+        text, wanted = bbox.element_text.lower(), wanted.lower()
+        match_type = element_def.get("text_match", "exact")
+        if match_type == "exact":
+            return wanted == text
+        elif match_type == "contains":
+            return wanted in text
+        elif match_type == "startswith":
+            return text.startswith(wanted)
+        elif match_type == "endswith":
+            return text.endswith(wanted)
+        return False
+    return not wanted
+
+def old_type_match(element_def, bbox):
+    wanted = element_def.get("type", "any")
+    return wanted == "any" or not wanted or bbox.element_type == wanted
+
+def old_find_matching_element(state_def, bounding_boxes):
+    """DecisionEngine._find_matching_element before the StateMatcher (logging removed)."""
+    for excluded in state_def.get("exclude_elements", []):
+        region = parse_region(excluded.get("search_region"))
+        for bbox in bounding_boxes:
+            if box_in_region(bbox, region) and old_type_match(excluded, bbox) and old_text_match(excluded, bbox):
+                return None
+
+    required_elements = state_def.get("required_elements", [])
+    if not required_elements:
+        return BoundingBox(x=0, y=0, width=0, height=0, confidence=1.0, element_type="dummy",
+                           element_text="No required elements")
+
+    matching_bbox = None
+    for required in required_elements:
+        region = parse_region(required.get("search_region"))
+        min_confidence = required.get("required_confidence", 0.6)
+        for bbox in bounding_boxes:
+            if (box_in_region(bbox, region) and old_type_match(required, bbox)
+                    and old_text_match(required, bbox) and bbox.confidence >= min_confidence):
+                matching_bbox = bbox
+                break
+        else:
+            return None
+    return matching_bbox
+
+def random_element_def(rng):
+    element_def = {"type": rng.choice(TYPES), "text": rng.choice(TEXTS), "text_match": rng.choice(MATCH_TYPES)}
+    if rng.random() < 0.3:
+        element_def["required_confidence"] = rng.choice([0.3, 0.6, 0.9])
+    region = rng.choice(REGIONS)
+    if region:
+        element_def["search_region"] = region
+    return element_def
+
+def random_states(rng):
+    return {f"state_{index}": {
+        "required_elements": [random_element_def(rng) for _ in range(rng.randint(0, 3))],
+        "exclude_elements": [random_element_def(rng) for _ in range(rng.choice([0, 0, 1, 2]))]}
+        for index in range(rng.randint(1, 6))}
+
+def random_boxes(rng):
+    boxes = []
+    for _ in range(rng.randint(0, 12)):
+        text = rng.choice(TEXTS)
+        if rng.random() < 0.3:
+            text = text.upper() + rng.choice(["", " now", "!"])
+        boxes.append(BoundingBox(rng.randint(0, 1800), rng.randint(0, 1000), rng.randint(10, 200),
+                                 rng.randint(10, 80), round(rng.uniform(0.2, 1.0), 2),
+                                 rng.choice(["button", "label", "text"]), text))
+    return boxes
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_old_matcher(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        states = random_states(rng)
+        matcher = StateMatcher(states)
+        for _ in range(3):
+            boxes = random_boxes(rng)
+            results = matcher.match(boxes)
+            for name, state_def in states.items():
+                expected = old_find_matching_element(state_def, boxes)
+                assert results[name].matched == (expected is not None), (state_def, boxes)
+                if expected is not None and state_def["required_elements"]:
+                    assert results[name].element is expected
+
+def test_excluded_element_blocks_state():
+    matcher = StateMatcher({"menu": {"required_elements": [{"type": "button", "text": "Play"}],
+                                     "exclude_elements": [{"type": "any", "text": "Loading", "text_match": "contains"}]}})
+    play = BoundingBox(10, 10, 50, 20, 0.9, "button", "Play")
+    loading = BoundingBox(10, 50, 50, 20, 0.1, "label", "Loading assets")
+    assert matcher.match([play])["menu"].matched
+    result = matcher.match([play, loading])["menu"]
+    assert not result.matched
+    assert result.score == 0.0
+
+def test_aho_corasick_finds_overlapping_occurrences():
+    automaton = AhoCorasick()
+    for pattern in ["he", "she", "his", "hers"]:
+        automaton.add(pattern, pattern)
+    found = sorted((start, end, value) for start, end, value in automaton.search("ushers"))
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
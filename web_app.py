@@ -245,16 +245,19 @@ def load_config():
 def test_omniparser():
     """Test Omniparser connection - matches GUI test_omniparser_connection"""
     try:
-        import requests
+        from modules.endpoint_pool import EndpointPool
         url = request.json.get('url', 'http://localhost:8000')
-        response = requests.get(f"{url}/probe", timeout=5)
+        # Several comma-separated servers are tested as the pool the run would use
+        pool = EndpointPool(url, probe_path="/probe", probe_interval=0)
+        healthy = pool.probe_all()
+        pool.session.close()
         
-        if response.status_code == 200:
-            logger.info("Successfully connected to Omniparser server!")
-            return jsonify({'status': 'success', 'message': 'Successfully connected to Omniparser server!'})
+        if len(pool.endpoints) == 1:
+            message = 'Successfully connected to Omniparser server!'
         else:
-            logger.error(f"Failed to connect to Omniparser server: HTTP {response.status_code}")
-            return jsonify({'status': 'error', 'message': f'Failed to connect to Omniparser server: HTTP {response.status_code}'}), 400
+            message = f'Connected to {healthy} of {len(pool.endpoints)} Omniparser servers'
+        logger.info(message)
+        return jsonify({'status': 'success', 'message': message})
             
     except Exception as e:
         logger.error(f"Failed to connect to Omniparser server: {str(e)}")
@@ -420,6 +423,7 @@ def _run_simple_automation(config_parser, config, settings):
         from modules.gemma_client import GemmaClient
         from modules.qwen_client import QwenClient
         from modules.omniparser_client import OmniparserClient
+        from modules.detection_cache import CachedVisionClient
         from modules.annotator import Annotator
         from modules.simple_automation import SimpleAutomation
         from modules.game_launcher import GameLauncher
@@ -471,6 +475,9 @@ def _run_simple_automation(config_parser, config, settings):
         else:
             logger.info("Using default Gemma for UI detection")
             vision_model = GemmaClient(settings.get('lm_studio_url', 'http://127.0.0.1:1234'))
+        
+        # Skip model round-trips when the screen has not changed
+        vision_model = CachedVisionClient(vision_model)
             
         annotator = Annotator()
         game_launcher = GameLauncher(network)
@@ -486,6 +493,9 @@ def _run_simple_automation(config_parser, config, settings):
                 logger.info(f"Launching game from: {settings['game_path']}")
                 game_launcher.launch(settings['game_path'])
                 
+                # Load the vision model while the game starts instead of on the first detection
+                vision_model.warm_up_async()
+                
                 # Wait for game to initialize
                 logger.info(f"Waiting {startup_wait} seconds for game to fully initialize...")
                 wait_time = startup_wait
@@ -532,6 +542,8 @@ def _run_simple_automation(config_parser, config, settings):
             
         finally:
             # Cleanup
+            if 'screenshot_mgr' in locals():
+                screenshot_mgr.close()
             if 'network' in locals():
                 network.close()
             if 'vision_model' in locals() and hasattr(vision_model, 'close'):
@@ -553,8 +565,10 @@ def _run_state_machine_automation(config_parser, config, settings):
         from modules.gemma_client import GemmaClient
         from modules.qwen_client import QwenClient
         from modules.omniparser_client import OmniparserClient
+        from modules.detection_cache import CachedVisionClient
         from modules.annotator import Annotator
         from modules.decision_engine import DecisionEngine
+        from modules.pixel_probe import PixelProbe
         from modules.game_launcher import GameLauncher
         
         # Create timestamp for this run
@@ -604,9 +618,14 @@ def _run_state_machine_automation(config_parser, config, settings):
         else:
             logger.info("Using default Gemma for UI detection")
             vision_model = GemmaClient(settings.get('lm_studio_url', 'http://127.0.0.1:1234'))
+        
+        # Skip model round-trips when the screen has not changed
+        vision_model = CachedVisionClient(vision_model)
             
         annotator = Annotator()
         decision_engine = DecisionEngine(config)
+        pixel_probe = PixelProbe(network, screenshot_mgr)
+        pixel_checks = decision_engine.get_pixel_checks()
         game_launcher = GameLauncher(network)
         
         # Get game metadata
@@ -620,6 +639,9 @@ def _run_state_machine_automation(config_parser, config, settings):
                 logger.info(f"Launching game from: {settings['game_path']}")
                 game_launcher.launch(settings['game_path'])
                 
+                # Load the vision model while the game starts instead of on the first detection
+                vision_model.warm_up_async()
+                
                 # Wait for game to initialize
                 logger.info(f"Waiting {startup_wait} seconds for game to fully initialize...")
                 wait_time = startup_wait
@@ -643,6 +665,7 @@ def _run_state_machine_automation(config_parser, config, settings):
             
             # Main execution loop - state machine approach
             iteration = 0
+            settle_by_default = config.get("enhanced_features", {}).get("wait_for_screen_settle", False)
             current_state = "initial"
             target_state = decision_engine.get_target_state()
             
@@ -681,22 +704,25 @@ def _run_state_machine_automation(config_parser, config, settings):
                 
                 # Capture screenshot
                 screenshot_path = f"{run_dir}/screenshots/screenshot_{iteration}.png"
-                screenshot_mgr.capture(screenshot_path)
+                frame = screenshot_mgr.capture_for(screenshot_path, decision_engine.get_capture_region(current_state))
                 logger.info(f"Screenshot captured: {screenshot_path}")
                 
                 # Process with vision model
-                bounding_boxes = vision_model.detect_ui_elements(screenshot_path)
+                bounding_boxes = vision_model.detect_ui_elements(frame)
                 logger.info(f"Detected {len(bounding_boxes)} UI elements")
                 
                 # Annotate screenshot
                 annotated_path = f"{run_dir}/annotated/annotated_{iteration}.png"
-                annotator.draw_bounding_boxes(screenshot_path, bounding_boxes, annotated_path)
+                annotator.draw_bounding_boxes(frame, bounding_boxes, annotated_path)
                 logger.info(f"Annotated screenshot saved: {annotated_path}")
                 
+                # Sample the pixels behind the states' pixel_checks
+                pixel_samples = pixel_probe.sample(pixel_checks) if pixel_checks else None
+                
                 # Determine next action
                 previous_state = current_state
                 next_action, new_state = decision_engine.determine_next_action(
-                    current_state, bounding_boxes
+                    current_state, bounding_boxes, pixel_samples
                 )
                 
                 # Format the action for better logging
@@ -713,6 +739,12 @@ def _run_state_machine_automation(config_parser, config, settings):
                         
                 logger.info(f"Next action: {action_str}, transitioning to state: {new_state}")
                 
+                # Remember the screen before acting so we can wait for it to change and settle
+                planned_transition = config.get("transitions", {}).get(f"{current_state}->{new_state}", {})
+                wait_for_settle = (planned_transition.get("wait_for_settle", settle_by_default)
+                                   and bool(next_action) and next_action.get("type") != "wait")
+                reference_hash = screenshot_mgr.get_screen_hash() if wait_for_settle else None
+                
                 # Execute action
                 if next_action and not automation_state['stop_event'].is_set():
                     logger.info(f"Executing action: {action_str}")
@@ -750,7 +782,10 @@ def _run_state_machine_automation(config_parser, config, settings):
                 transition = config.get("transitions", {}).get(transition_key, {})
                 delay = transition.get("expected_delay", 1)
                 
-                time.sleep(delay)  # Wait before next iteration
+                if wait_for_settle:
+                    screenshot_mgr.wait_for_settle(delay, reference_hash)
+                else:
+                    time.sleep(delay)  # Wait before next iteration
             
             # Check if we reached the target state
             if current_state == target_state:
@@ -775,6 +810,8 @@ def _run_state_machine_automation(config_parser, config, settings):
         
         finally:
             # Cleanup
+            if 'screenshot_mgr' in locals():
+                screenshot_mgr.close()
             if 'network' in locals():
                 network.close()
             if 'vision_model' in locals() and hasattr(vision_model, 'close'):